@@ -75,8 +75,12 @@ setuptools.setup(
         'spatialprofilingtoolbox/scripts/spt-front-proximity-analysis',
         'spatialprofilingtoolbox/scripts/spt-density-analysis',
         'spatialprofilingtoolbox/scripts/spt-aggregate-cell-data',
+        'spatialprofilingtoolbox/scripts/spt-result-sink',
     ],
     install_requires=requirements,
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     project_urls = {
         'Documentation': 'https://spatialprofilingtoolbox.readthedocs.io/en/prerelease/readme.html',
         'Source code': 'https://github.com/nadeemlab/SPT'
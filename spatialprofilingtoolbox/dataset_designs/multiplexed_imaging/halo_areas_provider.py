@@ -1,8 +1,8 @@
 import re
 
-import pandas as pd
 import numpy as np
 
+from ...environment.compressed_input import read_csv
 from ...environment.log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -18,7 +18,7 @@ class HALORegionalAreasProvider:
         self.load_regional_areas(regional_areas_file)
 
     def load_regional_areas(self, file):
-        df = pd.read_csv(file)
+        df = read_csv(file)
 
         compartments = '(' + '|'.join(self.dataset_design.get_compartments()) + ')'
         whitespace = ' +'
@@ -3,6 +3,7 @@ import os
 from os.path import join
 
 import pandas as pd
+import numpy as np
 
 from .halo_areas_provider import HALORegionalAreasProvider
 from ...environment.log_formats import colorized_logger
@@ -34,6 +35,7 @@ class HALOCellMetadataDesign:
         )
         self.compartments = ['Non-Tumor', 'Tumor']
         self.areas_provider = HALORegionalAreasProvider
+        self.compiled_signatures = {}
 
     def get_FOV_column(self):
         """
@@ -45,6 +47,16 @@ class HALOCellMetadataDesign:
         """
         return 'Image Location'
 
+    @staticmethod
+    def get_compartment_column():
+        """
+        Returns:
+            str:
+                The column name for the column in the HALO-exported CSV which indicates
+                the classified region (compartment) in which the cell appears.
+        """
+        return 'Classifier Label'
+
     @staticmethod
     def get_cell_area_column():
         """
@@ -67,7 +79,12 @@ class HALOCellMetadataDesign:
         :param table: Dataframe containing a field of view descriptor column.
         :type table: pandas.DataFrame
         """
-        table[self.get_FOV_column()] = table[self.get_FOV_column()].apply(self.normalize_fov_descriptor)
+        column = table[self.get_FOV_column()]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            normalized = column.map(self.normalize_fov_descriptor).astype('category')
+        else:
+            normalized = column.apply(self.normalize_fov_descriptor)
+        table[self.get_FOV_column()] = normalized
 
     def normalize_fov_descriptor(self, fov):
         """
@@ -133,6 +150,108 @@ class HALOCellMetadataDesign:
         ymax = 'YMax'
         return [xmin, xmax, ymin, ymax]
 
+    def get_slide_offset_column_names(self):
+        """
+        Returns:
+            list:
+                [x offset, y offset]. The column names of the position of the field of
+                view of each cell in slide-global coordinates. HALO box limits are
+                relative to the field of view, so these columns, which are not part of
+                the standard HALO export, must be added to files with several fields
+                of view in order to relate cells of different fields of view.
+        """
+        return ['Slide X Offset', 'Slide Y Offset']
+
+    def get_required_columns(self, signatures, intensities=False, cell_area=False, slide_offsets=False):
+        """
+        Args:
+            signatures (list):
+                Signatures, as in ``get_pandas_signature``, which will be evaluated.
+            intensities (bool):
+                Whether to include the channel intensity columns.
+            cell_area (bool):
+                Whether to include the cell area column.
+            slide_offsets (bool):
+                Whether to include the slide offset columns (see
+                ``get_slide_offset_column_names``).
+
+        Returns:
+            list:
+                The names of the columns of the HALO-exported CSV needed to locate
+                cells, assign them to fields of view and compartments, and evaluate
+                the given signatures. Only these columns need to be parsed.
+        """
+        columns = [self.get_FOV_column(), self.get_compartment_column()]
+        columns += self.get_box_limit_column_names()
+        for signature in signatures:
+            columns += [self.get_feature_name(key) for key in signature.keys()]
+        if intensities:
+            columns += list(self.get_intensity_column_names().values())
+        if cell_area:
+            columns.append(self.get_cell_area_column())
+        if slide_offsets:
+            columns += self.get_slide_offset_column_names()
+        return list(dict.fromkeys(columns))
+
+    def get_column_dtypes(self, columns):
+        """
+        Args:
+            columns (list):
+                Column names of the HALO-exported CSV.
+
+        Returns:
+            dict:
+                Data types for those of the given columns whose type is known:
+                categorical values for the field of view and compartment, 64-bit
+                floats for the bounding box limits, which are not downcast so that cell
+                coordinates and distances keep full precision, and 32-bit floats for
+                thresholded positivity, so that a missing value does not stop the
+                parse (see ``downcast_positivity``). Suitable as the ``dtype``
+                argument of ``pandas.read_csv``.
+        """
+        dtypes = {
+            self.get_FOV_column() : 'category',
+            self.get_compartment_column() : 'category',
+        }
+        for column in self.get_box_limit_column_names():
+            dtypes[column] = 'float64'
+        for name in self.get_elementary_phenotype_names():
+            dtypes[self.get_feature_name(name)] = 'float32'
+        return {column : dtypes[column] for column in columns if column in dtypes}
+
+    def downcast_positivity(self, table, filename):
+        """
+        Converts the thresholded positivity columns of a parsed table to 8-bit
+        unsigned integers, in-place.
+
+        Args:
+            table (pandas.DataFrame):
+                Cells parsed with the types of ``get_column_dtypes``.
+            filename (str):
+                The file from which the cells were parsed, for error messages.
+
+        Raises:
+            ValueError:
+                If a positivity value is missing.
+        """
+        columns = [
+            self.get_feature_name(name) for name in self.get_elementary_phenotype_names()
+            if self.get_feature_name(name) in table.columns
+        ]
+        missing = {
+            column : int(table[column].isna().sum()) for column in columns
+            if table[column].isna().any()
+        }
+        if len(missing) > 0:
+            logger.error(
+                'Positivity values missing from %s (number of cells per column): %s',
+                filename,
+                missing,
+            )
+            raise ValueError
+        for column in columns:
+            table[column] = table[column].astype('uint8')
+
     def get_indicator_prefix(self, phenotype_name, metadata_file_column='Column header fragment prefix'):
         """
         Args:
@@ -228,14 +347,57 @@ class HALOCellMetadataDesign:
         if table is None:
             logger.error('Can not find subset of empty data; table is None.')
             return None
-        fn = self.get_feature_name
-        v = self.interpret_value_specification
-        for key in signature.keys():
-            feature_name = fn(key)
-            if not feature_name in table.columns:
-                logger.error('Key "%s" was not among feature/column names: %s', feature_name, str(table.columns))
-        pandas_signature = self.non_infix_bitwise_AND([table[fn(key)] == v(value) for key, value in signature.items()])
-        return pandas_signature
+        key = frozenset(signature.items())
+        if not key in self.compiled_signatures:
+            self.compiled_signatures[key] = self.compile_signatures({'signature' : signature})
+        evaluate = self.compiled_signatures[key]
+        return pd.Series(evaluate(table)['signature'], index=table.index)
+
+    def compile_signatures(self, signatures):
+        """
+        Resolves the column names and expected cell values for several signatures
+        once, ahead of evaluation against any number of tables.
+
+        Args:
+            signatures (dict):
+                Signatures, as in ``get_pandas_signature``, keyed by arbitrary names.
+
+        Returns:
+            function:
+                A function which takes a HALO cell metadata dataframe and returns a
+                dictionary of boolean numpy arrays, keyed like ``signatures``,
+                indicating the records in the table that express each signature. Each
+                distinct (column, value) requirement among all the signatures is
+                compared once per call, and the signatures are then evaluated together
+                as row-wise conjunctions of these comparisons.
+        """
+        requirements = {}
+        requirement_indices = {}
+        for name, signature in signatures.items():
+            indices = []
+            for key, value in signature.items():
+                requirement = (
+                    self.get_feature_name(key),
+                    self.interpret_value_specification(value),
+                )
+                if not requirement in requirements:
+                    requirements[requirement] = len(requirements)
+                indices.append(requirements[requirement])
+            requirement_indices[name] = indices
+        columns = sorted(list(set(column for column, _ in requirements)))
+
+        def evaluate(table):
+            missing = [column for column in columns if not column in table.columns]
+            if len(missing) > 0:
+                logger.error('Keys %s were not among feature/column names: %s', missing, str(table.columns))
+            satisfied = np.empty((table.shape[0], len(requirements)), dtype=bool)
+            for (column, value), index in requirements.items():
+                satisfied[:, index] = (table[column] == value).to_numpy()
+            return {
+                name : satisfied[:, indices].all(axis=1)
+                for name, indices in requirement_indices.items()
+            }
+        return evaluate
 
     def non_infix_bitwise_AND(self, args):
         """
@@ -327,14 +489,14 @@ class HALOCellMetadataDesign:
 
     def non_tumor_stromal_scope_signature(self, table, include=None):
         signature = {
-            'Classifier Label' : 'Stroma',
+            self.get_compartment_column() : 'Stroma',
         }
         if include:
             signature[include] = '+'
         s1 = self.get_pandas_signature(table, signature)
 
         signature = {
-            'Classifier Label' : 'Non-Tumor',
+            self.get_compartment_column() : 'Non-Tumor',
         }
         if include:
             signature[include] = '+'
@@ -344,7 +506,7 @@ class HALOCellMetadataDesign:
 
     def tumor_scope_signature(self, table, include=None):
         signature = {
-            'Classifier Label' : 'Tumor',
+            self.get_compartment_column() : 'Tumor',
         }
         if include:
             signature[include] = '+'
@@ -1,9 +1,18 @@
 from os.path import join, exists
 import re
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
+import numpy as np
 
 from ...environment.cell_metadata import CellMetadata
+from ...environment.cell_store import CellStore
+from ...environment.columnar_cache import ColumnarCache
+from ...environment.file_verification import FileVerificationCache
+from ...environment.pipeline_design import PipelineDesign
+from ...environment.compressed_input import read_csv
 from ...environment.log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -13,55 +22,81 @@ class SampleFOVLookup:
     """
     A wrapper around indices of sample identifier / field of view pairs. Supports
     replacing the potentially long string identifiers with integers in certain
-    contexts.
+    contexts. The indices are kept in hash maps alongside the ordered lists, so that
+    lookups take constant time.
     """
-    def __init__(self, cache_file_location: str='.fov_lookup.tsv.cache'):
+    def __init__(self):
         self.sample_ids = []
         self.fov_descriptors = {}
-        self.cache_file_location = cache_file_location
+        self.sample_indices = {}
+        self.fov_indices = {}
 
-    def is_cached(self):
-        return exists(self.cache_file_location)
-
-    def load_from_cache(self):
-        table = pd.read_csv(self.cache_file_location, sep='\t')
-        for (sample_id_index, sample_id), group in table.groupby(['Sample ID index', 'Sample ID']):
-            fov_indices = group['Field of view index']
-            if sorted(list(fov_indices)) != list(range(0, len(fov_indices))):
-                logger.warning('Field of view indices not in expected range.')
-            fovs = group.sort_values(by='Field of view index')['Field of view descriptor']
-            self.add_fovs(sample_id, list([str(fov) for fov in fovs]))
+    def load(self, data):
+        """
+        :param data: The return value of :py:meth:`export`.
+        :type data: dict
+        """
+        for sample_id, fovs in zip(data['sample ids'], data['fov descriptors']):
+            self.add_fovs(sample_id, fovs)
 
-    def write_to_cache(self):
-        rows = []
-        for sample_id_index, sample_id in enumerate(self.sample_ids):
-            fov_descriptors = self.fov_descriptors[sample_id]
-            for fov_index, fov_descriptor in enumerate(fov_descriptors):
-                rows.append((sample_id_index, sample_id, fov_index, fov_descriptor))
-        columns = [
-            'Sample ID index', 'Sample ID', 'Field of view index', 'Field of view descriptor'
-        ]
-        table = pd.DataFrame(rows, columns=columns)
-        table.to_csv(self.cache_file_location, index=False, sep='\t')
+    def export(self):
+        """
+        :return: A compact, JSON-serializable form of the lookup. The indices are the
+            positions in the lists.
+        :rtype: dict
+        """
+        return {
+            'sample ids' : list(self.sample_ids),
+            'fov descriptors' : [
+                list(self.fov_descriptors[sample_id]) for sample_id in self.sample_ids
+            ],
+        }
 
     def add_sample_id(self, sample_id):
-        if sample_id not in self.sample_ids:
+        if sample_id not in self.sample_indices:
+            self.sample_indices[sample_id] = len(self.sample_ids)
             self.sample_ids.append(sample_id)
             self.fov_descriptors[sample_id] = []
+            self.fov_indices[sample_id] = {}
 
     def add_fovs(self, sample_id, fovs):
-        if not sample_id in self.sample_ids:
-            self.add_sample_id(sample_id)
-        for fov in fovs:
-            fov = str(fov)
-            if fov not in self.fov_descriptors[sample_id]:
-                self.fov_descriptors[sample_id].append(fov)
+        """
+        :param sample_id: A sample identifier.
+        :type sample_id: str
+
+        :param fovs: Field of view descriptors, possibly repeated, e.g. a whole column
+            of a source file. New ones are indexed in order of first appearance.
+        :type fovs: list-like
+        """
+        self.add_sample_id(sample_id)
+        descriptors = self.fov_descriptors[sample_id]
+        indices = self.fov_indices[sample_id]
+        for fov in pd.unique(pd.Series(fovs, dtype=object).astype(str)):
+            if fov not in indices:
+                indices[fov] = len(descriptors)
+                descriptors.append(fov)
 
     def get_sample_index(self, sample_id):
-        return self.sample_ids.index(sample_id)
+        return self.sample_indices[sample_id]
 
     def get_fov_index(self, sample_id, fov):
-        return self.fov_descriptors[sample_id].index(fov)
+        return self.fov_indices[sample_id][fov]
+
+    def get_fov_indices(self, sample_id, fovs):
+        """
+        :param sample_id: A sample identifier.
+        :type sample_id: str
+
+        :param fovs: Field of view descriptors, e.g. a whole column of a source file.
+        :type fovs: list-like
+
+        :return: The index of each field of view. Each distinct descriptor is looked
+            up only once.
+        :rtype: numpy.ndarray
+        """
+        codes, uniques = pd.factorize(pd.Series(fovs, dtype=object).astype(str))
+        indices = self.fov_indices[sample_id]
+        return np.array([indices[fov] for fov in uniques], dtype=np.int64)[codes]
 
     def get_sample_id(self, index):
         return self.sample_ids[index]
@@ -72,15 +107,34 @@ class HALOCellMetadata(CellMetadata):
     An object to efficiently hold all cell metadata for a large bundle of source
     files in HALO-exported format.
     """
-    def __init__(self, **kwargs):
+    def __init__(self,
+        workers: int=1,
+        shards_location: str='.cell_metadata.shards',
+        **kwargs,
+    ):
+        """
+        :param workers: The number of worker processes over which to distribute the
+            parsing of source files.
+        :type workers: int
+
+        :param shards_location: The directory in which to keep the parsed cells of each
+            source file, keyed by checksum and design. See
+            :py:meth:`get_cell_info_table`.
+        :type shards_location: str
+
+        Other keyword arguments are as for :py:class:`CellMetadata`.
+        """
         super().__init__(**kwargs)
         self.lookup = SampleFOVLookup()
+        self.workers = workers
+        self.shards_location = shards_location
+        self.cell_manifest_rows = None
 
-    def load_lookup(self):
-        self.lookup.load_from_cache()
+    def export_lookup(self):
+        return self.lookup.export()
 
-    def write_lookup(self):
-        self.lookup.write_to_cache()
+    def import_lookup(self, data):
+        self.lookup.load(data)
 
     def get_sample_id_index(self, sample_id):
         return self.lookup.get_sample_index(sample_id)
@@ -88,46 +142,181 @@ class HALOCellMetadata(CellMetadata):
     def get_fov_index(self, sample_id, fov):
         return self.lookup.get_fov_index(sample_id, fov)
 
+    def get_cell_manifest_rows(self, file_metadata, dataset_design):
+        """
+        :param file_metadata: Table of file metadata.
+        :type file_metadata: pandas.DataFrame
+
+        :return: The (file name, sample identifier, checksum) triples for the cell
+            manifest files, in order. The checksum is the SHA256 checksum recorded in
+            the file metadata, or else the one recorded for the file at job generation
+            (see :py:class:`FileVerificationCache`), or else computed from the file
+            contents. The rows are computed once.
+        :rtype: list
+        """
+        if self.cell_manifest_rows is not None:
+            return self.cell_manifest_rows
+        pipeline_database_uri = PipelineDesign().get_database_uri()
+        verification = None
+        if exists(pipeline_database_uri):
+            verification = FileVerificationCache(pipeline_database_uri)
+        rows = []
+        for _, row in file_metadata.iterrows():
+            if not row['Data type'] == dataset_design.get_cell_manifest_descriptor():
+                continue
+            checksum = row['Checksum'] if 'Checksum' in file_metadata.columns else None
+            if not isinstance(checksum, str) or checksum == '':
+                filename = join(self.input_files_path, row['File name'])
+                if verification is not None:
+                    checksum = verification.get_sha256(filename)
+                else:
+                    checksum = ColumnarCache.compute_sha256(filename)
+            rows.append((row['File name'], row['Sample ID'], checksum))
+        self.cell_manifest_rows = rows
+        return rows
+
+    def get_design_key(self):
+        """
+        :return: The SHA256 checksum of the parts of the dataset design which
+            determine the parsed cells: the elementary phenotypes, and the source
+            columns selected.
+        :rtype: str
+        """
+        d = self.dataset_design
+        phenotype_names = d.get_elementary_phenotype_names()
+        design = {
+            'elementary phenotypes' : d.elementary_phenotypes.to_csv(index=False),
+            'columns' : [d.get_FOV_column()]
+                + [d.get_feature_name(name) for name in phenotype_names]
+                + sorted(d.get_intensity_column_names().values()),
+        }
+        return hashlib.sha256(json.dumps(design, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get_shard_key(self, checksum):
+        """
+        :param checksum: The SHA256 checksum of a source file.
+        :type checksum: str
+
+        :return: The name of the shard of the source file, which changes if either the
+            file or the design (see :py:meth:`get_design_key`) changes.
+        :rtype: str
+        """
+        return checksum + '-' + self.get_design_key()[0:16]
+
+    def get_source_key(self):
+        if not self.check_data_type(self.file_metadata, self.dataset_design):
+            return None
+        return {
+            'design' : self.get_design_key(),
+            'files' : [
+                [str(sample_id), str(checksum)]
+                for _, sample_id, checksum in self.get_cell_manifest_rows(
+                    self.file_metadata,
+                    self.dataset_design,
+                )
+            ],
+        }
+
     def get_cell_info_table(self, input_files_path, file_metadata, dataset_design):
+        """
+        Each source file is parsed into a shard (a :py:class:`CellStore`) named by its
+        checksum and the design (see :py:meth:`get_shard_key`), unless such a shard
+        already exists. Missing shards are created in
+        parallel. The shards are then assembled in file metadata order, assigning the
+        sample and field of view indices.
+
+        See :py:meth:`CellMetadata.get_cell_info_table`.
+        """
         if not self.check_data_type(file_metadata, dataset_design):
             return
-        dfs = []
-        for i, row in file_metadata.iterrows():
-            data_type = row['Data type']
-            if not data_type == dataset_design.get_cell_manifest_descriptor():
-                continue
-            filename = row['File name']
-            sample_id = row['Sample ID']
-            source_file_data = pd.read_csv(join(input_files_path, filename))
-            if dataset_design.get_FOV_column() not in source_file_data.columns:
-                logger.error(
-                    '%s not in columns of %s. Got %s',
-                    dataset_design.get_FOV_column(),
-                    filename,
-                    source_file_data.columns,
-                )
-                break
-            self.populate_integer_indices(
-                lookup=self.lookup,
-                sample_id=sample_id,
-                fovs=source_file_data[dataset_design.get_FOV_column()],
-            )
+        rows = self.get_cell_manifest_rows(file_metadata, dataset_design)
+        missing = {}
+        for filename, sample_id, checksum in rows:
+            if not CellStore(join(self.shards_location, self.get_shard_key(checksum))).exists():
+                missing[self.get_shard_key(checksum)] = (filename, sample_id)
+        logger.info(
+            'Parsing %s of %s source files; the rest are already parsed.',
+            len(missing),
+            len(rows),
+        )
+        arguments = [
+            [join(input_files_path, filename) for filename, _ in missing.values()],
+            [sample_id for _, sample_id in missing.values()],
+            [join(self.shards_location, shard_key) for shard_key in missing],
+        ]
+        if self.workers > 1 and len(missing) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(self.create_shard, *arguments))
+        else:
+            list(map(self.create_shard, *arguments))
 
-            column_data, number_cells = self.get_selected_columns(
-                dataset_design,
-                self.lookup,
-                source_file_data,
-                sample_id,
-            )
-            dfs.append(pd.DataFrame(column_data))
+        self.lookup = SampleFOVLookup()
+        c = CellMetadata.table_header_constant_portion
+        dfs = []
+        for i, (filename, sample_id, checksum) in enumerate(rows):
+            shard = CellStore(join(self.shards_location, self.get_shard_key(checksum)))
+            shard.open()
+            fovs = shard.get_lookup()['fov descriptors'][0]
+            self.populate_integer_indices(lookup=self.lookup, sample_id=sample_id, fovs=fovs)
+            fov_indices = self.lookup.get_fov_indices(sample_id, fovs)
+            table = shard.get_table()
+            table[c['Sample ID index column name']] = self.lookup.get_sample_index(sample_id)
+            table[c['Field of view index column name']] = fov_indices[
+                table[c['Field of view index column name']].to_numpy()
+            ]
+            dfs.append(table)
             logger.debug(
                 'Finished pulling metadata for %s cells from source file %s/%s.',
-                number_cells,
+                table.shape[0],
                 i+1,
-                file_metadata.shape[0],
+                len(rows),
             )
         return pd.concat(dfs)
 
+    def create_shard(self, filename, sample_id, shard_location):
+        """
+        Parses one source file and saves the selected columns as a cell store, with
+        field of view indices local to the file.
+
+        :param filename: The source file.
+        :type filename: str
+
+        :param sample_id: The sample identifier of the source file.
+        :type sample_id: str
+
+        :param shard_location: The directory of the shard.
+        :type shard_location: str
+        """
+        dataset_design = self.dataset_design
+        source_file_data = read_csv(filename)
+        if dataset_design.get_FOV_column() not in source_file_data.columns:
+            logger.error(
+                '%s not in columns of %s. Got %s',
+                dataset_design.get_FOV_column(),
+                filename,
+                source_file_data.columns,
+            )
+            raise ValueError
+        lookup = SampleFOVLookup()
+        self.populate_integer_indices(
+            lookup=lookup,
+            sample_id=sample_id,
+            fovs=source_file_data[dataset_design.get_FOV_column()],
+        )
+        column_data, number_cells = self.get_selected_columns(
+            dataset_design,
+            lookup,
+            source_file_data,
+            sample_id,
+        )
+        table = CellMetadata.sort_cells(pd.DataFrame(column_data))
+        CellStore(shard_location).write(
+            table,
+            CellMetadata.get_offsets(table),
+            lookup=lookup.export(),
+        )
+        logger.debug('Parsed %s cells from %s.', number_cells, filename)
+
     def check_data_type(self, file_metadata, dataset_design):
         """
         :param file_metadata: Table of cell manifest files.
@@ -203,11 +392,8 @@ class HALOCellMetadata(CellMetadata):
 
         sample_id_index = lookup.get_sample_index(sample_id)
         number_cells = source_file_data.shape[0]
-        sample_id_indices = [sample_id_index] * number_cells
-        fov_indices = list(source_file_data.apply(
-            lambda row: lookup.get_fov_index(sample_id, row[d.get_FOV_column()]),
-            axis=1,
-        ))
+        sample_id_indices = np.full(number_cells, sample_id_index, dtype=np.int64)
+        fov_indices = lookup.get_fov_indices(sample_id, source_file_data[d.get_FOV_column()])
         column_data[c['Sample ID index column name']] = sample_id_indices
         column_data[c['Field of view index column name']] = fov_indices
 
@@ -246,10 +432,117 @@ class HALOCellMetadata(CellMetadata):
         }
         return outcomes_dict
 
+    def iterate_chunks(self, omit_column: str=None):
+        """
+        Walks the cell store once, one field of view at a time.
+
+        :param omit_column: See :py:meth:`write_subsampled`.
+        :type omit_column: str
+
+        :return: Pairs (sample index, table of cells), without the field of view index
+            column, and filtered as described for :py:meth:`write_subsampled`.
+        :rtype: generator
+        """
+        c = CellMetadata.table_header_constant_portion
+        for (sample_index, _), (start, stop) in sorted(self.offsets.items()):
+            chunk = self.store.get_rows(start, stop)
+            chunk = chunk.drop(columns=[
+                c['Sample ID index column name'],
+                c['Field of view index column name'],
+            ])
+            if omit_column:
+                chunk = chunk.drop(columns=[omit_column + '+'])
+                dichotomized = HALOCellMetadata.get_dichotomized_columns(chunk)
+                chunk = chunk[~(chunk[dichotomized] == 0).all(axis=1)]
+            yield sample_index, chunk
+
+    @staticmethod
+    def update_reservoir(reservoir, number_seen, chunk, max_per_sample, rng):
+        """
+        Updates a reservoir sample, with replacement, of the rows seen so far. Each of
+        the ``max_per_sample`` slots is an independent size-1 reservoir, so that after
+        all rows are seen each slot holds a uniformly random row.
+
+        :param reservoir: The column values of the slots, keyed by column name, or None
+            if no rows have been seen yet.
+        :type reservoir: dict
+
+        :param number_seen: The number of rows seen before this chunk.
+        :type number_seen: int
+
+        :param chunk: The new rows.
+        :type chunk: pandas.DataFrame
+
+        :param max_per_sample: The number of slots.
+        :type max_per_sample: int
+
+        :param rng: The random number generator.
+        :type rng: numpy.random.Generator
+
+        :return: The updated reservoir.
+        :rtype: dict
+        """
+        size = chunk.shape[0]
+        picks = rng.integers(size, size=max_per_sample)
+        if reservoir is None:
+            return {column : chunk[column].to_numpy()[picks] for column in chunk.columns}
+        replace = rng.random(max_per_sample) < size / (number_seen + size)
+        for column in chunk.columns:
+            reservoir[column][replace] = chunk[column].to_numpy()[picks[replace]]
+        return reservoir
+
+    def get_subsampled(self, max_per_sample, omit_column=None, seed=None):
+        """
+        :param max_per_sample: See :py:meth:`write_subsampled`.
+        :type max_per_sample: int
+
+        :param omit_column: See :py:meth:`write_subsampled`.
+        :type omit_column: str
+
+        :param seed: See :py:meth:`write_subsampled`.
+        :type seed: int
+
+        :return: The cells drawn (with replacement) from each sample, ordered by
+            sample, with a "Sample ID" column. Memory use is bounded by the size of the
+            reservoirs and of the largest field of view.
+        :rtype: pandas.DataFrame
+        """
+        rng = np.random.default_rng(seed)
+        reservoirs = {}
+        numbers_seen = {}
+        columns = None
+        for sample_index, chunk in self.iterate_chunks(omit_column=omit_column):
+            columns = list(chunk.columns)
+            if chunk.shape[0] == 0:
+                continue
+            reservoirs[sample_index] = HALOCellMetadata.update_reservoir(
+                reservoirs.get(sample_index),
+                numbers_seen.get(sample_index, 0),
+                chunk,
+                max_per_sample,
+                rng,
+            )
+            numbers_seen[sample_index] = numbers_seen.get(sample_index, 0) + chunk.shape[0]
+        if len(reservoirs) == 0:
+            logger.warning('No cells to subsample.')
+            subsampled = pd.DataFrame(columns=columns)
+        else:
+            subsampled = pd.concat([
+                pd.DataFrame(reservoirs[sample_index], columns=columns)
+                for sample_index in sorted(reservoirs)
+            ], ignore_index=True)
+        subsampled['Sample ID'] = [
+            self.lookup.get_sample_id(sample_index)
+            for sample_index in sorted(reservoirs)
+            for _ in range(max_per_sample)
+        ]
+        return subsampled
+
     def write_subsampled(self,
             max_per_sample: int=100,
             outcomes_file: str=None,
             omit_column: str=None,
+            seed: int=None,
         ):
         """
         Writes subsampled version of the cells table:
@@ -274,24 +567,15 @@ class HALOCellMetadata(CellMetadata):
             column, i.e. if this column is the only one making the row non-trivial,
             then this row will also be omitted. This amounts to a filtering operation.
         :type omit_column: str
-        """
-        cells = self.get_cells_table().copy(deep=True)
-        cells.drop(columns=['Field of view index'], inplace=True)
 
-        if omit_column:
-            cells.drop(columns=[omit_column + '+'], inplace=True)
-            trivial_rows = [
-                index for index, row in cells.iterrows()
-                if all([row[c]==0 for c in HALOCellMetadata.get_dichotomized_columns(cells)])
-            ]
-            cells.drop(index=trivial_rows, inplace=True)
+        :param seed: (Optional) A seed for the random number generator, for
+            reproducible subsamples.
+        :type seed: int
 
-        subsampled = cells.groupby('Sample ID index').sample(n=max_per_sample, replace=True)
-        subsampled['Sample ID'] = [
-            self.lookup.get_sample_id(index)
-            for index in list(subsampled['Sample ID index'])
-        ]
-        subsampled.drop(columns=['Sample ID index'], inplace=True)
+        The cells are drawn in one pass over the cell store (see
+        :py:meth:`get_subsampled`), without reading the whole cells table into memory.
+        """
+        subsampled = self.get_subsampled(max_per_sample, omit_column=omit_column, seed=seed)
 
         basename = ''.join([
             'cell_metadata_',
@@ -301,19 +585,17 @@ class HALOCellMetadata(CellMetadata):
         dichotomized = subsampled[
             ['Sample ID'] + HALOCellMetadata.get_dichotomized_columns(subsampled)
         ]
-        old_columns = dichotomized.columns
-        dichotomized.rename(columns={
-            column : re.sub(r'\+$', '', column) for column in old_columns
-        }, inplace=True)
+        dichotomized = dichotomized.rename(columns={
+            column : re.sub(r'\+$', '', column) for column in dichotomized.columns
+        })
         dichotomized.to_csv(basename + '_dichotomized.tsv', sep='\t', index=False)
 
         intensities= subsampled[
             ['Sample ID'] + HALOCellMetadata.get_intensity_columns(subsampled)
         ]
-        old_columns = intensities.columns
-        intensities.rename(columns={
-            column : re.sub(' intensity$', '', column) for column in old_columns
-        }, inplace=True)
+        intensities = intensities.rename(columns={
+            column : re.sub(' intensity$', '', column) for column in intensities.columns
+        })
         intensities.to_csv(basename + '_intensities.tsv', sep='\t', index=False)
 
         if outcomes_file:
@@ -0,0 +1,132 @@
+"""
+A compact representation of many boolean per-cell features.
+"""
+import numpy as np
+
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class PackedBitMatrix:
+    """
+    A matrix of boolean features of cells, with one row per feature. Each row is
+    stored with the cells packed 64 to a word (numpy uint64), 1 bit per cell rather
+    than the 1 byte per cell of a boolean array or Series. Combinations of features
+    are evaluated with bitwise AND and AND NOT over whole words.
+    """
+    bits_per_word = 64
+
+    def __init__(self, feature_names, number_cells):
+        """
+        :param feature_names: Keys for the rows (features). Any hashable values.
+        :type feature_names: list
+
+        :param number_cells: The number of cells (bits per row).
+        :type number_cells: int
+        """
+        self.number_cells = number_cells
+        self.number_words = -(-number_cells // PackedBitMatrix.bits_per_word)
+        self.rows = {name : i for i, name in enumerate(feature_names)}
+        if len(self.rows) != len(feature_names):
+            logger.error('Duplicate feature names among: %s', feature_names)
+            raise ValueError
+        self.words = np.zeros((len(self.rows), self.number_words), dtype=np.uint64)
+        self.valid = self.pack(np.ones(number_cells, dtype=bool))
+
+    def pack(self, mask):
+        """
+        :param mask: One boolean value per cell.
+        :type mask: array-like
+
+        :return: The packed words, with cell i in bit (i mod 64) of word (i // 64).
+            Bits beyond the last cell are 0.
+        :rtype: numpy.ndarray
+        """
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (self.number_cells,):
+            logger.error('Expected %s mask values, got %s.', self.number_cells, mask.shape)
+            raise ValueError
+        packed = np.packbits(mask, bitorder='little')
+        padded = np.zeros(self.number_words * 8, dtype=np.uint8)
+        padded[0:len(packed)] = packed
+        return padded.view(np.uint64)
+
+    def set_feature(self, name, mask):
+        """
+        :param name: The feature key.
+
+        :param mask: One boolean value per cell.
+        :type mask: array-like
+        """
+        self.words[self.rows[name]] = self.pack(mask)
+
+    def set_feature_words(self, name, words):
+        """
+        :param name: The feature key.
+
+        :param words: Packed words, e.g. the return value of :py:meth:`combine`.
+        :type words: numpy.ndarray
+        """
+        self.words[self.rows[name]] = words
+
+    def get_feature_words(self, name):
+        """
+        :param name: The feature key.
+
+        :return: The packed words for this feature (a view, not a copy).
+        :rtype: numpy.ndarray
+        """
+        return self.words[self.rows[name]]
+
+    def combine(self, positives, negatives=()):
+        """
+        :param positives: Keys of features which must all be present.
+        :type positives: list
+
+        :param negatives: Keys of features which must all be absent.
+        :type negatives: list
+
+        :return: Packed words for the cells with all the positive features and none of
+            the negative ones.
+        :rtype: numpy.ndarray
+        """
+        accumulator = self.valid.copy()
+        for name in positives:
+            np.bitwise_and(accumulator, self.words[self.rows[name]], out=accumulator)
+        for name in negatives:
+            np.bitwise_and(accumulator, ~self.words[self.rows[name]], out=accumulator)
+        return accumulator
+
+    def get_mask(self, name, start=0, stop=None):
+        """
+        :param name: The feature key.
+
+        :param start: The first cell of the range to unpack.
+        :type start: int
+
+        :param stop: One past the last cell of the range to unpack. Defaults to the
+            number of cells.
+        :type stop: int
+
+        :return: The boolean values of the feature for cells in the given range. Only
+            the words covering the range are unpacked.
+        :rtype: numpy.ndarray
+        """
+        if stop is None:
+            stop = self.number_cells
+        first_word = start // PackedBitMatrix.bits_per_word
+        last_word = -(-stop // PackedBitMatrix.bits_per_word)
+        offset = start - first_word * PackedBitMatrix.bits_per_word
+        words = self.words[self.rows[name], first_word:last_word]
+        bits = np.unpackbits(words.view(np.uint8), bitorder='little')
+        return bits[offset:offset + stop - start].astype(bool)
+
+    def count(self, name):
+        """
+        :param name: The feature key.
+
+        :return: The number of cells with the feature.
+        :rtype: int
+        """
+        return int(np.unpackbits(self.words[self.rows[name]].view(np.uint8)).sum())
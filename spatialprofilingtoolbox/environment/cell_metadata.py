@@ -1,8 +1,7 @@
-import os
-from os.path import exists
-
 import pandas as pd
+import numpy as np
 
+from .cell_store import CellStore
 from .log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -22,14 +21,14 @@ class CellMetadata:
         'positivity column name' : '{{channel specifier}}+',
         'intensity column name' : '{{channel specifier}} intensity',
     }
-    default_cache_location = '.cell_metadata.tsv.cache'
+    default_cache_location = '.cell_metadata.store'
 
     def __init__(
             self,
             dataset_design=None,
             file_manifest_file: str=None,
             input_files_path: str=None,
-            cache_location: str='.cell_metadata.tsv.cache',
+            cache_location: str='.cell_metadata.store',
         ):
         """
         :param dataset_design:
@@ -45,8 +44,8 @@ class CellMetadata:
             described the file manifest.
         :type input_file_path: str
 
-        :param cache_location: (Optional) An alternative file location to cache the
-            cell-related tables.
+        :param cache_location: (Optional) An alternative directory location for the
+            cell store (see :py:class:`CellStore`).
         :type cache_location: str
         """
         self.input_files_path = input_files_path
@@ -54,16 +53,20 @@ class CellMetadata:
         self.cache_location = cache_location
         self.file_manifest_file = file_manifest_file
         self.file_metadata = pd.read_csv(file_manifest_file, sep='\t')
-        self.cells = pd.DataFrame()
+        self.store = None
+        self.cells = None
+        self.offsets = {}
 
     def initialize(self):
         """
-        Pulls in cell metadata table from cache, or creates the cache if it does not yet
-        exist.
+        Opens the cell store, or creates it if it does not yet exist. Cell data is read
+        lazily, as needed.
 
         Typically this should be called right after ``__init__``.
         """
-        self.cells = self.load_cache_file()
+        self.store = self.load_cache_file()
+        self.offsets = self.store.get_offsets()
+        self.import_lookup(self.store.get_lookup())
 
     def get_cell_info_table(self, input_files_path, file_metadata, dataset_design):
         """
@@ -105,35 +108,114 @@ class CellMetadata:
         """
         pass
 
+    def get_source_key(self):
+        """
+        :return: A JSON-serializable description of the input files, e.g. their
+            checksums, and of the parts of the dataset design used to parse them. The
+            cell store is recreated whenever this changes.
+        :rtype: dict
+        """
+        pass
+
+    def export_lookup(self):
+        """
+        :return: A JSON-serializable description of the sample / field of view indices,
+            to be saved with the cell store.
+        :rtype: dict
+        """
+        pass
+
+    def import_lookup(self, data):
+        """
+        :param data: The return value of :py:meth:`export_lookup`, as saved with the
+            cell store.
+        :type data: dict
+        """
+        pass
+
     def get_cells_table(self):
+        """
+        :return: The whole table of cell metadata, read from the cell store on first
+            call.
+        :rtype: pandas.DataFrame
+        """
+        if self.cells is None:
+            self.cells = self.store.get_table()
         return self.cells
 
     def load_cache_file(self):
         """
-        If not yet cached, creates table of cells from source files listed in the given
-        file manifest, then caches this to file.
+        If not yet cached, or if the input files have changed since it was cached (see
+        :py:meth:`get_source_key`), creates table of cells from source files listed in
+        the given file manifest, then saves this to the cell store.
 
-        Otherwise, loads directly from the cache file.
+        :return: The opened cell store.
+        :rtype: CellStore
+        """
+        store = CellStore(self.cache_location)
+        source = self.get_source_key()
+        if store.exists():
+            store.open()
+            if store.get_source() == source:
+                logger.info('Retrieving cached cell info.')
+                return store
+            logger.info('Input files have changed since the cell store was written.')
+        logger.info('Gathering cell info from files listed in %s', self.file_manifest_file)
+        table = self.get_cell_info_table(
+            self.input_files_path,
+            self.file_metadata,
+            self.dataset_design,
+        )
+        logger.info('Finished gathering info %s cells.', table.shape[0])
+        table = CellMetadata.sort_cells(table)
+        store.write(
+            table,
+            CellMetadata.get_offsets(table),
+            lookup=self.export_lookup(),
+            source=source,
+        )
+        store.open()
+        return store
+
+    @staticmethod
+    def sort_cells(table):
+        """
+        :param table: The table of cell metadata.
+        :type table: pandas.DataFrame
 
-        :return: The table of cell metadata. The format should be as described by
-            :py:meth:`get_metadata`.
+        :return: The table stably sorted by sample index and then field of view index,
+            so that the cells of each field of view are a contiguous range of rows.
         :rtype: pandas.DataFrame
         """
-        if not exists(self.cache_location):
-            logger.info('Gathering cell info from files listed in %s', self.file_manifest_file)
-            table = self.get_cell_info_table(
-                self.input_files_path,
-                self.file_metadata,
-                self.dataset_design,
-            )
-            logger.info('Finished gathering info %s cells.', table.shape[0])
-            table.to_csv(self.cache_location, sep='\t', index=False)
-            self.write_lookup()
-        else:
-            logger.info('Retrieving cached cell info.')
-            table = pd.read_csv(self.cache_location, sep='\t')
-            self.load_lookup()
-        return table
+        c = CellMetadata.table_header_constant_portion
+        return table.sort_values(
+            [c['Sample ID index column name'], c['Field of view index column name']],
+            kind='mergesort',
+            ignore_index=True,
+        )
+
+    @staticmethod
+    def get_offsets(table):
+        """
+        :param table: The table of cell metadata, sorted by :py:meth:`sort_cells`.
+        :type table: pandas.DataFrame
+
+        :return: The (start, stop) range of rows of each field of view, keyed by the
+            pair (sample index, field of view index).
+        :rtype: dict
+        """
+        if table is None or table.shape[0] == 0:
+            return {}
+        c = CellMetadata.table_header_constant_portion
+        samples = table[c['Sample ID index column name']].to_numpy()
+        fovs = table[c['Field of view index column name']].to_numpy()
+        changes = np.flatnonzero((np.diff(samples) != 0) | (np.diff(fovs) != 0)) + 1
+        starts = np.concatenate([[0], changes])
+        stops = np.concatenate([changes, [table.shape[0]]])
+        return {
+            (int(samples[start]), int(fovs[start])) : (int(start), int(stop))
+            for start, stop in zip(starts, stops)
+        }
 
     def get_metadata(self, sample_id, fov):
         """
@@ -145,12 +227,12 @@ class CellMetadata:
 
         :return: A table containing metadata about all the cells in the given field of
             view. The format is specified by instantiating the table_header_template
-            once for each phenotype/channel described by the given dataset_design.
+            once for each phenotype/channel described by the given dataset_design. The
+            rows are found by offset lookup, and only these rows are read from the cell
+            store. They are indexed by their positions in the whole cells table.
         :rtype: pandas.DataFrame
         """
-        c = self.cells
         sample_id_index = self.get_sample_id_index(sample_id)
         fov_index = self.get_fov_index(sample_id, fov)
-        sample_col = CellMetadata.table_header_constant_portion['Sample ID index column name']
-        fov_col = CellMetadata.table_header_constant_portion['Field of view index column name']
-        return c[(c[sample_col] == sample_id_index) & (c[fov_col] == fov_index)]
+        start, stop = self.offsets.get((sample_id_index, fov_index), (0, 0))
+        return self.store.get_rows(start, stop)
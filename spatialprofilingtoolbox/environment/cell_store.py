@@ -0,0 +1,198 @@
+"""
+A binary, memory-mapped store for the cell metadata of a whole cohort.
+"""
+import os
+from os.path import join, exists
+import json
+import shutil
+
+import pandas as pd
+import numpy as np
+
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class CellStore:
+    """
+    The cells table is saved as one fixed-width ``.npy`` file per column, in a
+    directory, together with a side index of the row offsets of each (sample index,
+    field of view index) pair and a JSON manifest. The manifest also holds a
+    compact, JSON-serializable form of the sample / field of view lookup.
+
+    Opening the store reads only the manifest and the side index. Columns are memory
+    mapped on first access, so that the cells of one field of view can be retrieved
+    without reading the rest of the cohort.
+
+    The whole directory is first written under a temporary name and then renamed
+    into place, so that concurrent readers never see a partially written store. An
+    existing store at the same location is replaced.
+    """
+    manifest_filename = 'manifest.json'
+    offsets_filename = 'offsets.npy'
+
+    def __init__(self, location: str='.cell_metadata.store'):
+        """
+        :param location: The directory of the store.
+        :type location: str
+        """
+        self.location = location
+        self.manifest = None
+        self.offsets = None
+        self.columns = {}
+
+    def exists(self):
+        """
+        :return: Whether the store has been completely written.
+        :rtype: bool
+        """
+        return exists(join(self.location, CellStore.manifest_filename))
+
+    def write(self, table, offsets, lookup=None, source=None):
+        """
+        :param table: The cells table, sorted so that each field of view is a
+            contiguous range of rows. All columns must have fixed-width (numeric or
+            boolean) data types.
+        :type table: pandas.DataFrame
+
+        :param offsets: The (start, stop) range of rows of each field of view, keyed by
+            the pair (sample index, field of view index).
+        :type offsets: dict
+
+        :param lookup: A JSON-serializable description of the sample / field of view
+            indices.
+        :type lookup: dict
+
+        :param source: A JSON-serializable description of the input files from which
+            the table was created, used to decide whether the store is up to date.
+        :type source: dict
+        """
+        variable_width = [column for column in table.columns if table[column].dtype == object]
+        if len(variable_width) > 0:
+            logger.error('Columns %s do not have a fixed-width data type.', variable_width)
+            raise ValueError
+        temporary = self.location + '.' + str(os.getpid()) + '.tmp'
+        os.makedirs(temporary, exist_ok=True)
+        columns = []
+        for i, column in enumerate(table.columns):
+            filename = 'column_' + str(i) + '.npy'
+            np.save(join(temporary, filename), table[column].to_numpy())
+            columns.append({
+                'name' : column,
+                'file' : filename,
+                'dtype' : table[column].dtype.name,
+            })
+        index = np.array(
+            [[sample, fov, start, stop] for (sample, fov), (start, stop) in offsets.items()],
+            dtype=np.int64,
+        ).reshape((-1, 4))
+        np.save(join(temporary, CellStore.offsets_filename), index)
+        manifest = {
+            'number cells' : int(table.shape[0]),
+            'columns' : columns,
+            'lookup' : lookup,
+            'source' : source,
+        }
+        with open(join(temporary, CellStore.manifest_filename), 'wt') as file:
+            json.dump(manifest, file)
+        previous = None
+        if exists(self.location):
+            previous = self.location + '.' + str(os.getpid()) + '.old'
+            os.rename(self.location, previous)
+        try:
+            os.rename(temporary, self.location)
+        except OSError:
+            logger.debug('Cell store %s was written concurrently; discarding this copy.', self.location)
+            shutil.rmtree(temporary, ignore_errors=True)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    def open(self):
+        """
+        Reads the manifest and the side index of offsets. Column data is not read.
+        """
+        with open(join(self.location, CellStore.manifest_filename), 'rt') as file:
+            self.manifest = json.load(file)
+        index = np.load(join(self.location, CellStore.offsets_filename))
+        self.offsets = {
+            (int(sample), int(fov)) : (int(start), int(stop))
+            for sample, fov, start, stop in index
+        }
+        self.columns = {}
+
+    def get_offsets(self):
+        """
+        :return: The (start, stop) range of rows of each field of view, keyed by the
+            pair (sample index, field of view index).
+        :rtype: dict
+        """
+        return self.offsets
+
+    def get_lookup(self):
+        """
+        :return: The description of the sample / field of view indices, as written.
+        :rtype: dict
+        """
+        return self.manifest['lookup']
+
+    def get_source(self):
+        """
+        :return: The description of the input files, as written.
+        :rtype: dict
+        """
+        return self.manifest.get('source')
+
+    def get_number_cells(self):
+        """
+        :return: The number of cells.
+        :rtype: int
+        """
+        return self.manifest['number cells']
+
+    def get_column_names(self):
+        """
+        :return: The column names, in order.
+        :rtype: list
+        """
+        return [column['name'] for column in self.manifest['columns']]
+
+    def get_column(self, name):
+        """
+        :param name: A column name.
+        :type name: str
+
+        :return: The column values, memory mapped (read-only).
+        :rtype: numpy.ndarray
+        """
+        if not name in self.columns:
+            filename = [
+                column['file'] for column in self.manifest['columns'] if column['name'] == name
+            ][0]
+            self.columns[name] = np.load(join(self.location, filename), mmap_mode='r')
+        return self.columns[name]
+
+    def get_rows(self, start, stop):
+        """
+        :param start: The first row.
+        :type start: int
+
+        :param stop: One past the last row.
+        :type stop: int
+
+        :return: The rows in the given range, indexed by their positions in the whole
+            table. Only these rows are read.
+        :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame(
+            {name : self.get_column(name)[start:stop] for name in self.get_column_names()},
+            columns=self.get_column_names(),
+            index=pd.RangeIndex(start, stop),
+        )
+
+    def get_table(self):
+        """
+        :return: The whole cells table, read into memory.
+        :rtype: pandas.DataFrame
+        """
+        return self.get_rows(0, self.get_number_cells())
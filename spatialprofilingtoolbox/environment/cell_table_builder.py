@@ -0,0 +1,340 @@
+"""
+A shared, columnar representation of the cells of one input file, for use by the
+workflow cores.
+"""
+import numpy as np
+
+from .columnar_cache import ColumnarCache
+from .chunked_reader import FOVChunkReader
+from .fov_indexing import FOVIndexing
+from .bit_matrix import PackedBitMatrix
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class CellTable:
+    """
+    The cells of one input file, as a struct of arrays. The cells are sorted by
+    field of view, so that the cells of each field of view are a contiguous range.
+
+    Attributes:
+        table (pandas.DataFrame):
+            The parsed source table, sorted, with the field of view descriptors
+            replaced by integer indices.
+        fov_lookup (dict):
+            The field of view descriptor for each integer index.
+        fov_ranges (dict):
+            The (start, stop) range of cells for each field of view integer index.
+        coordinates (numpy.ndarray):
+            The cell box centers, one (x, y) row per cell.
+        compartments (list):
+            The compartment names, as given by the dataset design.
+        compartment_codes (numpy.ndarray):
+            For each cell, the index of its compartment in ``compartments``, or
+            ``len(compartments)`` if it is in none of them.
+        masks (PackedBitMatrix):
+            The boolean features of the cells (see
+            :py:meth:`CellTableBuilder.create_masks`).
+        intensities (dict):
+            Channel intensity values, keyed by normal-form names like
+            "<phenotype> <site> intensity", if requested.
+        cell_areas (numpy.ndarray):
+            The cell areas, if requested.
+    """
+    def __init__(self, indexing, coordinates, compartments, masks, intensities=None, cell_areas=None):
+        self.table = indexing.get_table()
+        self.fov_lookup = indexing.get_fov_lookup()
+        self.fov_ranges = indexing.get_ranges()
+        self.indexing = indexing
+        self.coordinates = coordinates
+        self.compartments = compartments
+        self.masks = masks
+        self.intensities = intensities if intensities is not None else {}
+        self.cell_areas = cell_areas
+        self.compartment_codes = np.full(masks.number_cells, len(compartments), dtype=np.int8)
+        for i, compartment in enumerate(compartments):
+            self.compartment_codes[masks.get_mask(('compartment', compartment))] = i
+
+    def get_number_cells(self):
+        """
+        :return: The number of cells.
+        :rtype: int
+        """
+        return self.masks.number_cells
+
+    def get_compartment_labels(self):
+        """
+        :return: For each cell, the name of its compartment, or "Not in <compartment
+            1>;<compartment 2>;..." if it is in none of them.
+        :rtype: numpy.ndarray
+        """
+        labels = np.array(
+            self.compartments + ['Not in ' + ';'.join(self.compartments)],
+            dtype=object,
+        )
+        return labels[self.compartment_codes]
+
+    def get_membership(self, phenotype_name):
+        """
+        :param phenotype_name: The name of one of the signatures used to build the
+            table.
+        :type phenotype_name: str
+
+        :return: For each cell, whether it has the phenotype.
+        :rtype: numpy.ndarray
+        """
+        return self.masks.get_mask(('phenotype', phenotype_name))
+
+    def get_fov_tables(self, frame):
+        """
+        :param frame: A table with one row per cell, in the order of this table.
+        :type frame: pandas.DataFrame
+
+        :return: Views of ``frame`` for each field of view, keyed by integer index. See
+            :py:meth:`FOVIndexing.get_fov_tables`.
+        :rtype: dict
+        """
+        return self.indexing.get_fov_tables(frame)
+
+
+class CellTableBuilder:
+    """
+    Parses the cells of input files into :py:class:`CellTable` objects. The columns
+    read, their data types, and the compartment and phenotype membership of the
+    cells are determined by the dataset design and the given phenotype signatures.
+    """
+    def __init__(self,
+        dataset_design=None,
+        signatures_by_name: dict=None,
+        intensities: bool=False,
+        cell_area: bool=False,
+        slide_offsets: bool=False,
+        columnar_cache: ColumnarCache=None,
+    ):
+        """
+        :param dataset_design: The design object for the input dataset.
+
+        :param signatures_by_name: Phenotype signatures (see the dataset design),
+            keyed by phenotype name.
+        :type signatures_by_name: dict
+
+        :param intensities: Whether to keep channel intensity values.
+        :type intensities: bool
+
+        :param cell_area: Whether to keep cell areas.
+        :type cell_area: bool
+
+        :param slide_offsets: Whether to add the slide offsets of the fields of view
+            (see the dataset design) to the cell coordinates, so that they are
+            slide-global.
+        :type slide_offsets: bool
+
+        :param columnar_cache: The cache through which to read input files. By
+            default, a cache in the default location, relative to the working
+            directory. Jobs pass the cache of their run (see
+            :py:meth:`ColumnarCache.get_job_cache`).
+        :type columnar_cache: ColumnarCache
+        """
+        self.dataset_design = dataset_design
+        self.signatures_by_name = signatures_by_name
+        self.intensities = intensities
+        self.cell_area = cell_area
+        self.slide_offsets = slide_offsets
+        if columnar_cache is None:
+            columnar_cache = ColumnarCache()
+        self.columnar_cache = columnar_cache
+
+    def get_columns(self):
+        """
+        :return: The columns of input files needed for the given signatures and
+            options, and their compact data types.
+        :rtype: list, dict
+        """
+        columns = self.dataset_design.get_required_columns(
+            list(self.signatures_by_name.values()),
+            intensities=self.intensities,
+            cell_area=self.cell_area,
+            slide_offsets=self.slide_offsets,
+        )
+        return columns, self.dataset_design.get_column_dtypes(columns)
+
+    def read_table(self, filename, sha256=None):
+        """
+        :param filename: A cell data input file.
+        :type filename: str
+
+        :param sha256: The SHA256 hash of the file contents, if known.
+        :type sha256: str
+
+        :return: The columns of the file needed for the given signatures and options,
+            with compact data types.
+        :rtype: pandas.DataFrame
+        """
+        columns, dtype = self.get_columns()
+        table = self.columnar_cache.read_csv(
+            filename,
+            sha256=sha256,
+            columns=columns,
+            dtype=dtype,
+        )
+        self.dataset_design.downcast_positivity(table, filename)
+        return table
+
+    def build(self, filename, sha256=None):
+        """
+        :param filename: A cell data input file.
+        :type filename: str
+
+        :param sha256: The SHA256 hash of the file contents, if known.
+        :type sha256: str
+
+        :return: The cells of the file.
+        :rtype: CellTable
+        """
+        return self.build_from_table(self.read_table(filename, sha256=sha256))
+
+    def iterate(self, filename, chunk_size):
+        """
+        Reads the file in chunks of whole fields of view (see
+        :py:class:`FOVChunkReader`), bypassing the columnar cache, so that the whole
+        file is never in memory at once. The field of view indices agree with those of
+        :py:meth:`build`.
+
+        :param filename: A cell data input file, whose cells are grouped by field of
+            view.
+        :type filename: str
+
+        :param chunk_size: The number of rows to read at a time.
+        :type chunk_size: int
+
+        :return: The cells of each chunk.
+        :rtype: generator of CellTable
+        """
+        columns, dtype = self.get_columns()
+        reader = FOVChunkReader(
+            filename=filename,
+            fov_column=self.dataset_design.get_FOV_column(),
+            columns=columns,
+            dtype=dtype,
+            chunk_size=chunk_size,
+            normalize=self.dataset_design.normalize_fov_descriptor,
+        )
+        descriptors = reader.get_descriptors()
+        for table in reader:
+            self.dataset_design.downcast_positivity(table, filename)
+            yield self.build_from_table(table, fov_descriptors=descriptors)
+
+    def build_from_table(self, table, fov_descriptors=None):
+        """
+        :param table: The parsed cells, as returned by :py:meth:`read_table`. The
+            field of view descriptors are normalized in-place.
+        :type table: pandas.DataFrame
+
+        :param fov_descriptors: See :py:class:`FOVIndexing`.
+        :type fov_descriptors: list
+
+        :return: The cells.
+        :rtype: CellTable
+        """
+        self.dataset_design.normalize_fov_descriptors(table)
+        indexing = FOVIndexing(
+            table,
+            self.dataset_design.get_FOV_column(),
+            descriptors=fov_descriptors,
+        )
+        table = indexing.get_table()
+
+        xmin, xmax, ymin, ymax = self.dataset_design.get_box_limit_column_names()
+        coordinates = np.empty((table.shape[0], 2))
+        coordinates[:, 0] = 0.5 * (table[xmax].to_numpy(dtype=float) + table[xmin].to_numpy(dtype=float))
+        coordinates[:, 1] = 0.5 * (table[ymax].to_numpy(dtype=float) + table[ymin].to_numpy(dtype=float))
+        if self.slide_offsets:
+            x_offset, y_offset = self.dataset_design.get_slide_offset_column_names()
+            coordinates[:, 0] += table[x_offset].to_numpy(dtype=float)
+            coordinates[:, 1] += table[y_offset].to_numpy(dtype=float)
+
+        intensities = None
+        if self.intensities:
+            intensities = {
+                key : table[column].to_numpy()
+                for key, column in self.dataset_design.get_intensity_column_names().items()
+            }
+        cell_areas = None
+        if self.cell_area:
+            cell_areas = table[self.dataset_design.get_cell_area_column()].to_numpy()
+
+        return CellTable(
+            indexing,
+            coordinates,
+            list(self.dataset_design.get_compartments()),
+            self.create_masks(table),
+            intensities=intensities,
+            cell_areas=cell_areas,
+        )
+
+    def create_masks(self, table):
+        """
+        Evaluates the compartment and phenotype membership of every cell in the table
+        at once, into one packed bit matrix.
+
+        Each distinct literal (key, value) of the phenotype signatures is evaluated
+        once, as a whole-table column comparison. A negative marker literal ("-") is
+        taken as the complement of the positive one. Phenotypes are then bitwise ANDs
+        and AND NOTs of these rows. As with sequential assignment of compartment
+        labels, a cell matching the signatures of several compartments is assigned to
+        the last one in the dataset design's list.
+
+        :param table: Table with cell data.
+        :type table: pandas.DataFrame
+
+        :return: The bit matrix, with features ("phenotype", <name>),
+            ("compartment", <name>), ("compartment signature", <name>) (the compartment
+            signature alone, without precedence), and ("literal", <munged literal>).
+        :rtype: PackedBitMatrix
+        """
+        elementary_phenotypes = self.dataset_design.get_elementary_phenotype_names()
+        compartments = self.dataset_design.get_compartments()
+
+        positives = {}
+        negatives = {}
+        literals = {}
+        for name, signature in self.signatures_by_name.items():
+            positives[name] = []
+            negatives[name] = []
+            for key, value in signature.items():
+                if value == '-' and key in elementary_phenotypes:
+                    literal = {key : '+'}
+                    negatives[name].append(('literal', self.dataset_design.munge_name(literal)))
+                else:
+                    literal = {key : value}
+                    positives[name].append(('literal', self.dataset_design.munge_name(literal)))
+                literals[('literal', self.dataset_design.munge_name(literal))] = literal
+
+        feature_names = list(literals.keys()) + [
+            ('compartment signature', compartment) for compartment in compartments
+        ] + [
+            ('compartment', compartment) for compartment in compartments
+        ] + [
+            ('phenotype', name) for name in self.signatures_by_name
+        ]
+        masks = PackedBitMatrix(feature_names, table.shape[0])
+        literal_masks = self.dataset_design.compile_signatures(literals)(table)
+        for feature_name, mask in literal_masks.items():
+            masks.set_feature(feature_name, mask)
+        for compartment in compartments:
+            masks.set_feature(
+                ('compartment signature', compartment),
+                self.dataset_design.get_compartmental_signature(table, compartment),
+            )
+        for i, compartment in enumerate(compartments):
+            masks.set_feature_words(('compartment', compartment), masks.combine(
+                [('compartment signature', compartment)],
+                [('compartment signature', later) for later in compartments[i+1:]],
+            ))
+        for name in self.signatures_by_name:
+            masks.set_feature_words(
+                ('phenotype', name),
+                masks.combine(positives[name], negatives[name]),
+            )
+        return masks
@@ -0,0 +1,173 @@
+"""
+Streaming reads of cell input files too large to load into memory at once.
+"""
+import pandas as pd
+import numpy as np
+
+from .compressed_input import read_csv_chunks
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class FOVChunkReader:
+    """
+    Reads a CSV file of cells in chunks of rows, each of which contains only whole
+    fields of view. This requires that the cells of each field of view are
+    consecutive rows of the file (the field of view column is "grouped"), which is
+    verified as the chunks are read unless ``verify`` is False.
+
+    Rows of the field of view at the end of each chunk of ``chunk_size`` rows are
+    held back and prepended to the next chunk. Memory use is therefore bounded by
+    ``chunk_size`` plus the size of the largest field of view.
+    """
+    def __init__(self,
+        filename: str=None,
+        fov_column: str=None,
+        columns: list=None,
+        dtype: dict=None,
+        chunk_size: int=100000,
+        normalize=None,
+        verify: bool=True,
+    ):
+        """
+        :param filename: The CSV file, possibly compressed (see
+            :py:func:`open_input`).
+        :type filename: str
+
+        :param fov_column: The name of the field of view descriptor column.
+        :type fov_column: str
+
+        :param columns: The columns to load. By default, all columns.
+        :type columns: list
+
+        :param dtype: Data types for some of the columns, as for ``pandas.read_csv``.
+        :type dtype: dict
+
+        :param chunk_size: The number of rows to read at a time.
+        :type chunk_size: int
+
+        :param normalize: (Optional) A function putting field of view descriptors
+            into normal form. Descriptors with the same normal form are considered the
+            same field of view.
+
+        :param verify: Whether to check that the field of view column is grouped.
+        :type verify: bool
+        """
+        if not chunk_size > 0:
+            logger.error('Chunk size must be positive, got %s.', chunk_size)
+            raise ValueError
+        self.filename = filename
+        self.fov_column = fov_column
+        self.columns = columns
+        self.dtype = dtype if dtype is not None else {}
+        self.chunk_size = chunk_size
+        self.normalize = normalize
+        self.verify = verify
+
+    def get_keys(self, table):
+        """
+        :param table: A chunk of the file.
+        :type table: pandas.DataFrame
+
+        :return: The normalized field of view descriptor of each row, as strings.
+        :rtype: numpy.ndarray
+        """
+        column = table[self.fov_column]
+        if self.normalize is not None:
+            column = column.map(self.normalize)
+        return column.astype(str).to_numpy()
+
+    def get_descriptors(self):
+        """
+        Reads only the field of view column, in chunks.
+
+        :return: The sorted distinct normalized field of view descriptors of the file.
+        :rtype: list
+        """
+        descriptors = set()
+        for chunk in read_csv_chunks(
+            self.filename,
+            self.chunk_size,
+            usecols=[self.fov_column],
+            dtype={self.fov_column : self.dtype.get(self.fov_column, str)},
+        ):
+            descriptors.update(self.get_keys(chunk))
+        return sorted(descriptors)
+
+    def concatenate(self, tables):
+        """
+        :param tables: Consecutive chunks of the file.
+        :type tables: list
+
+        :return: The chunks, concatenated, with an index starting at 0. Columns
+            requested as categorical remain categorical even though each chunk has its
+            own categories.
+        :rtype: pandas.DataFrame
+        """
+        table = pd.concat(tables, ignore_index=True)
+        for column, column_type in self.dtype.items():
+            if column in table.columns and column_type == 'category':
+                if not isinstance(table[column].dtype, pd.CategoricalDtype):
+                    table[column] = table[column].astype('category')
+        return table
+
+    def __iter__(self):
+        """
+        :return: The chunks of whole fields of view, in file order, each with an index
+            starting at 0.
+        :rtype: generator
+        """
+        pending = []
+        pending_key = None
+        completed = set()
+        for chunk in read_csv_chunks(
+            self.filename,
+            self.chunk_size,
+            usecols=self.columns,
+            dtype=self.dtype,
+        ):
+            if chunk.shape[0] == 0:
+                continue
+            keys = self.get_keys(chunk)
+            starts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+            if pending_key is not None and keys[0] != pending_key:
+                starts = np.concatenate([[0], starts]).astype(int)
+            run_keys = [pending_key if pending_key is not None else keys[0]] + list(keys[starts])
+            if self.verify:
+                self.check_grouped(run_keys, completed)
+                completed.update(run_keys[:-1])
+            if len(starts) == 0:
+                pending.append(chunk)
+                pending_key = run_keys[-1]
+                continue
+            last_start = int(starts[-1])
+            yield self.concatenate(pending + [chunk.iloc[0:last_start]])
+            pending = [chunk.iloc[last_start:]]
+            pending_key = run_keys[-1]
+        if len(pending) > 0:
+            yield self.concatenate(pending)
+
+    def check_grouped(self, run_keys, completed):
+        """
+        :param run_keys: The field of view descriptor of each run of consecutive rows
+            with the same descriptor, in a chunk (starting with the field of view held
+            back from the previous chunk, if any).
+        :type run_keys: list
+
+        :param completed: The descriptors of the fields of view in previous chunks.
+        :type completed: set
+        """
+        repeated = completed.intersection(run_keys)
+        seen = set()
+        for key in run_keys:
+            if key in seen:
+                repeated.add(key)
+            seen.add(key)
+        if len(repeated) > 0:
+            logger.error(
+                'Cells of fields of view %s are not consecutive rows in %s; can not read it in chunks.',
+                sorted(repeated),
+                self.filename,
+            )
+            raise ValueError
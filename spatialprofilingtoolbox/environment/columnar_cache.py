@@ -0,0 +1,330 @@
+"""
+A cache of parsed tabular input files, in a binary columnar format.
+"""
+import os
+from os.path import join, exists, abspath
+import json
+import hashlib
+import shutil
+
+import pandas as pd
+import numpy as np
+
+from .compressed_input import read_csv
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class ColumnarCache:
+    """
+    Each column of a tabular (CSV) input file is parsed only once. It is then saved
+    to a bundle of ``.npy`` files, in a directory named by the SHA256 hash of the
+    original file contents. Later reads of the same file, by any job or workflow,
+    load the requested columns from the bundle using memory mapping, and parse only
+    those columns which are not cached yet. The returned table is built on the
+    memory-mapped arrays without copying them, so cached numeric columns are
+    read-only. A column parsed with a given data type is cached separately from the
+    same column parsed with the default type.
+
+    Numeric and boolean columns are saved as-is. Text and categorical columns are
+    saved as integer codes into an array of distinct values, so that they too can
+    be memory mapped. Columns of mixed types, which can not be represented this way,
+    are saved as arrays of Python objects.
+
+    Input files may be gzip- or zstd-compressed (see :py:func:`open_input`). They
+    are decompressed as they are parsed, and are keyed by the hash of their
+    compressed bytes. The header of each file is saved with its bundle, so that the
+    file is not opened at all when all requested columns are cached.
+
+    The cache records which bundle was last read for each input file path. When the
+    contents of a file change, the bundle of its previous contents is removed,
+    unless another input file still has those contents.
+    """
+    default_cache_location = '.columnar_cache'
+    sources_directory = 'sources'
+
+    def __init__(self, cache_location: str='.columnar_cache'):
+        """
+        :param cache_location: The directory in which to keep the bundles.
+        :type cache_location: str
+        """
+        self.cache_location = cache_location
+        self.headers = {}
+
+    @staticmethod
+    def get_job_cache(jobs_paths):
+        """
+        :param jobs_paths: The paths of a run.
+        :type jobs_paths: JobsPaths
+
+        :return: The cache of the run, in its job working directory, which is kept
+            between runs (unlike the output path). Jobs are started in this
+            directory, so it is the current one if not provided.
+        :rtype: ColumnarCache
+        """
+        job_working_directory = jobs_paths.job_working_directory
+        if job_working_directory is None:
+            job_working_directory = os.getcwd()
+        return ColumnarCache(
+            cache_location=join(job_working_directory, ColumnarCache.default_cache_location),
+        )
+
+    def read_csv(self, filename, sha256=None, columns=None, dtype=None):
+        """
+        :param filename: The CSV file, possibly compressed.
+        :type filename: str
+
+        :param sha256: The SHA256 hex digest of the file contents, as recorded in the
+            file metadata table. If not provided, it is computed.
+        :type sha256: str
+
+        :param columns: The columns to load. By default, all columns.
+        :type columns: list
+
+        :param dtype: Data types for some of the columns, as for ``pandas.read_csv``.
+        :type dtype: dict
+
+        :return: The table, as ``pandas.read_csv`` would parse it.
+        :rtype: pandas.DataFrame
+        """
+        if sha256 is None:
+            sha256 = ColumnarCache.compute_sha256(filename)
+        if dtype is None:
+            dtype = {}
+        self.record_source(filename, sha256)
+        header = self.get_header(filename, sha256)
+        if columns is None:
+            columns = header
+        missing = [column for column in columns if not column in header]
+        if len(missing) > 0:
+            logger.error('Columns %s not in %s.', missing, filename)
+            raise ValueError
+        bundle = join(self.cache_location, sha256)
+        keys = {
+            column : (header.index(column), ColumnarCache.get_dtype_name(dtype.get(column)))
+            for column in columns
+        }
+        cached = [
+            column for column in columns
+            if exists(ColumnarCache.get_entry_filename(bundle, keys[column]))
+        ]
+        uncached = [column for column in columns if not column in cached]
+
+        data = {}
+        if len(cached) > 0:
+            logger.debug('Loading %s columns of %s from columnar cache %s.', len(cached), filename, bundle)
+            for column in cached:
+                data[column] = self.load_column(bundle, keys[column])
+        if len(uncached) > 0:
+            parsed = read_csv(
+                filename,
+                usecols=uncached,
+                dtype={column : dtype[column] for column in uncached if column in dtype},
+            )
+            os.makedirs(bundle, exist_ok=True)
+            for column in uncached:
+                self.save_column(bundle, keys[column], parsed[column])
+                data[column] = parsed[column]
+        return pd.DataFrame(data, columns=columns, copy=False)
+
+    def get_header(self, filename, sha256=None):
+        """
+        :param filename: The CSV file, possibly compressed.
+        :type filename: str
+
+        :param sha256: See :py:meth:`read_csv`.
+        :type sha256: str
+
+        :return: The column names of the file, parsed only once and saved with the
+            bundle of the file.
+        :rtype: list
+        """
+        if sha256 is None:
+            sha256 = ColumnarCache.compute_sha256(filename)
+        if sha256 in self.headers:
+            return self.headers[sha256]
+        header_filename = join(self.cache_location, sha256, 'header.json')
+        if exists(header_filename):
+            with open(header_filename, 'rt') as file:
+                header = json.load(file)
+        else:
+            header = list(read_csv(filename, nrows=0).columns)
+            os.makedirs(join(self.cache_location, sha256), exist_ok=True)
+            suffix = '.' + str(os.getpid()) + '.tmp'
+            with open(header_filename + suffix, 'wt') as file:
+                json.dump(header, file)
+            os.replace(header_filename + suffix, header_filename)
+        self.headers[sha256] = header
+        return header
+
+    def record_source(self, filename, sha256):
+        """
+        Records that the bundle of the given input file is the one named by the given
+        checksum. If a different bundle was recorded for the file before, that bundle
+        is removed, unless it is recorded for another file.
+
+        :param filename: An input file.
+        :type filename: str
+
+        :param sha256: The SHA256 hex digest of the current file contents.
+        :type sha256: str
+        """
+        sources = join(self.cache_location, ColumnarCache.sources_directory)
+        path = abspath(filename)
+        record_filename = join(sources, hashlib.sha256(path.encode('utf-8')).hexdigest() + '.json')
+        previous = None
+        if exists(record_filename):
+            with open(record_filename, 'rt') as file:
+                previous = json.load(file)['sha256']
+        if previous == sha256:
+            return
+        os.makedirs(sources, exist_ok=True)
+        suffix = '.' + str(os.getpid()) + '.tmp'
+        with open(record_filename + suffix, 'wt') as file:
+            json.dump({'path' : path, 'sha256' : sha256}, file)
+        os.replace(record_filename + suffix, record_filename)
+        if previous is None or not exists(join(self.cache_location, previous)):
+            return
+        for record in os.listdir(sources):
+            if not record.endswith('.json'):
+                continue
+            with open(join(sources, record), 'rt') as file:
+                if json.load(file)['sha256'] == previous:
+                    return
+        logger.info('%s changed; removing the cached columns of its previous contents.', filename)
+        shutil.rmtree(join(self.cache_location, previous), ignore_errors=True)
+        self.headers.pop(previous, None)
+
+    @staticmethod
+    def compute_sha256(filename):
+        """
+        :param filename: A file.
+        :type filename: str
+
+        :return: The SHA256 hex digest of the file contents. For a compressed file,
+            this is the digest of the compressed bytes as stored (as in the file
+            manifest), so that it is computed without decompression.
+        :rtype: str
+        """
+        buffer_size = 65536
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as file:
+            while True:
+                data = file.read(buffer_size)
+                if not data:
+                    break
+                sha.update(data)
+        return sha.hexdigest()
+
+    @staticmethod
+    def get_dtype_name(column_type):
+        """
+        :param column_type: A data type specification, or None for the default.
+
+        :return: A normalized name for the data type, e.g. "float32" or "category".
+        :rtype: str
+        """
+        if column_type is None:
+            return 'default'
+        return pd.api.types.pandas_dtype(column_type).name
+
+    @staticmethod
+    def get_prefix(key):
+        """
+        :param key: The index of the column in the original file header, and the
+            name of the data type with which it was parsed.
+        :type key: tuple
+
+        :return: The common prefix of the names of the files for the column.
+        :rtype: str
+        """
+        position, dtype_name = key
+        return 'column_' + str(position) + '_' + dtype_name
+
+    @staticmethod
+    def get_entry_filename(bundle, key):
+        """
+        :param bundle: The directory containing the column files.
+        :type bundle: str
+
+        :param key: See :py:meth:`get_prefix`.
+        :type key: tuple
+
+        :return: The name of the file describing how the column is stored.
+        :rtype: str
+        """
+        return join(bundle, ColumnarCache.get_prefix(key) + '.json')
+
+    def save_column(self, bundle, key, values):
+        """
+        Writes each file for the column under a temporary name, then moves it into
+        place. The description file is moved last, so that concurrent jobs never see
+        a partially saved column.
+
+        :param bundle: The directory to contain the column files.
+        :type bundle: str
+
+        :param key: See :py:meth:`get_prefix`.
+        :type key: tuple
+
+        :param values: The parsed column.
+        :type values: pandas.Series
+        """
+        prefix = ColumnarCache.get_prefix(key)
+        entry = {'name' : values.name, 'file' : prefix + '.npy'}
+        arrays = {}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            entry['kind'] = 'categorical'
+            entry['values file'] = prefix + '_values.npy'
+            arrays[entry['file']] = values.cat.codes.to_numpy()
+            arrays[entry['values file']] = values.cat.categories.to_numpy()
+        elif values.dtype != object:
+            entry['kind'] = 'array'
+            arrays[entry['file']] = values.to_numpy()
+        else:
+            codes, uniques = pd.factorize(values)
+            if all(isinstance(value, str) for value in uniques):
+                entry['kind'] = 'codes'
+                entry['values file'] = prefix + '_values.npy'
+                arrays[entry['file']] = codes
+                arrays[entry['values file']] = np.array(list(uniques), dtype=str)
+            else:
+                entry['kind'] = 'objects'
+                arrays[entry['file']] = values.to_numpy()
+        suffix = '.' + str(os.getpid()) + '.tmp'
+        for filename, array in arrays.items():
+            with open(join(bundle, filename + suffix), 'wb') as file:
+                np.save(file, array, allow_pickle=True)
+            os.replace(join(bundle, filename + suffix), join(bundle, filename))
+        entry_filename = ColumnarCache.get_entry_filename(bundle, key)
+        with open(entry_filename + suffix, 'wt') as file:
+            json.dump(entry, file)
+        os.replace(entry_filename + suffix, entry_filename)
+
+    def load_column(self, bundle, key):
+        """
+        :param bundle: The directory containing the column files.
+        :type bundle: str
+
+        :param key: See :py:meth:`get_prefix`.
+        :type key: tuple
+
+        :return: The column values.
+        :rtype: numpy.ndarray or pandas.Categorical
+        """
+        with open(ColumnarCache.get_entry_filename(bundle, key), 'rt') as file:
+            entry = json.load(file)
+        if entry['kind'] == 'array':
+            return np.load(join(bundle, entry['file']), mmap_mode='r')
+        if entry['kind'] == 'objects':
+            return np.load(join(bundle, entry['file']), allow_pickle=True)
+        codes = np.load(join(bundle, entry['file']), mmap_mode='r')
+        uniques = np.load(join(bundle, entry['values file']), allow_pickle=True)
+        if entry['kind'] == 'categorical':
+            return pd.Categorical.from_codes(codes, categories=uniques)
+        uniques = uniques.astype(object)
+        values = np.full(len(codes), np.nan, dtype=object)
+        present = codes >= 0
+        values[present] = uniques[codes[present]]
+        return values
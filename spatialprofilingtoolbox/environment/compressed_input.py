@@ -0,0 +1,124 @@
+"""
+Transparent reading of gzip- and zstd-compressed input files, as streams.
+"""
+import gzip
+import io
+
+import pandas as pd
+
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+compression_suffixes = {
+    '.gz' : 'gzip',
+    '.zst' : 'zstd',
+}
+
+
+def get_compression(filename):
+    """
+    :param filename: An input file name.
+    :type filename: str
+
+    :return: The compression format indicated by the file name suffix, "gzip" or
+        "zstd", or None if the file is not compressed.
+    :rtype: str
+    """
+    for suffix, compression in compression_suffixes.items():
+        if str(filename).endswith(suffix):
+            return compression
+    return None
+
+
+def strip_compression_suffix(filename):
+    """
+    :param filename: An input file name.
+    :type filename: str
+
+    :return: The file name without the compression suffix, if any, e.g. "cells.csv"
+        for "cells.csv.gz".
+    :rtype: str
+    """
+    for suffix in compression_suffixes:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+def open_input(filename, mode='rb'):
+    """
+    Opens an input file for reading, decompressing it on the fly if its name ends in
+    ".gz" or ".zst". The file is never decompressed to disk nor read into memory
+    whole. Reading zstd-compressed files requires the optional ``zstandard``
+    package.
+
+    :param filename: An input file name.
+    :type filename: str
+
+    :param mode: "rb" for a binary stream, or "rt" for a text stream.
+    :type mode: str
+
+    :return: The stream of decompressed contents, to be used as a context manager.
+    :rtype: file object
+    """
+    if not mode in ['rb', 'rt']:
+        logger.error('Input files can only be opened for reading, not with mode "%s".', mode)
+        raise ValueError
+    compression = get_compression(filename)
+    if compression is None:
+        stream = open(filename, 'rb')
+    elif compression == 'gzip':
+        stream = gzip.open(filename, 'rb')
+    else:
+        if zstandard is None:
+            logger.error(
+                'Reading %s requires the "zstandard" package (pip install zstandard).',
+                filename,
+            )
+            raise ValueError
+        stream = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+    if mode == 'rt':
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return stream
+
+
+def read_csv(filename, **kwargs):
+    """
+    :param filename: A CSV file, possibly compressed (see :py:func:`open_input`).
+    :type filename: str
+
+    :param kwargs: Keyword arguments for ``pandas.read_csv``, other than
+        ``chunksize``.
+
+    :return: The table.
+    :rtype: pandas.DataFrame
+    """
+    if get_compression(filename) is None:
+        return pd.read_csv(filename, **kwargs)
+    with open_input(filename, mode='rt') as stream:
+        return pd.read_csv(stream, **kwargs)
+
+
+def read_csv_chunks(filename, chunksize, **kwargs):
+    """
+    :param filename: A CSV file, possibly compressed (see :py:func:`open_input`).
+    :type filename: str
+
+    :param chunksize: The number of rows to read at a time.
+    :type chunksize: int
+
+    :param kwargs: Other keyword arguments for ``pandas.read_csv``.
+
+    :return: The consecutive chunks of rows. The file is closed when the last chunk
+        has been read.
+    :rtype: generator of pandas.DataFrame
+    """
+    with open_input(filename, mode='rt') as stream:
+        for chunk in pd.read_csv(stream, chunksize=chunksize, **kwargs):
+            yield chunk
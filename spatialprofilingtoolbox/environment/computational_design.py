@@ -20,3 +20,13 @@ class ComputationalDesign:
                 The Uniform Resource Identifier (URI) identifying the database.
         """
         pass
+
+    def get_result_tables(self):
+        """
+        Returns:
+            dict:
+                The names of the columns which jobs fill, keyed by the name of the
+                table of the database (see ``get_database_uri``). Only these are
+                accepted by a result sink (see ``ResultSink``).
+        """
+        return {}
@@ -111,6 +111,26 @@ def write_config_parameters_to_file(parameters):
     with open(config_filename, 'w') as file:
         config.write(file)
 
+def positive_integer(value):
+    """
+    Argument type accepting only positive integers.
+
+    Args:
+        value (str):
+            The command-line value.
+
+    Returns:
+        int:
+            The value as an integer.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected a positive integer, got "%s"' % value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError('expected a positive integer, got %s' % number)
+    return number
+
 def get_config_parameters_from_cli():
     parser = argparse.ArgumentParser(
         description = ''.join([
@@ -204,12 +224,38 @@ def get_config_parameters_from_cli():
         required=True,
         help='Whether to skip calculation of input file checksums in some cases.',
     )
+    parser.add_argument('--integrity-check',
+        dest='integrity_check',
+        type=str,
+        required=False,
+        default=None,
+        choices=['full', 'sampled', 'skip'],
+        help=''.join([
+            'Whether to verify the checksums of all input files, of a random sample of ',
+            'them, or of none, once at job generation. Jobs reuse the verified checksums ',
+            'unless files change. The default is "full".',
+        ]),
+    )
+    parser.add_argument('--integrity-check-seed',
+        dest='integrity_check_seed',
+        type=int,
+        required=False,
+        default=None,
+        help='A seed for the random sample of files hashed under the "sampled" integrity check, to reproduce a previous sample.',
+    )
     parser.add_argument('--balanced',
         dest='balanced',
         type=str,
         required=True,
         help='Whether to do balanced or unbalanced workflow.',
     )
+    parser.add_argument('--whole-slide',
+        dest='whole_slide',
+        type=str,
+        required=False,
+        default='False',
+        help='Whether to ignore field of view boundaries (phenotype proximity workflow only). Requires slide offset columns in source files with several fields of view.',
+    )
     parser.add_argument('--save-graphml',
         dest='save_graphml',
         type=str,
@@ -220,6 +266,43 @@ def get_config_parameters_from_cli():
             'a 500-image run with 10 channels. and a few thousand cells per image.'
         ])
     )
+    parser.add_argument('--workers',
+        dest='workers',
+        type=int,
+        required=False,
+        default=1,
+        help='Number of worker processes per job (phenotype proximity workflow only).',
+    )
+    parser.add_argument('--neighbor-engine',
+        dest='neighbor_engine',
+        type=str,
+        required=False,
+        default=None,
+        choices=['sparse', 'dense'],
+        help='Method for finding cell pairs within the maximum radius; default "sparse" (phenotype proximity workflow only).',
+    )
+    parser.add_argument('--counting-engine',
+        dest='counting_engine',
+        type=str,
+        required=False,
+        default=None,
+        choices=['matrix', 'pairwise'],
+        help='Method for aggregating cell pair counts; default "matrix" (phenotype proximity workflow only).',
+    )
+    parser.add_argument('--tile-memory-budget',
+        dest='tile_memory_budget',
+        type=float,
+        required=False,
+        default=None,
+        help='Megabytes for the cell pairs of one tile, for tiled cell pair counting (phenotype proximity workflow only).',
+    )
+    parser.add_argument('--chunk-size',
+        dest='chunk_size',
+        type=positive_integer,
+        required=False,
+        default=None,
+        help='Read input files in chunks of about this many rows of whole fields of view, to bound memory use (density, front proximity, and phenotype proximity workflows only).',
+    )
     args = parser.parse_args()
 
     computational_workflow = re.sub(r'\\ ', ' ', args.computational_workflow)
@@ -264,10 +347,32 @@ def get_config_parameters_from_cli():
     }
     if skip_integrity_check:
         parameters['skip_integrity_check'] = True
+    if args.integrity_check is not None:
+        parameters['integrity_check'] = args.integrity_check
+    if args.integrity_check_seed is not None:
+        parameters['integrity_check_seed'] = args.integrity_check_seed
     if balanced:
         parameters['balanced'] = True
     if save_graphml:
         parameters['save_graphml'] = True
+    if workflow == 'Multiplexed IF phenotype proximity':
+        if args.workers > 1:
+            parameters['workers'] = args.workers
+        if args.neighbor_engine is not None:
+            parameters['neighbor_engine'] = args.neighbor_engine
+        if args.counting_engine is not None:
+            parameters['counting_engine'] = args.counting_engine
+        if args.tile_memory_budget is not None:
+            parameters['tile_memory_budget'] = args.tile_memory_budget
+        if args.whole_slide == 'True':
+            parameters['whole_slide'] = True
+    chunked_workflows = [
+        'Multiplexed IF phenotype proximity',
+        'Multiplexed IF front proximity',
+        'Multiplexed IF density',
+    ]
+    if workflow in chunked_workflows and args.chunk_size is not None:
+        parameters['chunk_size'] = args.chunk_size
     return parameters
 
 def get_config_parameters():
@@ -1,5 +1,9 @@
 import sqlite3
 import time
+import random
+import math
+
+import pandas as pd
 
 from .log_formats import colorized_logger
 
@@ -8,31 +12,133 @@ logger = colorized_logger(__name__)
 
 class WaitingDatabaseContextManager:
     """
-    A wrapper over a sqlite database execution that just waits until the database is
-    available, using a fixed-wait-time loop. It is designed for usage with Python's
-    "with ... as" construct.
+    A wrapper over a sqlite database execution that waits until the database is
+    available. It is designed for usage with Python's "with ... as" construct.
+
+    Connections keep the journal mode of the database file, unless another mode is
+    requested. WAL mode, in which readers do not block the writer, is requested
+    only for databases used from a single host (see
+    :py:meth:`JobGenerator.set_pipeline_database_journal_mode`).
+
+    SQLite itself waits for a lock only for a short busy timeout before reporting
+    that the database is locked. The operation is then retried after a delay which
+    doubles with each retry (up to a maximum), with random jitter so that many
+    waiting jobs do not retry in lock step. Since the waiting is done by this
+    retry loop rather than inside SQLite, the number of retries and the time spent
+    waiting for locks are recorded, per manager and in total for the process (see
+    :py:meth:`get_statistics`).
     """
-    def __init__(self, uri, seconds=5.0):
+    statistics = {
+        'connections' : 0,
+        'retries' : 0,
+        'lock wait seconds' : 0.0,
+    }
+
+    def __init__(self, uri, seconds=0.1, max_seconds=10.0, busy_timeout=0.05, journal_mode=None):
         """
         Args:
             uri (str):
                 The SQL database Uniform Resource Identifier (URI).
             seconds (float):
-                Number of seconds to wait until retrying a given execution, in case the
-                database is locked.
+                The maximum number of seconds to wait before the first retry of a given
+                execution, in case the database is locked.
+            max_seconds (float):
+                The maximum number of seconds to wait before any retry.
+            busy_timeout (float):
+                The number of seconds for which SQLite waits for a lock before
+                reporting that the database is locked. Waits within this timeout
+                are not recorded, so it should be short.
+            journal_mode (str):
+                The SQLite journal mode to set, or None to keep the mode of the
+                database file. WAL requires that all processes using the database
+                run on the same host; "DELETE" is required for databases on network
+                filesystems shared between hosts.
         """
         self.uri = uri
         self.seconds = seconds
+        self.max_seconds = max_seconds
+        self.busy_timeout = busy_timeout
+        self.journal_mode = journal_mode
+        self.retries = 0
+        self.lock_wait_seconds = 0.0
 
     def __enter__(self):
-        self.connection = sqlite3.connect(self.uri)
+        self.connection = sqlite3.connect(self.uri, timeout=self.busy_timeout)
         self.cursor = self.connection.cursor()
+        WaitingDatabaseContextManager.statistics['connections'] += 1
+        if self.journal_mode is not None:
+            self.retry(
+                lambda: self.cursor.execute('PRAGMA journal_mode=%s ;' % self.journal_mode).fetchall(),
+                'setting journal mode',
+            )
         return self
 
     def __exit__(self, exception_type, exception_value, traceback):
-        self.connection.commit()
+        self.commit()
         self.cursor.close()
         self.connection.close()
+        if self.retries > 0:
+            logger.debug(
+                'Waited %.2f seconds for locks on database %s (%s retries).',
+                self.lock_wait_seconds,
+                self.uri,
+                self.retries,
+            )
+
+    def retry(self, operation, description, rollback=False):
+        """
+        Performs an operation on the database, retrying with exponential backoff and
+        jitter as long as the database is locked.
+
+        Args:
+            operation (function):
+                The operation, a function with no arguments.
+            description (str):
+                A description of the operation, for logging.
+            rollback (bool):
+                Whether to roll back the partial transaction before retrying.
+
+        Returns:
+            The return value of the operation.
+        """
+        attempt = 0
+        while(True):
+            start = time.perf_counter()
+            try:
+                return operation()
+            except sqlite3.OperationalError as exception:
+                if str(exception) != 'database is locked':
+                    raise exception
+                if rollback:
+                    self.connection.rollback()
+                delay = random.uniform(0, min(self.max_seconds, self.seconds * 2**attempt))
+                logger.debug('Database %s was locked, waiting %.3f seconds to retry %s.', self.uri, delay, description)
+                time.sleep(delay)
+                attempt += 1
+                self.record_wait(time.perf_counter() - start)
+
+    def record_wait(self, seconds):
+        """
+        Args:
+            seconds (float):
+                Time spent on one failed attempt at an operation (including SQLite's
+                busy timeout) and the wait before retrying.
+        """
+        self.retries += 1
+        self.lock_wait_seconds += seconds
+        WaitingDatabaseContextManager.statistics['retries'] += 1
+        WaitingDatabaseContextManager.statistics['lock wait seconds'] += seconds
+
+    @staticmethod
+    def get_statistics():
+        """
+        Returns:
+            dict:
+                The number of connections opened, the number of retries, and the
+                total number of seconds spent waiting for locks, by all managers in this
+                process.
+        """
+        return dict(WaitingDatabaseContextManager.statistics)
 
     def execute_commit(self, cmd):
         """
@@ -60,31 +166,156 @@ class WaitingDatabaseContextManager:
         Returns:
             The result of the `fetchall()` sqlite function.
         """
-        while(True):
-            try:
-                result = self.cursor.execute(cmd).fetchall()
-                if commit:
-                    self.connection.commit()
-                break
-            except sqlite3.OperationalError as exception:
-                if str(exception) == 'database is locked':
-                    logger.debug('Database %s was locked, waiting %s seconds to retry: %s', self.uri, self.seconds, cmd)
-                    time.sleep(self.seconds)
-                else:
-                    raise exception
-        return result
+        def operation():
+            result = self.cursor.execute(cmd).fetchall()
+            if commit:
+                self.connection.commit()
+            return result
+        return self.retry(operation, cmd)
+
+    def execute_many(self, cmd, rows):
+        """
+        Executes a parameterized SQL command once for each of several rows of values,
+        then commits, all in a single transaction. If the database is locked, the
+        partial transaction is rolled back and the whole batch is retried.
+
+        Args:
+            cmd (str):
+                The SQL command to execute, with "?" placeholders for the values.
+            rows (list):
+                Sequences of values to bind, one sequence per execution.
+        """
+        rows = list(rows)
+        def operation():
+            self.cursor.executemany(cmd, rows)
+            self.connection.commit()
+        self.retry(operation, '%s-row batch: %s' % (len(rows), cmd), rollback=True)
+
+    def bulk_insert(self, table_name, header, batch, chunk_size=10000):
+        """
+        Inserts a batch of rows with bound parameters, ``chunk_size`` rows per
+        transaction. Values are never formatted into the SQL text, so they need no
+        quoting.
+
+        Args:
+            table_name (str):
+                The table.
+            header (list):
+                The columns to fill, as provided by the computational designs: either
+                column names, or 2-tuples of column name and SQL data type. If data
+                types are given, values are converted to the Python type matching the
+                SQLite affinity of each data type (int, float, or str). Missing values
+                (None or NaN) are inserted as NULL.
+            batch (pandas.DataFrame or list):
+                The values, either as a DataFrame with a column named like each header
+                column, or as a list of columns (arrays or lists), one for each header
+                column, in order.
+
+        Returns:
+            int:
+                The number of rows inserted.
+        """
+        cmd, columns = WaitingDatabaseContextManager.prepare_insert(table_name, header, batch)
+        number_rows = len(columns[0]) if len(columns) > 0 else 0
+        for start in range(0, number_rows, chunk_size):
+            self.execute_many(cmd, zip(*[column[start:start + chunk_size] for column in columns]))
+        return number_rows
+
+    @staticmethod
+    def prepare_insert(table_name, header, batch):
+        """
+        Validates and converts a batch of values for insertion. See
+        :py:meth:`bulk_insert`.
+
+        Returns:
+            tuple:
+                The parameterized INSERT statement, and the converted values as a list
+                of columns (lists of equal length).
+        """
+        column_names = [entry if isinstance(entry, str) else entry[0] for entry in header]
+        data_types = [None if isinstance(entry, str) else entry[1] for entry in header]
+        if isinstance(batch, pd.DataFrame):
+            columns = [batch[column_name] for column_name in column_names]
+        else:
+            columns = list(batch)
+        if len(columns) != len(column_names):
+            logger.error('Got %s columns of values for %s columns of %s.', len(columns), len(column_names), table_name)
+            raise ValueError
+        columns = [
+            WaitingDatabaseContextManager.convert_column(column, data_type)
+            for column, data_type in zip(columns, data_types)
+        ]
+        lengths = set(len(column) for column in columns)
+        if len(lengths) > 1:
+            logger.error('Columns of values for %s have different lengths %s.', table_name, sorted(lengths))
+            raise ValueError
+        cmd = WaitingDatabaseContextManager.get_insert_statement(table_name, column_names)
+        return cmd, columns
+
+    @staticmethod
+    def get_insert_statement(table_name, column_names):
+        """
+        Args:
+            table_name (str):
+                The table.
+            column_names (list):
+                The columns to fill.
+
+        Returns:
+            str:
+                The INSERT statement with one "?" placeholder for each column.
+        """
+        return 'INSERT INTO %s ( %s ) VALUES ( %s ) ;' % (
+            table_name,
+            ' , '.join(['"' + column_name + '"' for column_name in column_names]),
+            ' , '.join(['?'] * len(column_names)),
+        )
+
+    @staticmethod
+    def convert_column(column, data_type):
+        """
+        Args:
+            column (list, numpy.ndarray, or pandas.Series):
+                Values for one column.
+            data_type (str):
+                A SQL data type name, or None to keep the values' own types.
+
+        Returns:
+            list:
+                The values as Python objects which SQLite can bind (NumPy scalars are
+                converted), with missing values as None.
+        """
+        values = column.tolist() if hasattr(column, 'tolist') else list(column)
+        converter = WaitingDatabaseContextManager.get_converter(data_type)
+        return [
+            None if value is None or (isinstance(value, float) and math.isnan(value)) else converter(value)
+            for value in values
+        ]
+
+    @staticmethod
+    def get_converter(data_type):
+        """
+        Args:
+            data_type (str):
+                A SQL data type name, e.g. "INTEGER", "NUMERIC", "VARCHAR(25)", or None.
+
+        Returns:
+            The conversion function for values of columns of this type, following the
+            rules by which SQLite determines column affinity.
+        """
+        if data_type is None:
+            return lambda value: value
+        data_type = data_type.upper()
+        if 'INT' in data_type:
+            return int
+        if any(name in data_type for name in ['CHAR', 'CLOB', 'TEXT']):
+            return str
+        if data_type == 'BLOB':
+            return lambda value: value
+        return float
 
     def commit(self):
         """
         Explicitly commits the connection.
         """
-        while(True):
-            try:
-                self.connection.commit()
-                break
-            except sqlite3.OperationalError as exception:
-                if str(exception) == 'database is locked':
-                    logger.debug('Database %s was locked, waiting %s seconds to retry committing.', self.uri, self.seconds)
-                    time.sleep(self.seconds)
-                else:
-                    raise exception
+        self.retry(self.connection.commit, 'committing')
@@ -0,0 +1,161 @@
+"""
+Per-job shards of a pipeline-specific database, merged after all jobs complete.
+"""
+import os
+from os.path import join, exists, basename
+import re
+import glob
+
+from .database_context_utility import WaitingDatabaseContextManager
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class DatabaseShards:
+    """
+    Each job writes its results into its own shard database, a separate file with
+    the same tables as the pipeline-specific database, rather than into the shared
+    database itself. Jobs therefore never contend for the lock of a shared file. A
+    shard is written under a temporary name, and renamed when its job completes.
+
+    The integration phase then merges the completed shards into the pipeline-specific
+    database in one pass, attaching each shard in turn and appending the rows of each
+    of its tables. Integer primary keys named "id" are reassigned. Each shard is
+    deleted as soon as its rows are committed, so that an interrupted merge can be
+    resumed without duplicating rows.
+    """
+    def __init__(self, uri):
+        """
+        :param uri: The pipeline-specific database.
+        :type uri: str
+        """
+        self.uri = uri
+
+    def get_shards_location(self):
+        """
+        :return: The directory containing the shards.
+        :rtype: str
+        """
+        return self.uri + '.shards'
+
+    def get_shard_uri(self, job_index):
+        """
+        :param job_index: The index of a job in the job metadata table.
+        :type job_index: int
+
+        :return: The shard database of the job, once completed.
+        :rtype: str
+        """
+        return join(self.get_shards_location(), 'job_' + str(job_index) + '.db')
+
+    def get_partial_shard_uri(self, job_index):
+        """
+        :param job_index: The index of a job in the job metadata table.
+        :type job_index: int
+
+        :return: The shard database of the job, while the job is running.
+        :rtype: str
+        """
+        return self.get_shard_uri(job_index) + '.partial'
+
+    def get_shard_uris(self):
+        """
+        :return: The completed shard databases, in order of job index.
+        :rtype: list
+        """
+        uris = glob.glob(join(self.get_shards_location(), 'job_*.db'))
+        return sorted(uris, key=lambda uri: int(re.search(r'job_(\d+)\.db$', uri).group(1)))
+
+    def get_table_definitions(self):
+        """
+        :return: The names and CREATE statements of the tables of the pipeline-specific
+            database.
+        :rtype: list
+        """
+        with WaitingDatabaseContextManager(self.uri) as manager:
+            return manager.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ;"
+            )
+
+    def create_shard(self, job_index):
+        """
+        Creates an empty shard for the job, with the same tables as the
+        pipeline-specific database, replacing any shard left by a previous run of the
+        job.
+
+        :param job_index: The index of a job in the job metadata table.
+        :type job_index: int
+
+        :return: The shard database, to be written while the job is running.
+        :rtype: str
+        """
+        shard_uri = self.get_partial_shard_uri(job_index)
+        os.makedirs(self.get_shards_location(), exist_ok=True)
+        for uri in [self.get_shard_uri(job_index), shard_uri]:
+            DatabaseShards.remove(uri)
+        with WaitingDatabaseContextManager(shard_uri) as manager:
+            for _, sql in self.get_table_definitions():
+                manager.execute(sql)
+        return shard_uri
+
+    def complete_shard(self, job_index):
+        """
+        Marks the shard of the job as ready to be merged, if the job created one.
+
+        :param job_index: The index of a job in the job metadata table.
+        :type job_index: int
+        """
+        if exists(self.get_partial_shard_uri(job_index)):
+            os.replace(self.get_partial_shard_uri(job_index), self.get_shard_uri(job_index))
+
+    @staticmethod
+    def remove(uri):
+        """
+        :param uri: A database file, to be removed together with its WAL files.
+        :type uri: str
+        """
+        for filename in [uri, uri + '-wal', uri + '-shm']:
+            if exists(filename):
+                os.remove(filename)
+
+    def merge(self):
+        """
+        Appends the rows of all shards to the tables of the pipeline-specific
+        database, then deletes the shards.
+        """
+        shard_uris = self.get_shard_uris()
+        if len(shard_uris) == 0:
+            return
+        logger.info('Merging %s job shards into %s.', len(shard_uris), basename(self.uri))
+        number_rows = 0
+        with WaitingDatabaseContextManager(self.uri) as manager:
+            tables = [name for name, _ in self.get_table_definitions()]
+            for shard_uri in shard_uris:
+                manager.execute("ATTACH DATABASE '%s' AS shard ;" % shard_uri.replace("'", "''"))
+                shard_tables = [name for name, in manager.execute(
+                    "SELECT name FROM shard.sqlite_master WHERE type='table' ;"
+                )]
+                for table in tables:
+                    if not table in shard_tables:
+                        continue
+                    columns = [
+                        column_name
+                        for _, column_name, _, _, _, primary_key
+                        in manager.execute('PRAGMA main.table_info(%s) ;' % table)
+                        if not (column_name == 'id' and primary_key)
+                    ]
+                    column_list = ' , '.join(['"%s"' % column for column in columns])
+                    manager.execute('INSERT INTO main."%s" ( %s ) SELECT %s FROM shard."%s" ORDER BY rowid ;' % (
+                        table,
+                        column_list,
+                        column_list,
+                        table,
+                    ))
+                    number_rows += manager.cursor.rowcount
+                manager.commit()
+                manager.execute('DETACH DATABASE shard ;')
+                DatabaseShards.remove(shard_uri)
+        if len(os.listdir(self.get_shards_location())) == 0:
+            os.rmdir(self.get_shards_location())
+        logger.info('Merged %s rows.', number_rows)
@@ -0,0 +1,226 @@
+"""
+A persisted cache of the checksums of input files, verified once per pipeline run.
+"""
+import os
+from os.path import abspath
+import random
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from .columnar_cache import ColumnarCache
+from .database_context_utility import WaitingDatabaseContextManager
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class FileVerificationCache:
+    """
+    Records the SHA256 checksum of each input file in the pipeline database (see
+    :py:class:`PipelineDesign`), together with the size, modification time, and
+    inode of the file at the time. The files are hashed once, at job generation,
+    by a pool of threads (hashing releases the interpreter lock). Each job then
+    reuses the recorded checksum of its input file instead of hashing the file
+    again, unless one of these properties shows that the file has changed since.
+
+    The verification policy determines which files are hashed:
+
+    - ``full``: all files.
+    - ``sampled``: a random sample of the files, drawn with a seed which is logged
+      together with the files sampled, so that the sample can be reproduced. For the
+      others, the checksums in the file manifest are trusted.
+    - ``skip``: none. All checksums in the file manifest are trusted.
+
+    A recorded checksum, trusted or verified, is only used while the file is
+    unchanged. A file which has changed since it was recorded is hashed again under
+    any policy, since the checksum also identifies the parsed contents of the file
+    in the caches (see :py:class:`ColumnarCache`).
+    """
+    policies = ('full', 'sampled', 'skip')
+    table_name = 'file_verification'
+    header = [
+        ('Path', 'TEXT'),
+        ('Size', 'INTEGER'),
+        ('Modification_time', 'INTEGER'),
+        ('Inode', 'INTEGER'),
+        ('SHA256', 'CHAR(64)'),
+        ('Verified', 'INTEGER'),
+    ]
+
+    def __init__(self, uri, policy='full', sample_fraction=0.1, workers=None, seed=None):
+        """
+        :param uri: The pipeline database.
+        :type uri: str
+
+        :param policy: One of "full", "sampled", or "skip".
+        :type policy: str
+
+        :param sample_fraction: The fraction of files hashed under the "sampled"
+            policy (at least one file is hashed).
+        :type sample_fraction: float
+
+        :param workers: The number of hashing threads. By default, the number of
+            CPUs, up to 8.
+        :type workers: int
+
+        :param seed: The seed of the random sample of the "sampled" policy. By
+            default a seed is drawn, and logged.
+        :type seed: int
+        """
+        if not policy in FileVerificationCache.policies:
+            logger.error('Verification policy must be one of %s, got "%s".', FileVerificationCache.policies, policy)
+            raise ValueError
+        self.uri = uri
+        self.policy = policy
+        self.sample_fraction = sample_fraction
+        self.workers = workers if workers else min(8, os.cpu_count() or 1)
+        self.seed = seed
+
+    @staticmethod
+    def get_signature(filename):
+        """
+        :param filename: A file.
+        :type filename: str
+
+        :return: The absolute path, size, modification time (in nanoseconds), and
+            inode of the file.
+        :rtype: tuple
+        """
+        status = os.stat(filename)
+        return (abspath(filename), status.st_size, status.st_mtime_ns, status.st_ino)
+
+    def initialize_table(self):
+        """
+        Creates the table of records, replacing any previous one.
+        """
+        cmd = ' '.join([
+            'CREATE TABLE',
+            FileVerificationCache.table_name,
+            '(',
+            'id INTEGER PRIMARY KEY AUTOINCREMENT,',
+            ' , '.join([
+                column_name + ' ' + data_type for column_name, data_type in FileVerificationCache.header
+            ]),
+            ');',
+        ])
+        with WaitingDatabaseContextManager(self.uri) as manager:
+            manager.execute('DROP TABLE IF EXISTS %s ;' % FileVerificationCache.table_name)
+            manager.execute(cmd)
+
+    def select_files_to_hash(self, filenames):
+        """
+        :param filenames: Input files.
+        :type filenames: list
+
+        :return: The files to hash under the policy.
+        :rtype: set
+        """
+        if self.policy == 'full':
+            return set(filenames)
+        if self.policy == 'skip' or len(filenames) == 0:
+            return set()
+        number = max(1, math.ceil(self.sample_fraction * len(filenames)))
+        seed = self.seed if self.seed is not None else random.randrange(pow(2, 32))
+        sample = random.Random(seed).sample(sorted(filenames), min(number, len(filenames)))
+        logger.info('Sampled files to hash with seed %s: %s', seed, ', '.join(sorted(sample)))
+        return set(sample)
+
+    def fill(self, expected_checksums):
+        """
+        Replaces the records with those of the given files, hashing the files
+        selected by the policy in parallel.
+
+        :param expected_checksums: The SHA256 checksums listed in the file manifest,
+            keyed by file.
+        :type expected_checksums: dict
+        """
+        self.initialize_table()
+        signatures = {}
+        for filename in expected_checksums:
+            try:
+                signatures[filename] = FileVerificationCache.get_signature(filename)
+            except FileNotFoundError:
+                logger.error('Input file %s does not exist.', filename)
+        to_hash = sorted(self.select_files_to_hash(list(signatures.keys())))
+        logger.info(
+            'Hashing %s of %s input files (verification policy "%s").',
+            len(to_hash),
+            len(signatures),
+            self.policy,
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            checksums = dict(zip(to_hash, executor.map(ColumnarCache.compute_sha256, to_hash)))
+
+        rows = []
+        for filename, signature in signatures.items():
+            expected = expected_checksums[filename]
+            if filename in checksums:
+                if checksums[filename] != expected:
+                    logger.error(
+                        'File "%s" has wrong SHA256 hash (%s ; expected %s).',
+                        filename,
+                        checksums[filename],
+                        expected,
+                    )
+                rows.append(signature + (checksums[filename], 1))
+            else:
+                rows.append(signature + (expected, 0))
+        with WaitingDatabaseContextManager(self.uri) as manager:
+            manager.bulk_insert(
+                FileVerificationCache.table_name,
+                FileVerificationCache.header,
+                list(zip(*rows)) if len(rows) > 0 else [[] for _ in FileVerificationCache.header],
+            )
+
+    def get_record(self, filename):
+        """
+        :param filename: A file.
+        :type filename: str
+
+        :return: The recorded signature (see :py:meth:`get_signature`), checksum, and
+            verification flag of the file, or None if there is no record.
+        :rtype: tuple
+        """
+        column_names = ' , '.join([column_name for column_name, _ in FileVerificationCache.header])
+        cmd = 'SELECT %s FROM %s WHERE Path = ? ;' % (column_names, FileVerificationCache.table_name)
+        with WaitingDatabaseContextManager(self.uri) as manager:
+            table_exists = manager.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name='%s' ;" % FileVerificationCache.table_name
+            )[0][0] > 0
+            if not table_exists:
+                return None
+            rows = manager.retry(
+                lambda: manager.cursor.execute(cmd, (abspath(filename),)).fetchall(),
+                cmd,
+            )
+        return rows[0] if len(rows) > 0 else None
+
+    def get_sha256(self, filename):
+        """
+        :param filename: A file.
+        :type filename: str
+
+        :return: The checksum of the file, either as recorded, if the file has not
+            changed, or else newly computed. A record of a changed file is updated.
+        :rtype: str
+        """
+        record = self.get_record(filename)
+        if record is None:
+            return ColumnarCache.compute_sha256(filename)
+        signature = FileVerificationCache.get_signature(filename)
+        recorded_signature, sha256 = tuple(record[0:4]), record[4]
+        if recorded_signature == signature:
+            return sha256
+        logger.info('File %s changed since it was recorded; hashing it again.', filename)
+        sha256 = ColumnarCache.compute_sha256(filename)
+        with WaitingDatabaseContextManager(self.uri) as manager:
+            manager.execute_many(
+                'DELETE FROM %s WHERE Path = ? ;' % FileVerificationCache.table_name,
+                [(signature[0],)],
+            )
+            manager.bulk_insert(
+                FileVerificationCache.table_name,
+                FileVerificationCache.header,
+                [[value] for value in signature + (sha256, 1)],
+            )
+        return sha256
@@ -0,0 +1,99 @@
+"""
+Replacement of field of view descriptors in cell tables by integer indices.
+"""
+import pandas as pd
+import numpy as np
+
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class FOVIndexing:
+    """
+    The result of indexing the fields of view of one cell table, in one pass over
+    the field of view column. The indices are assigned in sorted order of the
+    descriptors, and the rows of the table are (stably) reordered so that the cells
+    of each field of view form a contiguous range of rows.
+    """
+    def __init__(self, table, fov_column, descriptors=None):
+        """
+        :param table: Table of cells, with a field of view descriptor column (strings
+            or categorical values). Not modified.
+        :type table: pandas.DataFrame
+
+        :param fov_column: The name of the field of view descriptor column.
+        :type fov_column: str
+
+        :param descriptors: (Optional) The sorted descriptors of all the fields of view
+            of the file, when the table is only a part of it (see
+            :py:class:`FOVChunkReader`). The indices are then positions in this list, so
+            that they agree between the parts. Only the fields of view present in the
+            table are included in the lookup and ranges.
+        :type descriptors: list
+        """
+        if descriptors is None:
+            codes, uniques = pd.factorize(table[fov_column], sort=True)
+            uniques = [str(fov) for fov in uniques]
+        else:
+            uniques = list(descriptors)
+            codes = pd.Categorical(
+                table[fov_column].astype(str),
+                categories=uniques,
+            ).codes.astype(np.int64)
+        if np.any(codes < 0):
+            logger.error('Some cells have no field of view descriptor (column "%s").', fov_column)
+            raise ValueError
+        order = np.argsort(codes, kind='stable')
+        self.table = table.take(order)
+        self.table.reset_index(drop=True, inplace=True)
+        self.table[fov_column] = codes[order]
+        counts = np.bincount(codes, minlength=len(uniques))
+        boundaries = np.concatenate([[0], np.cumsum(counts)])
+        present = [i for i in range(len(uniques)) if counts[i] > 0]
+        self.fov_lookup = {i : uniques[i] for i in present}
+        self.ranges = {i : (int(boundaries[i]), int(boundaries[i+1])) for i in present}
+
+    def get_table(self):
+        """
+        :return: The whole table, sorted by field of view, with descriptors replaced by
+            integer indices.
+        :rtype: pandas.DataFrame
+        """
+        return self.table
+
+    def get_fov_lookup(self):
+        """
+        :return: The field of view descriptor for each integer index.
+        :rtype: dict
+        """
+        return self.fov_lookup
+
+    def get_ranges(self):
+        """
+        :return: For each integer index, the (start, stop) range of the rows of the
+            field of view in the sorted table.
+        :rtype: dict
+        """
+        return self.ranges
+
+    def get_fov_tables(self, table=None):
+        """
+        :param table: A table with the same rows as :py:meth:`get_table`, e.g. derived
+            from it by selecting or adding columns. By default, the sorted table
+            itself.
+        :type table: pandas.DataFrame
+
+        :return: The sub-table of each field of view, keyed by integer index. These are
+            views into ``table`` (their data is not copied), each with its own index
+            starting at 0; they should not be modified.
+        :rtype: dict
+        """
+        if table is None:
+            table = self.table
+        fov_tables = {}
+        for fov_index, (start, stop) in self.ranges.items():
+            fov_table = table.iloc[start:stop]
+            fov_table.index = pd.RangeIndex(stop - start)
+            fov_tables[fov_index] = fov_table
+        return fov_tables
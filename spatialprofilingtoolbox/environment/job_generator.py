@@ -1,6 +1,7 @@
 import os
-from os.path import join, exists, abspath
+from os.path import join, exists, abspath, isdir
 import re
+import shutil
 import hashlib
 from enum import Enum, auto
 import sqlite3
@@ -9,6 +10,8 @@ import pandas as pd
 
 from .settings_wrappers import JobsPaths, RuntimeEnvironmentSettings, DatasetSettings
 from .pipeline_design import PipelineDesign
+from .database_context_utility import WaitingDatabaseContextManager
+from .file_verification import FileVerificationCache
 from .log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -53,6 +56,8 @@ class JobGenerator:
         file_manifest_file: str=None,
         outcomes_file: str=None,
         excluded_hostname: str='NO_EXCLUDED_HOSTNAME',
+        integrity_check: str='full',
+        integrity_check_seed: int=None,
     ):
         """
         Args:
@@ -84,6 +89,12 @@ class JobGenerator:
                 sample identifiers (first column).
             excluded_hostname (str):
                 The name of a host to avoid deploying to (e.g. a control node).
+            integrity_check (str):
+                The policy for verifying the checksums of input files, "full",
+                "sampled", or "skip". See ``FileVerificationCache``.
+            integrity_check_seed (int):
+                The seed of the random sample of files hashed under the "sampled"
+                policy, to reproduce a previous sample. By default a seed is drawn.
         """
         outcomes_file = outcomes_file if outcomes_file != 'None' else None
         self.jobs_paths = JobsPaths(
@@ -106,6 +117,8 @@ class JobGenerator:
         self.file_metadata = pd.read_csv(self.dataset_settings.file_manifest_file, sep='\t')
         self.pipeline_design = PipelineDesign()
         self.excluded_hostname = excluded_hostname
+        self.integrity_check = integrity_check
+        self.integrity_check_seed = int(integrity_check_seed) if integrity_check_seed is not None else None
 
     def generate(self):
         """
@@ -114,13 +127,30 @@ class JobGenerator:
         It generates jobs involving input files and write to the jobs subdirectory. Also
         writes scripts that schedule the jobs.
         """
+        self.set_pipeline_database_journal_mode()
         self.initialize_job_activity_table()
         self.populate_file_metadata_table()
+        self.populate_file_verification_table()
         self.gather_input_info()
         self.clean_directory_area()
         self.generate_all_jobs()
         self.generate_scheduler_scripts()
 
+    def set_pipeline_database_journal_mode(self):
+        """
+        Puts the database accessible to all jobs in WAL journal mode for local runs,
+        in which all jobs run on this host. Otherwise, for jobs on several hosts
+        sharing the database over a network filesystem, puts it in the default
+        rollback journal mode. The mode persists in the database file, so jobs
+        connect without setting it.
+        """
+        if self.runtime_settings.runtime_platform == 'local':
+            journal_mode = 'WAL'
+        else:
+            journal_mode = 'DELETE'
+        with WaitingDatabaseContextManager(self.pipeline_design.get_database_uri(), journal_mode=journal_mode):
+            pass
+
     def initialize_job_activity_table(self):
         """
         Creates a `job_activity` table with which jobs may advertise their running
@@ -150,21 +180,6 @@ class JobGenerator:
         """
         header = JobGenerator.cached_file_metadata_header
 
-        connection = sqlite3.connect(self.pipeline_design.get_database_uri())
-        cursor = connection.cursor()
-        cursor.execute('DROP TABLE IF EXISTS file_metadata ;')
-        cmd = ' '.join([
-            'CREATE TABLE',
-            'file_metadata',
-            '(',
-            'id INTEGER PRIMARY KEY AUTOINCREMENT,',
-            ' , '.join([
-                column_name + ' ' + data_type_descriptor for column_name, data_type_descriptor in header
-            ]),
-            ');',
-        ])
-        cursor.execute(cmd)
-
         file_metadata = self.file_metadata
         for i, row in file_metadata.iterrows():
             file_id = row['File ID']
@@ -176,25 +191,43 @@ class JobGenerator:
                 logger.error('Checksum for file with id "%s" is not SHA256. Cannot check file integrity.', file_id)
             if not re.match('^[a-f0-9]{64}$', sha256):
                 logger.error('SHA256 checksum %s for file with id "%s" is malformed.', sha256, file_id)
-            values_str = ', '.join([
-                '"' + file_id + '"',
-                '"' + sample_id + '"',
-                '"' + sha256 + '"',
-                '"' + filename + '"',
-                '"' + datatype + '"',
-            ])
-            cmd = ' '.join([
-                'INSERT INTO',
-                'file_metadata',
-                '( ' + ', '.join([column_name for column_name, dtype in header]) + ' )',
-                'VALUES',
-                '( ' + values_str + ' );'
+
+        cmd = ' '.join([
+            'CREATE TABLE',
+            'file_metadata',
+            '(',
+            'id INTEGER PRIMARY KEY AUTOINCREMENT,',
+            ' , '.join([
+                column_name + ' ' + data_type_descriptor for column_name, data_type_descriptor in header
+            ]),
+            ');',
+        ])
+        with WaitingDatabaseContextManager(self.pipeline_design.get_database_uri()) as manager:
+            manager.execute('DROP TABLE IF EXISTS file_metadata ;')
+            manager.execute(cmd)
+            manager.bulk_insert('file_metadata', header, [
+                file_metadata['File ID'],
+                file_metadata['Sample ID'],
+                file_metadata['Checksum'],
+                file_metadata['File name'],
+                file_metadata['Data type'],
             ])
-            cursor.execute(cmd)
 
-        cursor.close()
-        connection.commit()
-        connection.close()
+    def populate_file_verification_table(self):
+        """
+        Hashes the input files, according to the integrity check policy, once for all
+        jobs. See ``FileVerificationCache``.
+        """
+        expected_checksums = {
+            abspath(join(self.dataset_settings.input_path, row['File name'])) : row['Checksum']
+            for _, row in self.file_metadata.iterrows()
+        }
+        cache = FileVerificationCache(
+            self.pipeline_design.get_database_uri(),
+            policy=self.integrity_check,
+            seed=self.integrity_check_seed,
+        )
+        cache.fill(expected_checksums)
 
     def clean_directory_area(self):
         """
@@ -221,7 +254,10 @@ class JobGenerator:
         else:
             files = os.listdir(path)
             for file in files:
-                os.remove(join(path, file))
+                if isdir(join(path, file)):
+                    shutil.rmtree(join(path, file))
+                else:
+                    os.remove(join(path, file))
 
     def register_job_existence(self):
         """
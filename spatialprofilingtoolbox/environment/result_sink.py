@@ -0,0 +1,477 @@
+"""
+An optional single-writer process for the results of jobs running concurrently on
+one host.
+"""
+import os
+from os.path import abspath, basename, dirname, exists, join
+import threading
+import queue
+import time
+import sqlite3
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, answer_challenge, deliver_challenge
+
+from .database_context_utility import WaitingDatabaseContextManager
+from .log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
+
+
+class ResultSink:
+    """
+    A local daemon which owns the connection to a pipeline-specific database. Jobs
+    running on the same host submit their rows over a Unix socket (see
+    :py:class:`ResultSinkClient`) and continue computing, instead of each
+    contending for the database lock. The sink gathers the submissions arriving
+    within a short interval into one large transaction, and acknowledges each
+    submission to its job once committed.
+
+    It is started with ``spt-result-sink`` after job generation, and stopped once
+    all jobs have completed. Jobs which find no sink serving the database write
+    their own shards as usual (see :py:class:`DatabaseShards`).
+
+    The socket and a random key are kept in a directory next to the database which
+    only the owner may access, and connections are authenticated with the key
+    before any message is read. Jobs submit a table name, column names, and values;
+    the sink builds the INSERT statement itself, for the tables and columns of the
+    computational design only.
+    """
+    directory_suffix = '.sink'
+
+    def __init__(self, uri, tables, batch_rows=200000, linger_seconds=0.5):
+        """
+        :param uri: The pipeline-specific database.
+        :type uri: str
+
+        :param tables: The names of the columns which may be filled, keyed by table
+            name. See ``ComputationalDesign.get_result_tables``.
+        :type tables: dict
+
+        :param batch_rows: The number of rows after which a transaction is committed
+            without waiting for further submissions.
+        :type batch_rows: int
+
+        :param linger_seconds: The time to wait for further submissions after the
+            first submission of a transaction.
+        :type linger_seconds: float
+        """
+        self.uri = uri
+        self.tables = tables
+        self.batch_rows = batch_rows
+        self.linger_seconds = linger_seconds
+        self.submissions = queue.Queue()
+        self.stopping = threading.Event()
+        self.key = None
+
+    @staticmethod
+    def get_directory(uri):
+        """
+        :param uri: A database file.
+        :type uri: str
+
+        :return: The directory, next to the database, of the socket and key of a sink
+            serving the database.
+        :rtype: str
+        """
+        return join(dirname(abspath(uri)), '.' + basename(uri) + ResultSink.directory_suffix)
+
+    @staticmethod
+    def get_address(uri):
+        """
+        :param uri: A database file.
+        :type uri: str
+
+        :return: The Unix socket on which a sink serving the database listens.
+        :rtype: str
+        """
+        return join(ResultSink.get_directory(uri), 'socket')
+
+    @staticmethod
+    def get_key_file(uri):
+        """
+        :param uri: A database file.
+        :type uri: str
+
+        :return: The file of the key with which connections to the sink serving the
+            database are authenticated.
+        :rtype: str
+        """
+        return join(ResultSink.get_directory(uri), 'key')
+
+    @staticmethod
+    def read_key(uri):
+        """
+        :param uri: A database file.
+        :type uri: str
+
+        :return: The key of the sink serving the database, or None if there is none
+            readable.
+        :rtype: bytes
+        """
+        try:
+            with open(ResultSink.get_key_file(uri), 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    @staticmethod
+    def connect(uri):
+        """
+        :param uri: A database file.
+        :type uri: str
+
+        :return: An authenticated connection to the sink serving the database, or
+            None if there is no such sink (or it cannot be connected to).
+        :rtype: multiprocessing.connection.Connection
+        """
+        key = ResultSink.read_key(uri)
+        if key is None:
+            return None
+        try:
+            return Client(ResultSink.get_address(uri), family='AF_UNIX', authkey=key)
+        except (OSError, EOFError, AuthenticationError):
+            return None
+
+    @staticmethod
+    def stop(uri):
+        """
+        Asks the sink serving the database, if any, to commit all submissions
+        received so far and exit.
+
+        :param uri: A database file.
+        :type uri: str
+
+        :return: Whether a sink was found.
+        :rtype: bool
+        """
+        connection = ResultSink.connect(uri)
+        if connection is None:
+            return False
+        connection.send(('stop',))
+        connection.close()
+        return True
+
+    def serve(self):
+        """
+        Accepts submissions and writes them until stopped.
+        """
+        address = ResultSink.get_address(self.uri)
+        if ResultSink.is_serving(self.uri):
+            logger.error('A result sink is already serving %s.', self.uri)
+            raise ValueError
+        directory = ResultSink.get_directory(self.uri)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.chmod(directory, 0o700)
+        if exists(address):
+            os.remove(address)
+        self.key = os.urandom(32)
+        descriptor = os.open(ResultSink.get_key_file(self.uri), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(descriptor, 0o600)
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(self.key)
+        listener = Listener(address, family='AF_UNIX')
+        os.chmod(address, 0o600)
+        acceptor = threading.Thread(target=self.accept, args=(listener,), daemon=True)
+        acceptor.start()
+        logger.info('Result sink for %s listening on %s.', self.uri, address)
+        try:
+            self.write_submissions()
+        finally:
+            self.stopping.set()
+            try:
+                Client(address, family='AF_UNIX').close()
+            except OSError:
+                pass
+            acceptor.join(timeout=self.linger_seconds + 5)
+            listener.close()
+            os.remove(ResultSink.get_key_file(self.uri))
+            os.rmdir(directory)
+        logger.info('Result sink for %s stopped.', self.uri)
+
+    @staticmethod
+    def is_serving(uri):
+        """
+        :param uri: A database file.
+        :type uri: str
+
+        :return: Whether a sink is listening for submissions for the database.
+        :rtype: bool
+        """
+        connection = ResultSink.connect(uri)
+        if connection is None:
+            return False
+        connection.close()
+        return True
+
+    def accept(self, listener):
+        """
+        Accepts connections from jobs until the sink stops, receiving on each in a
+        separate thread. On stopping, the sink connects once more to end the wait
+        for a connection.
+
+        :param listener: The listener on the sink's socket.
+        :type listener: multiprocessing.connection.Listener
+        """
+        while True:
+            try:
+                connection = listener.accept()
+            except OSError:
+                return
+            if self.stopping.is_set():
+                connection.close()
+                return
+            threading.Thread(target=self.receive, args=(connection,), daemon=True).start()
+
+    def receive(self, connection):
+        """
+        Authenticates one connection with the key of the sink, in both directions
+        and before any message is read, then queues the submissions arriving on it.
+        Connections which fail to authenticate are dropped.
+
+        :param connection: A connection from one job.
+        :type connection: multiprocessing.connection.Connection
+        """
+        try:
+            deliver_challenge(connection, self.key)
+            answer_challenge(connection, self.key)
+        except (AuthenticationError, EOFError, OSError):
+            logger.warning('Refused a connection to the result sink for %s which failed to authenticate.', self.uri)
+            connection.close()
+            return
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == 'stop':
+                self.stopping.set()
+                self.submissions.put(None)
+                return
+            self.submissions.put((connection, message))
+
+    def write_submissions(self):
+        """
+        Writes batches of queued submissions over one connection to the database, in
+        write-ahead log mode since readers and the sink share the host, until stopped
+        and all submissions are written.
+        """
+        with WaitingDatabaseContextManager(self.uri, journal_mode='WAL') as manager:
+            while not (self.stopping.is_set() and self.submissions.empty()):
+                batch = self.collect_batch()
+                if len(batch) > 0:
+                    self.write_batch(manager, batch)
+
+    def collect_batch(self):
+        """
+        :return: The submissions received until ``linger_seconds`` after the first
+            one, or until ``batch_rows`` rows, whichever comes first.
+        :rtype: list
+        """
+        batch = []
+        number_rows = 0
+        deadline = None
+        while number_rows < self.batch_rows:
+            timeout = self.linger_seconds if deadline is None else deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                submission = self.submissions.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if submission is None:
+                if deadline is None:
+                    break
+                continue
+            if deadline is None:
+                deadline = time.perf_counter() + self.linger_seconds
+            batch.append(submission)
+            columns = submission[1][4]
+            number_rows += len(columns[0]) if len(columns) > 0 else 0
+        return batch
+
+    def get_insert_statement(self, message):
+        """
+        :param message: A submission message.
+        :type message: tuple
+
+        :return: The INSERT statement for the submission, or None if the table, the
+            columns, or the values are not those of the computational design.
+        :rtype: str
+        """
+        _, _, table_name, column_names, columns = message
+        known_columns = self.tables.get(table_name)
+        if known_columns is None:
+            return None
+        if len(set(column_names)) != len(column_names) or not set(column_names) <= set(known_columns):
+            return None
+        if len(columns) != len(column_names) or len(set(len(column) for column in columns)) > 1:
+            return None
+        return WaitingDatabaseContextManager.get_insert_statement(table_name, column_names)
+
+    def write_batch(self, manager, batch):
+        """
+        Writes a batch of submissions in one transaction and acknowledges them.
+        Submissions for unknown tables or columns are rejected without being
+        written. If the transaction fails, the submissions are retried one at a
+        time, so that only the failing ones are rejected.
+
+        :param manager: The connection owned by the sink.
+        :type manager: WaitingDatabaseContextManager
+
+        :param batch: Pairs of connection and submission message.
+        :type batch: list
+        """
+        errors = [None for _ in batch]
+        statements = []
+        for i, (_, message) in enumerate(batch):
+            cmd = self.get_insert_statement(message)
+            if cmd is None:
+                errors[i] = 'Table or columns not accepted: %s %s' % (message[2], message[3])
+            else:
+                statements.append((i, cmd, message[4]))
+        try:
+            self.write_transaction(manager, statements)
+        except sqlite3.Error:
+            manager.connection.rollback()
+            for statement in statements:
+                try:
+                    self.write_transaction(manager, [statement])
+                except sqlite3.Error as exception:
+                    manager.connection.rollback()
+                    errors[statement[0]] = str(exception)
+        for (connection, message), error in zip(batch, errors):
+            identifier = message[1]
+            try:
+                if error is None:
+                    connection.send(('committed', identifier))
+                else:
+                    connection.send(('failed', identifier, error))
+            except OSError:
+                logger.warning('Job disconnected before submission %s was acknowledged.', identifier)
+
+    def write_transaction(self, manager, statements):
+        """
+        Inserts the rows of the given submissions and commits, retrying while the
+        database is locked.
+
+        :param manager: The connection owned by the sink.
+        :type manager: WaitingDatabaseContextManager
+
+        :param statements: Triples of submission index in the batch, INSERT
+            statement, and columns of values.
+        :type statements: list
+        """
+        def operation():
+            for _, cmd, columns in statements:
+                manager.cursor.executemany(cmd, zip(*columns))
+            manager.connection.commit()
+        manager.retry(operation, 'batch of %s submissions' % len(statements), rollback=True)
+        logger.debug('Committed %s submissions.', len(statements))
+
+
+class ResultSinkClient:
+    """
+    The connection of one job to a :py:class:`ResultSink`. It offers the
+    ``bulk_insert`` method of :py:class:`WaitingDatabaseContextManager`, which
+    returns as soon as the rows are sent. One client is kept per database for the
+    lifetime of the process; :py:meth:`wait_all` waits until all rows sent are
+    committed.
+    """
+    clients = {}
+
+    def __init__(self, connection):
+        """
+        :param connection: A connection to the sink.
+        :type connection: multiprocessing.connection.Connection
+        """
+        self.connection = connection
+        self.pending = set()
+        self.next_identifier = 0
+
+    @staticmethod
+    def get_client(uri):
+        """
+        :param uri: A database file.
+        :type uri: str
+
+        :return: A client of the sink serving the database, or None if there is no
+            such sink.
+        :rtype: ResultSinkClient
+        """
+        address = ResultSink.get_address(uri)
+        if not address in ResultSinkClient.clients:
+            connection = ResultSink.connect(uri)
+            if connection is None:
+                return None
+            ResultSinkClient.clients[address] = ResultSinkClient(connection)
+        return ResultSinkClient.clients[address]
+
+    @staticmethod
+    def wait_all():
+        """
+        Waits until all rows sent by this process are committed, then closes the
+        connections.
+        """
+        for address in list(ResultSinkClient.clients.keys()):
+            client = ResultSinkClient.clients.pop(address)
+            try:
+                client.wait()
+            finally:
+                client.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        pass
+
+    def bulk_insert(self, table_name, header, batch):
+        """
+        Sends a batch of rows to the sink. See
+        :py:meth:`WaitingDatabaseContextManager.bulk_insert`.
+
+        :return: The number of rows sent.
+        :rtype: int
+        """
+        _, columns = WaitingDatabaseContextManager.prepare_insert(table_name, header, batch)
+        column_names = [entry if isinstance(entry, str) else entry[0] for entry in header]
+        identifier = self.next_identifier
+        self.next_identifier += 1
+        self.connection.send(('insert', identifier, table_name, column_names, columns))
+        self.pending.add(identifier)
+        while self.connection.poll():
+            self.receive_acknowledgement()
+        return len(columns[0]) if len(columns) > 0 else 0
+
+    def wait(self):
+        """
+        Waits until all rows sent by this client are committed.
+        """
+        while len(self.pending) > 0:
+            self.receive_acknowledgement()
+
+    def receive_acknowledgement(self):
+        """
+        Waits for the acknowledgement of one submission.
+        """
+        message = self.connection.recv()
+        self.pending.discard(message[1])
+        if message[0] == 'failed':
+            logger.error('Result sink failed to write submission %s: %s', message[1], message[2])
+            raise ValueError
+
+
+def open_result_writer(uri):
+    """
+    :param uri: A database file.
+    :type uri: str
+
+    :return: A client of the result sink serving the database if there is one,
+        otherwise a direct connection. Either is used in a "with ... as" construct
+        and offers ``bulk_insert``.
+    :rtype: ResultSinkClient or WaitingDatabaseContextManager
+    """
+    client = ResultSinkClient.get_client(uri)
+    if client is not None:
+        return client
+    return WaitingDatabaseContextManager(uri)
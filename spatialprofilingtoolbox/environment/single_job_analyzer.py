@@ -3,10 +3,12 @@ from os.path import join, abspath
 import functools
 from functools import lru_cache
 import re
-import hashlib
 
+from .file_verification import FileVerificationCache
 from .job_generator import JobActivity
 from .database_context_utility import WaitingDatabaseContextManager
+from .database_shards import DatabaseShards
+from .result_sink import ResultSinkClient
 from .pipeline_design import PipelineDesign
 from .settings_wrappers import JobsPaths, DatasetSettings
 from .log_formats import colorized_logger
@@ -82,6 +84,7 @@ class SingleJobAnalyzer:
         self.input_file_identifier = input_file_identifier
         self.job_index = int(job_index)
         self.pipeline_design = PipelineDesign()
+        self.input_file_hashes = {}
 
     def get_pipeline_database_uri(self):
         """
@@ -89,6 +92,25 @@ class SingleJobAnalyzer:
         """
         return self.pipeline_design.get_database_uri()
 
+    @lru_cache(maxsize=1)
+    def get_job_database_uri(self):
+        """
+        Returns:
+            str:
+                The shard database (see ``DatabaseShards``) into which this job writes
+                its results, instead of the computational design's pipeline-specific
+                database. It is created on first use, with the same tables, and
+                marked complete when the job completes. If a result sink (see
+                ``ResultSink``) serves the pipeline-specific database, results are
+                submitted to the sink instead, and this is the pipeline-specific
+                database itself.
+        """
+        uri = join(self.jobs_paths.output_path, self.computational_design.get_database_uri())
+        if ResultSinkClient.get_client(uri) is not None:
+            logger.info('Submitting results to the result sink serving %s.', uri)
+            return uri
+        return DatabaseShards(uri).create_shard(self.get_job_index())
+
     def _calculate(self):
         """
         Abstract method, the implementation of which is the core/primary computation to
@@ -102,7 +124,25 @@ class SingleJobAnalyzer:
         """
         self.register_activity(JobActivity.RUNNING)
         self._calculate()
+        ResultSinkClient.wait_all()
+        uri = join(self.jobs_paths.output_path, self.computational_design.get_database_uri())
+        DatabaseShards(uri).complete_shard(self.get_job_index())
         self.register_activity(JobActivity.COMPLETE)
+        self.log_database_contention()
+
+    def log_database_contention(self):
+        """
+        Logs the number of retries and the time spent waiting for database locks by
+        this job (see ``WaitingDatabaseContextManager.get_statistics``).
+        """
+        statistics = WaitingDatabaseContextManager.get_statistics()
+        logger.info(
+            'Job %s waited %.2f seconds for database locks (%s retries over %s connections).',
+            self.get_job_index(),
+            statistics['lock wait seconds'],
+            statistics['retries'],
+            statistics['connections'],
+        )
 
     def retrieve_input_filename(self):
         self.get_input_filename()
@@ -153,21 +193,22 @@ class SingleJobAnalyzer:
             input_file = row[0]
             expected_sha256 = row[1]
             input_file = abspath(join(self.dataset_settings.input_path, input_file))
-
-            buffer_size = 65536
-            sha = hashlib.sha256()
-            with open(input_file, 'rb') as f:
-                while True:
-                    data = f.read(buffer_size)
-                    if not data:
-                        break
-                    sha.update(data)
-            sha256 = sha.hexdigest()
-
+            sha256 = FileVerificationCache(self.get_pipeline_database_uri()).get_sha256(input_file)
+            self.input_file_hashes[input_file] = sha256
             if sha256 != expected_sha256:
                 logger.error('File "%s" has wrong SHA256 hash (%s ; expected %s).', input_file_identifier, sha256, expected_sha256)
             return input_file
 
+    def get_input_file_sha256(self):
+        """
+        Returns:
+            str:
+                The SHA256 hash of the contents of this job's input file, as computed
+                during lookup of the filename. Used to key the columnar cache of parsed
+                input files (see ``ColumnarCache``).
+        """
+        return self.input_file_hashes.get(self.get_input_filename())
+
     @lru_cache(maxsize=1)
     def get_sample_identifier(self):
         """
@@ -3,8 +3,8 @@ The parallelizable, job-level analysis stage of the cell phenotype density
 analysis workflow.
 """
 from os.path import join, abspath
-import hashlib
 
+from ...environment.file_verification import FileVerificationCache
 from ...environment.single_job_analyzer import SingleJobAnalyzer
 from ...environment.database_context_utility import WaitingDatabaseContextManager
 from ...environment.log_formats import colorized_logger
@@ -23,6 +23,7 @@ class DensityAnalyzer(SingleJobAnalyzer):
         complex_phenotypes_file: str=None,
         job_index: int=0,
         skip_integrity_check=False,
+        chunk_size: int=None,
         **kwargs,
     ):
         """
@@ -31,6 +32,9 @@ class DensityAnalyzer(SingleJobAnalyzer):
         :param complex_phenotypes_file: The table of composite phenotypes to be
             considered.
         :type complex_phenotypes_file: str
+
+        :param chunk_size: See :py:class:`DensityCalculator`.
+        :type chunk_size: int
         """
         super().__init__(job_index=job_index, **kwargs)
         self.dataset_design = dataset_design
@@ -41,10 +45,12 @@ class DensityAnalyzer(SingleJobAnalyzer):
         sample_identifiers_by_file = self.retrieve_cell_input_file_info(skip_integrity_check)
         self.calculator = DensityCalculator(
             sample_identifiers_by_file = sample_identifiers_by_file,
+            input_file_hashes = self.input_file_hashes,
             jobs_paths = self.jobs_paths,
             dataset_settings = self.dataset_settings,
             dataset_design = self.dataset_design,
             computational_design = self.computational_design,
+            chunk_size = chunk_size,
         )
         logger.info('Job started.')
         logger.info('Note: The "density" workflow operates as a single job.')
@@ -71,6 +77,7 @@ class DensityAnalyzer(SingleJobAnalyzer):
         if skip_integrity_check:
             logger.info('Skipping file integrity checks.')
 
+        verification = FileVerificationCache(self.get_pipeline_database_uri())
         sample_identifiers_by_file = {}
         for row in result:
             if row[3] != self.dataset_design.get_cell_manifest_descriptor():
@@ -81,15 +88,8 @@ class DensityAnalyzer(SingleJobAnalyzer):
             input_file = abspath(join(self.dataset_settings.input_path, input_file))
 
             if not skip_integrity_check:
-                buffer_size = 65536
-                sha = hashlib.sha256()
-                with open(input_file, 'rb') as file:
-                    while True:
-                        data = file.read(buffer_size)
-                        if not data:
-                            break
-                        sha.update(data)
-                sha256 = sha.hexdigest()
+                sha256 = verification.get_sha256(input_file)
+                self.input_file_hashes[input_file] = sha256
                 if sha256 != expected_sha256:
                     logger.error(
                         'File "%s" has wrong SHA256 hash (%s ; expected %s).',
@@ -97,5 +97,7 @@ class DensityAnalyzer(SingleJobAnalyzer):
                         sha256,
                         expected_sha256,
                     )
+            else:
+                self.input_file_hashes[input_file] = expected_sha256
             sample_identifiers_by_file[input_file] = sample_identifier
         return sample_identifiers_by_file
@@ -126,6 +126,16 @@ class DensityDesign(ComputationalDesign):
             ('fov_string', 'TEXT'),
         ]
 
+    def get_result_tables(self):
+        """
+        :return: The names of the columns which jobs fill, keyed by table name.
+        :rtype: dict
+        """
+        return {
+            'cells' : ['id'] + [column_name for column_name, _ in self.get_cells_header(style='sql')],
+            'fov_lookup' : [column_name for column_name, _ in self.get_fov_lookup_header()],
+        }
+
     def get_all_phenotype_signatures(self):
         """
         :return: The "signatures" for all the composite phenotypes described by the
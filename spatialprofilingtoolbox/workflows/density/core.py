@@ -3,14 +3,16 @@ The core calculator deals with pulling in cell data from all input data files,
 and pushing it into a pipeline-specific database.
 """
 from os.path import join
-import sqlite3
 
 import pandas as pd
+import numpy as np
 import scipy
 from scipy.spatial import KDTree
 
+from ...environment.columnar_cache import ColumnarCache
+from ...environment.cell_table_builder import CellTableBuilder
 from ...environment.settings_wrappers import JobsPaths, DatasetSettings
-from ...environment.database_context_utility import WaitingDatabaseContextManager
+from ...environment.result_sink import open_result_writer
 from ...environment.log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -23,16 +25,23 @@ class DensityCalculator:
     def __init__(
         self,
         sample_identifiers_by_file: dict=None,
+        input_file_hashes: dict=None,
         jobs_paths: JobsPaths=None,
         dataset_settings: DatasetSettings=None,
         dataset_design=None,
         computational_design=None,
+        chunk_size: int=None,
     ):
         """
         :param sample_identifers_by_file: Association of input data files to
             corresponding samples.
         :type sample_identifiers_by_file: dict
 
+        :param input_file_hashes: SHA256 hashes of the input data files, keyed by
+            filename, used to look up previously parsed files in the columnar cache.
+            Hashes not provided are computed as needed.
+        :type input_file_hashes: dict
+
         :param jobs_paths: Convenience bundle of filesystem paths pertinent to a
             particular run at the job level.
         :type jobs_paths: JobsPaths
@@ -45,12 +54,22 @@ class DensityCalculator:
 
         :param computational_design: Design object providing metadata specific to the
             density workflow.
+
+        :param chunk_size: If provided, input files are read in chunks of about this
+            many rows of whole fields of view (see :py:class:`FOVChunkReader`), and the
+            cells are written chunk by chunk, so that memory use does not depend on the
+            size of the input files. The cells of each field of view must be
+            consecutive rows of the input files.
+        :type chunk_size: int
         """
         self.sample_identifiers_by_file = sample_identifiers_by_file
+        self.input_file_hashes = input_file_hashes if input_file_hashes else {}
+        self.columnar_cache = ColumnarCache.get_job_cache(jobs_paths)
         self.output_path = jobs_paths.output_path
         self.outcomes_file = dataset_settings.outcomes_file
         self.dataset_design = dataset_design
         self.computational_design = computational_design
+        self.chunk_size = chunk_size
 
     def calculate_density(self):
         """
@@ -61,9 +80,15 @@ class DensityCalculator:
         """
         outcomes_dict = self.pull_in_outcome_data(self.outcomes_file)
         logger.info('Pulled outcome data, %s assignments.', len(outcomes_dict))
-        cells, fov_lookup = self.create_cell_table(outcomes_dict)
-        logger.info('Aggregated %s cells into table.', cells.shape[0])
-        self.write_cell_table(cells)
+        number_cells = 0
+        fov_lookup = {}
+        for sample_identifier, cell_table in self.get_cell_tables():
+            for i, fov in cell_table.fov_lookup.items():
+                fov_lookup[(sample_identifier, i)] = fov
+            cells = self.create_cell_group(sample_identifier, cell_table, outcomes_dict)
+            self.write_cell_table(cells, first_id=number_cells)
+            number_cells += cells.shape[0]
+        logger.info('Aggregated %s cells into table.', number_cells)
         self.write_fov_lookup_table(fov_lookup)
         logger.info('Finished writing cells and fov lookup helper.')
 
@@ -103,137 +128,121 @@ class DensityCalculator:
         pheno_names = sorted(signatures_by_name.keys())
         return pheno_names
 
-    def add_nearest_cell_data(self, table, compartment):
-        compartments = self.dataset_design.get_compartments()
-        cell_indices = list(table.index)
-        xmin, xmax, ymin, ymax = self.dataset_design.get_box_limit_column_names()
-        table['x value'] = 0.5 * (table[xmax] + table[xmin])
-        table['y value'] = 0.5 * (table[ymax] + table[ymin])
-        signature = self.dataset_design.get_compartmental_signature(table, compartment)
-        if sum(signature) == 0:
-            for i in range(len(cell_indices)):
-                I = cell_indices[i]
-                distance = -1
-                table.loc[I, 'distance to nearest cell ' + compartment] = distance
-        else:
-            compartment_cells = table[signature]
-            compartment_points = [
-                (row['x value'], row['y value'])
-                for i, row in compartment_cells.iterrows()
-            ]
-            all_points = [
-                (row['x value'], row['y value'])
-                for i, row in table.iterrows()
-            ]
-            tree = KDTree(compartment_points)
-            distances, indices = tree.query(all_points)
-            for i in range(len(cell_indices)):
-                I = cell_indices[i]
-                compartment_i = table.loc[I, 'compartment']
-                if compartment_i == compartment:
-                    distance = 0
-                if compartment_i not in compartments:
-                    distance = -1
-                else:
-                    distance = distances[i]
-                table.loc[I, 'distance to nearest cell ' + compartment] = distance
-
-    def create_cell_table(self, outcomes_dict):
+    @staticmethod
+    def get_nearest_cell_distances(points, in_compartment, assigned):
         """
-        :param outcomes_dict: Mapping from sample identifiers to outcome labels.
-        :type outcomes_dict: dict
+        :param points: The box centers of the cells of one field of view, one (x, y)
+            row per cell.
+        :type points: numpy.ndarray
 
-        :return:
-            - `cells`. Table of cell data.
-            - `fov_lookup`. FOV descriptor strings in terms of pairs (sample identifier,
-              FOV index integer).
-        :rtype: pandas.DataFrame, dict
-        """
-        pheno_names = self.get_phenotype_names()
+        :param in_compartment: Whether each cell matches the compartment signature.
+        :type in_compartment: numpy.ndarray
 
-        cell_groups = []
-        fov_lookup = {}
-        for filename, sample_identifier in self.sample_identifiers_by_file.items():
-            table_file = pd.read_csv(filename)
-            self.dataset_design.normalize_fov_descriptors(table_file)
+        :param assigned: Whether each cell is assigned to any compartment.
+        :type assigned: numpy.ndarray
 
-            col = self.dataset_design.get_FOV_column()
-            fovs = sorted(list(set(table_file[col])))
-            for i, fov in enumerate(fovs):
-                fov_lookup[(sample_identifier, i)] = fov
-                table_file.loc[table_file[col] == fov, col] = i
-
-            for _, table_fov in table_file.groupby(col):
-                table = table_fov.copy()
-                table = table.reset_index(drop=True)
-
-                if 'compartment' in table.columns:
-                    logger.error('Woops, name collision "compartment".')
-                    break
-                all_compartments = self.dataset_design.get_compartments()
-                table['compartment'] = 'Not in ' + ';'.join(all_compartments)
-
-                for compartment in self.dataset_design.get_compartments():
-                    signature = self.dataset_design.get_compartmental_signature(table, compartment)
-                    table.loc[signature, 'compartment'] = compartment
-
-                signatures_by_name = self.get_phenotype_signatures_by_name()
-                for name in pheno_names:
-                    signature = signatures_by_name[name]
-                    bools = self.dataset_design.get_pandas_signature(table, signature)
-                    ints = [1 if value else 0 for value in bools]
-                    table[name + ' membership'] = ints
-                phenotype_membership_columns = [name + ' membership' for name in pheno_names]
-
-                for compartment in all_compartments:
-                    self.add_nearest_cell_data(table, compartment)
-                nearest_cell_columns = ['distance to nearest cell ' + compartment for compartment in all_compartments]
-
-                table['sample_identifier'] = sample_identifier
-                table['outcome_assignment'] = outcomes_dict[sample_identifier]
-
-                pertinent_columns = [
-                    'sample_identifier',
-                    self.dataset_design.get_FOV_column(),
-                    'outcome_assignment',
-                    'compartment',
-                    self.dataset_design.get_cell_area_column(),
-                ] + phenotype_membership_columns + nearest_cell_columns
-
-                table = table[pertinent_columns]
-                table.rename(columns = {
-                    self.dataset_design.get_FOV_column() : 'fov_index',
-                    self.dataset_design.get_cell_area_column() : 'cell_area',
-                }, inplace=True)
-
-                header1 = self.computational_design.get_cells_header_variable_portion(
-                    style='readable',
-                )
-                header2 = self.computational_design.get_cells_header_variable_portion(
-                    style='sql',
+        :return: For each cell assigned to some compartment, the distance to the
+            nearest cell in the compartment. -1 for the other cells, or for all cells
+            if there are no cells in the compartment.
+        :rtype: numpy.ndarray
+        """
+        distances = np.full(points.shape[0], -1.0)
+        if np.any(in_compartment):
+            tree = KDTree(points[in_compartment])
+            nearest, _ = tree.query(points)
+            distances[assigned] = nearest[assigned]
+        return distances
+
+    def get_cell_tables(self):
+        """
+        :return: Pairs (sample identifier, cells), one for each input file or, if a
+            chunk size was given, for each chunk of each input file.
+        :rtype: generator
+        """
+        builder = CellTableBuilder(
+            dataset_design=self.dataset_design,
+            signatures_by_name=self.get_phenotype_signatures_by_name(),
+            cell_area=True,
+            columnar_cache=self.columnar_cache,
+        )
+        for filename, sample_identifier in self.sample_identifiers_by_file.items():
+            if self.chunk_size is None:
+                yield sample_identifier, builder.build(
+                    filename,
+                    sha256=self.input_file_hashes.get(filename),
                 )
-                table.rename(columns = {
-                    header1[i][0] : header2[i][0] for i in range(len(header1))
-                }, inplace=True)
+            else:
+                for cell_table in builder.iterate(filename, self.chunk_size):
+                    yield sample_identifier, cell_table
+            logger.debug('Cells parsed from file %s.', filename)
 
-                cell_groups.append(table)
-            logger.debug('%s cells parsed from file %s.', table_file.shape[0], filename)
-        logger.debug('Completed cell table collation.')
-        return pd.concat(cell_groups), fov_lookup
+    def create_cell_group(self, sample_identifier, cell_table, outcomes_dict):
+        """
+        :param sample_identifier: The sample of the cells.
+        :type sample_identifier: str
+
+        :param cell_table: The cells of one input file, or of a chunk of whole fields
+            of view of one input file.
+        :type cell_table: CellTable
 
-    def write_cell_table(self, cells):
+        :param outcomes_dict: Mapping from sample identifiers to outcome labels.
+        :type outcomes_dict: dict
+
+        :return: Table of cell data.
+        :rtype: pandas.DataFrame
+        """
+        pheno_names = self.get_phenotype_names()
+        all_compartments = self.dataset_design.get_compartments()
+        table = pd.DataFrame({
+            'sample_identifier' : sample_identifier,
+            'fov_index' : cell_table.table[self.dataset_design.get_FOV_column()].to_numpy(),
+            'outcome_assignment' : outcomes_dict[sample_identifier],
+            'compartment' : cell_table.get_compartment_labels(),
+            'cell_area' : cell_table.cell_areas,
+        })
+        for name in pheno_names:
+            table[name + ' membership'] = cell_table.get_membership(name).astype(int)
+
+        assigned = cell_table.compartment_codes < len(all_compartments)
+        for compartment in all_compartments:
+            in_compartment = cell_table.masks.get_mask(('compartment signature', compartment))
+            distances = np.empty(cell_table.get_number_cells())
+            for start, stop in cell_table.fov_ranges.values():
+                distances[start:stop] = self.get_nearest_cell_distances(
+                    cell_table.coordinates[start:stop],
+                    in_compartment[start:stop],
+                    assigned[start:stop],
+                )
+            table['distance to nearest cell ' + compartment] = distances
+
+        header1 = self.computational_design.get_cells_header_variable_portion(
+            style='readable',
+        )
+        header2 = self.computational_design.get_cells_header_variable_portion(
+            style='sql',
+        )
+        table.rename(columns = {
+            header1[i][0] : header2[i][0] for i in range(len(header1))
+        }, inplace=True)
+        logger.debug('%s cells in group from sample %s.', table.shape[0], sample_identifier)
+        return table
+
+    def write_cell_table(self, cells, first_id=0):
         """
         Writes cell table to database.
 
         :param cells: Table of cell areas with sample ID, outcome, etc.
         :type cells: pandas.DataFrame
+
+        :param first_id: The id of the first cell of the table, when the cells are
+            written in several parts.
+        :type first_id: int
         """
         uri = join(self.output_path, self.computational_design.get_database_uri())
-        connection = sqlite3.connect(uri)
-        cells.reset_index(drop=True, inplace=True)
-        cells.to_sql('cells', connection, if_exists='append', index_label='id')
-        connection.commit()
-        connection.close()
+        cells.index = pd.RangeIndex(first_id, first_id + cells.shape[0])
+        header = [('id', 'INTEGER')] + self.computational_design.get_cells_header(style='sql')
+        with open_result_writer(uri) as manager:
+            manager.bulk_insert('cells', header, cells.assign(id=cells.index))
 
     def write_fov_lookup_table(self, fov_lookup):
         """
@@ -243,22 +252,10 @@ class DensityCalculator:
             FOV descriptor strings.
         :type fov_lookup: dict
         """
-        keys_list = [
-            column_name for column_name, dtype in self.computational_design.get_fov_lookup_header()
-        ]
         uri = join(self.output_path, self.computational_design.get_database_uri())
-        with WaitingDatabaseContextManager(uri) as manager:
-            for (sample_identifier, fov_index), fov_string in fov_lookup.items():
-                values_list = [
-                    '"' + sample_identifier + '"',
-                    str(fov_index),
-                    '"' + fov_string + '"',
-                ]
-                keys = '( ' + ' , '.join(keys_list) + ' )'
-                values = '( ' + ' , '.join(values_list) + ' )'
-                cmd = 'INSERT INTO fov_lookup ' + keys + ' VALUES ' + values +  ' ;'
-                try:
-                    manager.execute(cmd)
-                except sqlite3.OperationalError as exception:
-                    logger.error('SQL query failed: %s', cmd)
-                    print(exception)
+        with open_result_writer(uri) as manager:
+            manager.bulk_insert('fov_lookup', self.computational_design.get_fov_lookup_header(), [
+                [sample_identifier for sample_identifier, _ in fov_lookup.keys()],
+                [fov_index for _, fov_index in fov_lookup.keys()],
+                list(fov_lookup.values()),
+            ])
@@ -44,6 +44,7 @@ singularity exec \
         elementary_phenotypes_file=None,
         complex_phenotypes_file=None,
         skip_integrity_check=False,
+        chunk_size: int=None,
         **kwargs,
     ):
         """
@@ -54,7 +55,18 @@ singularity exec \
         :param complex_phenotypes_file: Tabular file listing composite phenotypes to
             consider. See :py:mod:`spatialprofilingtoolbox.dataset_designs`.
         :type complex_phenotypes_file: str
+
+        :param chunk_size: The number of rows with which the job reads input files in
+            chunks, passed to the job. See :py:class:`DensityCalculator`.
+        :type chunk_size: int
+
+        :param skip_integrity_check: Whether to trust the checksums in the file
+            manifest, i.e. the "skip" integrity check policy of
+            :py:class:`JobGenerator`.
+        :type skip_integrity_check: bool
         """
+        if skip_integrity_check:
+            kwargs['integrity_check'] = 'skip'
         super().__init__(**kwargs)
         self.dataset_design = HALOCellMetadataDesign(
             elementary_phenotypes_file,
@@ -63,6 +75,7 @@ singularity exec \
             dataset_design=self.dataset_design,
             complex_phenotypes_file=complex_phenotypes_file,
         )
+        self.chunk_size = int(chunk_size) if chunk_size is not None else None
 
         self.lsf_job_filenames = []
         self.sh_job_filenames = []
@@ -99,6 +112,8 @@ singularity exec \
         bsub_job = contents
 
         cli_call = DensityJobGenerator.cli_call_template
+        if self.chunk_size is not None:
+            cli_call += ' --chunk-size %s ' % self.chunk_size
         bsub_job = re.sub('{{cli_call}}', cli_call, bsub_job)
 
         lsf_job_filename = join(self.jobs_paths.jobs_path, job_name + '.lsf')
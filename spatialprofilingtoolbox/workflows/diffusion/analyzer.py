@@ -4,7 +4,7 @@ import re
 
 from ...environment.single_job_analyzer import SingleJobAnalyzer
 from ...environment.job_generator import JobActivity
-from ...environment.database_context_utility import WaitingDatabaseContextManager
+from ...environment.result_sink import open_result_writer
 from ...environment.log_formats import colorized_logger
 from .integrator import DiffusionAnalysisIntegrator
 from .computational_design import DiffusionDesign
@@ -55,6 +55,7 @@ class DiffusionAnalyzer(SingleJobAnalyzer):
             dataset_design = self.dataset_design,
             computational_design = self.computational_design,
             jobs_paths = self.jobs_paths,
+            input_file_sha256 = self.get_input_file_sha256(),
         )
 
     def _calculate(self):
@@ -128,20 +129,20 @@ class DiffusionAnalyzer(SingleJobAnalyzer):
                 The elementary phenotype name for the context in which the values were
                 computed.
         """
-        if temporal_offset is None:
-            temporal_offset = 'NULL'
-
-        uri = join(self.jobs_paths.output_path, self.computational_design.get_database_uri())
-        with WaitingDatabaseContextManager(uri) as m:
-            for value in values:
-                m.execute(' '.join([
-                    'INSERT INTO',
-                    self.computational_design.get_diffusion_distances_table_name(),
-                    '(' + ', '.join(self.computational_design.get_probabilities_table_header()) + ')',
-                    'VALUES',
-                    '(' + str(value) +', "' + distance_type_str + '", ' + str(self.get_job_index()) + ', ' + str(temporal_offset) + ', ' + '"' + marker + '"' + ' ' + ');'
-                ]))
-            m.commit()
+        values = list(values)
+        number_values = len(values)
+        with open_result_writer(self.get_job_database_uri()) as m:
+            m.bulk_insert(
+                self.computational_design.get_diffusion_distances_table_name(),
+                self.computational_design.get_probabilities_table_header(),
+                [
+                    [float(value) for value in values],
+                    [distance_type_str] * number_values,
+                    [self.get_job_index()] * number_values,
+                    [temporal_offset] * number_values,
+                    [marker] * number_values,
+                ],
+            )
 
     def save_job_metadata(self, distance_type):
         """
@@ -154,7 +155,7 @@ class DiffusionAnalyzer(SingleJobAnalyzer):
                 The point-set metric type used for the given sub-job.
         """
         keys = self.computational_design.get_job_metadata_header()
-        keys = [re.sub(' ', '_', key) for key in keys]
+        header = [(re.sub(' ', '_', key), 'TEXT') for key in keys]
         values = [
             self.input_file_identifier,
             self.get_sample_identifier(),
@@ -163,16 +164,5 @@ class DiffusionAnalyzer(SingleJobAnalyzer):
             self.job_index,
             distance_type.name,
         ]
-
-        cmd = ' '.join([
-            'INSERT INTO',
-            'job_metadata',
-            '( ' + ', '.join(keys) + ' )',
-            'VALUES',
-            '( ' + ', '.join(['"' + str(value) + '"' for value in values]) + ' )',
-            ';'
-        ])
-
-        uri = join(self.jobs_paths.output_path, self.computational_design.get_database_uri())
-        with WaitingDatabaseContextManager(uri) as m:
-            m.execute_commit(cmd)
+        with open_result_writer(self.get_job_database_uri()) as m:
+            m.bulk_insert('job_metadata', header, [[value] for value in values])
@@ -1,3 +1,4 @@
+import re
 
 import pandas as pd
 
@@ -54,6 +55,17 @@ class DiffusionDesign(ComputationalDesign):
             'distance_type',
         ]
 
+    def get_result_tables(self):
+        """
+        Returns:
+            dict:
+                The names of the columns which jobs fill, keyed by table name.
+        """
+        return {
+            self.get_diffusion_distances_table_name() : self.get_probabilities_table_header(),
+            'job_metadata' : [re.sub(' ', '_', key) for key in self.get_job_metadata_header()],
+        }
+
     def get_probabilities_table_header(self):
         """
         Returns:
@@ -16,6 +16,9 @@ import ot
 from ot.lp import emd2
 import networkx as nx
 
+from ...environment.cell_table_builder import CellTableBuilder
+from ...environment.columnar_cache import ColumnarCache
+from ...environment.compressed_input import strip_compression_suffix
 from ...environment.settings_wrappers import JobsPaths
 from ...environment.log_formats import colorized_logger
 
@@ -40,10 +43,19 @@ class DiffusionCalculator:
         dataset_design=None,
         computational_design=None,
         jobs_paths: JobsPaths=None,
+        input_file_sha256: str=None,
     ):
         self.dataset_design = dataset_design
         self.computational_design = computational_design
-        self.df = pd.read_csv(input_filename)
+        builder = CellTableBuilder(
+            dataset_design=self.dataset_design,
+            signatures_by_name={
+                self.dataset_design.munge_name(signature) : signature
+                for signature in self.computational_design.get_all_phenotype_signatures()
+            },
+            columnar_cache=ColumnarCache.get_job_cache(jobs_paths),
+        )
+        self.df = builder.read_table(input_filename, sha256=input_file_sha256)
         self.input_filename = input_filename
         self.fov = self.get_fov_handle_string(fov_index)
         self.regional_compartment = regional_compartment
@@ -266,8 +278,8 @@ class DiffusionCalculator:
         xmin, xmax, ymin, ymax = self.dataset_design.get_box_limit_column_names()
         box_centers = np.concatenate(
             (
-                np.matrix(0.5 * (df[xmax] + df[xmin])),
-                np.matrix(0.5 * (df[ymax] + df[ymin])),
+                np.matrix(0.5 * (df[xmax] + df[xmin]), dtype=float),
+                np.matrix(0.5 * (df[ymax] + df[ymin]), dtype=float),
             )
         ).transpose()
         return box_centers
@@ -342,7 +354,7 @@ class GraphMLSerializer:
                     if M[i][j] <= self.threshold:
                         G.add_edge(i, j, **{'weight' + str(k+1) : float(M[i][j])})
 
-        filename = phenotype + '_' + re.sub(r'\.csv', '', basename(input_filename)) + '_' + fov + '.graphml'
+        filename = phenotype + '_' + re.sub(r'\.csv', '', strip_compression_suffix(basename(input_filename))) + '_' + fov + '.graphml'
         p = join(self.output_path, 'graphml')
         if not exists(p):
             mkdir(p)
@@ -20,6 +20,7 @@ simplefilter('ignore', ClusterWarning)
 
 from ...environment.settings_wrappers import JobsPaths, DatasetSettings
 from ...environment.database_context_utility import WaitingDatabaseContextManager
+from ...environment.database_shards import DatabaseShards
 from ...environment.log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -144,6 +145,7 @@ class DiffusionAnalysisIntegrator:
         Gathers computed values into different contextual cases, then delegates to
         ``generate_figures``.
         """
+        DatabaseShards(join(self.output_path, self.computational_design.get_database_uri())).merge()
         probabilities = self.get_dataframe_from_db(
             self.computational_design.get_diffusion_distances_table_name()
         )
@@ -195,13 +197,7 @@ class DiffusionAnalysisIntegrator:
     def record_summary_of_values(self, marker, distance_type, outcomes_dict, t_values, grouped):
         table_name = 'diffusion_distances_summarized'
         schema = self.computational_design.get_diffusion_distances_summarized_header()
-        process_value = {
-            'TEXT' : (lambda val: '"' + str(val) + '"'),
-            'NUMERIC' : (lambda val: str(val)),
-            'INTEGER' : (lambda val: str(val)),
-        }
-        column_names = [row[0] for row in schema]
-        data_types = [row[1] for row in schema]
+        rows = []
         uri = join(self.output_path, self.computational_design.get_database_uri())
         with WaitingDatabaseContextManager(uri) as m:
             for sample_id, df in grouped:
@@ -229,16 +225,9 @@ class DiffusionAnalysisIntegrator:
                         median_value,
                         variance_value,
                     ]
-                    processed_values = [process_value[data_types[i]](values[i]) for i in range(len(values))]
-                    cmd = ' '.join([
-                        'INSERT INTO',
-                        table_name,
-                        '(' + ', '.join(column_names) + ')',
-                        'VALUES',
-                        '( ' + ' , '.join(processed_values) + ' );'
-                    ])
-                    m.execute(cmd)
-                m.commit()
+                    rows.append(values)
+            columns = list(zip(*rows)) if len(rows) > 0 else [[] for _ in schema]
+            m.bulk_insert(table_name, schema, columns)
 
     def sign(self, value):
         return 1 if value >=0 else -1
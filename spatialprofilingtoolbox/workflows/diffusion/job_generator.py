@@ -11,6 +11,7 @@ import pandas as pd
 
 from ...dataset_designs.multiplexed_imaging.halo_cell_metadata_design import HALOCellMetadataDesign
 from ...environment.job_generator import JobGenerator, JobActivity
+from ...environment.compressed_input import read_csv_chunks
 from ...environment.log_formats import colorized_logger
 from .computational_design import DiffusionDesign
 
@@ -253,8 +254,8 @@ singularity exec \
 def cut_by_header(input_filename, delimiter=',', column: str=None):
     """
     This function attempts to emulate the speed and function of the UNIX-style
-    ``cut`` command for a single field. The implementation here uses Pandas to read
-    the whole table into memory; a future implementation may avert this.
+    ``cut`` command for a single field. The file is read as a stream, in chunks, and
+    may be gzip- or zstd-compressed.
 
     Args:
         input_filename (str):
@@ -271,5 +272,7 @@ def cut_by_header(input_filename, delimiter=',', column: str=None):
     if not column:
         logger.error('"column" is a mandatory argument.')
         raise ValueError
-    df = pd.read_csv(input_filename, delimiter=delimiter)
-    return list(df[column])
+    values = []
+    for chunk in read_csv_chunks(input_filename, 100000, delimiter=delimiter, usecols=[column]):
+        values.extend(chunk[column])
+    return values
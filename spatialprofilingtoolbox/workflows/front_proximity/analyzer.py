@@ -13,6 +13,7 @@ class FrontProximityAnalyzer(SingleJobAnalyzer):
     def __init__(self,
         dataset_design=None,
         complex_phenotypes_file: str=None,
+        chunk_size: int=None,
         **kwargs,
     ):
         """
@@ -23,6 +24,10 @@ class FrontProximityAnalyzer(SingleJobAnalyzer):
 
         complex_phenotypes_file (str):
             The table of composite phenotypes to be considered.
+
+        chunk_size (int):
+            If provided, the number of rows with which to read the input file in
+            chunks of whole fields of view.
         """
         super(FrontProximityAnalyzer, self).__init__(**kwargs)
         self.dataset_design = dataset_design
@@ -41,6 +46,9 @@ class FrontProximityAnalyzer(SingleJobAnalyzer):
             dataset_settings = self.dataset_settings,
             dataset_design = self.dataset_design,
             computational_design = self.computational_design,
+            input_file_sha256 = self.get_input_file_sha256(),
+            chunk_size = chunk_size,
+            database_uri = self.get_job_database_uri(),
         )
 
     def _calculate(self):
@@ -55,6 +55,18 @@ class FrontProximityDesign(ComputationalDesign):
             ('distance_to_front_in_pixels', 'NUMERIC'),
         ]
 
+    def get_result_tables(self):
+        """
+        Returns:
+            dict:
+                The names of the columns which jobs fill, keyed by table name.
+        """
+        return {
+            'cell_front_distances' : [
+                column_name for column_name, _ in self.get_cell_front_distances_header()
+            ],
+        }
+
     def get_all_phenotype_signatures(self):
         """
         Returns:
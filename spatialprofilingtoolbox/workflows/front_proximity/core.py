@@ -5,8 +5,10 @@ import pandas as pd
 import scipy
 from scipy.spatial import KDTree
 
+from ...environment.cell_table_builder import CellTableBuilder
+from ...environment.columnar_cache import ColumnarCache
 from ...environment.settings_wrappers import JobsPaths, DatasetSettings
-from ...environment.database_context_utility import WaitingDatabaseContextManager
+from ...environment.result_sink import open_result_writer
 from ...environment.log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -21,19 +23,32 @@ class FrontProximityCalculator:
         dataset_settings: DatasetSettings=None,
         dataset_design=None,
         computational_design=None,
+        input_file_sha256: str=None,
+        chunk_size: int=None,
+        database_uri: str=None,
     ):
         self.input_filename = input_filename
+        self.input_file_sha256 = input_file_sha256
         self.sample_identifier = sample_identifier
         self.output_path = jobs_paths.output_path
+        self.columnar_cache = ColumnarCache.get_job_cache(jobs_paths)
         self.outcomes_file = dataset_settings.outcomes_file
         self.dataset_design = dataset_design
         self.computational_design = computational_design
+        self.chunk_size = chunk_size
+        self.fov_lookup = {}
+        if database_uri is None:
+            database_uri = join(self.output_path, computational_design.get_database_uri())
+        self.database_uri = database_uri
 
     def calculate_front_proximity(self):
         outcomes_dict = self.pull_in_outcome_data()
         outcome = outcomes_dict[self.sample_identifier]
-        cells = self.create_cell_tables()
-        distance_records = self.calculate_front_distance_records(cells, outcome)
+        distance_records = []
+        for cell_table in self.get_cell_tables():
+            cells = self.create_cell_tables(cell_table)
+            distance_records += self.calculate_front_distance_records(cells, outcome)
+        logger.debug('Completed cell table collation.')
         self.write_cell_front_distance_records(distance_records)
         logger.debug('Finished writing cell front distances in sample %s.', self.sample_identifier)
 
@@ -58,77 +73,49 @@ class FrontProximityCalculator:
         pheno_names = sorted(signatures_by_name.keys())
         return pheno_names
 
-    def create_cell_tables(self):
-        pheno_names = self.get_phenotype_names()
+    def get_cell_tables(self):
+        """
+        The cells of the input file, all at once or, if a chunk size was given, in
+        chunks of whole fields of view (see :py:class:`FOVChunkReader`). In the latter
+        case the cells of each field of view must be consecutive rows of the file.
+        """
+        builder = CellTableBuilder(
+            dataset_design=self.dataset_design,
+            signatures_by_name=self.get_phenotype_signatures_by_name(),
+            intensities=True,
+            columnar_cache=self.columnar_cache,
+        )
+        if self.chunk_size is None:
+            yield builder.build(self.input_filename, sha256=self.input_file_sha256)
+        else:
+            yield from builder.iterate(self.input_filename, self.chunk_size)
 
-        number_fovs = 0
+    def create_cell_tables(self, cell_table):
+        pheno_names = self.get_phenotype_names()
         filename = self.input_filename
-        df_file = pd.read_csv(filename)
-
-        self.dataset_design.normalize_fov_descriptors(df_file)
-
-        # Cache original (*normalized) FOV strings
-        self.fov_lookup = {}
-        col = self.dataset_design.get_FOV_column()
-        fovs = sorted(list(set(df_file[col])))
-        for i, fov in enumerate(fovs):
-            self.fov_lookup[i] = fov
-
-        # Replace original FOV string descriptor with index
-        col = self.dataset_design.get_FOV_column()
-        fovs = sorted(list(set(df_file[col])))
-        for i, fov in enumerate(fovs):
-            df_file.loc[df_file[col] == fov, col] = i
-        number_fovs += len(fovs)
-
-        number_cells_by_phenotype = {phenotype : 0 for phenotype in pheno_names}
-        cells = {}
-        for fov_index, df_fov in df_file.groupby(col):
-            df = df_fov.copy()
-            df = df.reset_index(drop=True)
-
-            # Create compartment assignment stipulated by design
-            if 'regional compartment' in df.columns:
-                logger.error('Woops, name collision in "regional compartment". Trying to create new column.')
-                break
-            df['regional compartment'] = 'Not in ' + ';'.join(self.dataset_design.get_compartments())
-
-            for compartment in self.dataset_design.get_compartments():
-                signature = self.dataset_design.get_compartmental_signature(df, compartment)
-                df.loc[signature, 'regional compartment'] = compartment
-
-            xmin, xmax, ymin, ymax = self.dataset_design.get_box_limit_column_names()
-            df['x value'] = 0.5 * (df[xmax] + df[xmin])
-            df['y value'] = 0.5 * (df[ymax] + df[ymin])
-
-            # Add general phenotype membership columns
-            signatures_by_name = self.get_phenotype_signatures_by_name()
-            for name in pheno_names:
-                signature = signatures_by_name[name]
-                df[name + ' membership'] = self.dataset_design.get_pandas_signature(df, signature)
-            phenotype_membership_columns = [name + ' membership' for name in pheno_names]
-
-            # Select pertinent columns and rename
-            intensity_column_names = self.dataset_design.get_intensity_column_names()
-            inverse = {value:key for key, value in intensity_column_names.items()}
-            source_columns = list(intensity_column_names.values())
-            pertinent_columns = [
-                'regional compartment',
-                'x value',
-                'y value',
-            ] + source_columns + phenotype_membership_columns
-
-            # Omit data not used in this pipeline
-            df = df[pertinent_columns]
-
-            # Convert column names into normal form as stipulated by this module
-            df.rename(columns = inverse, inplace=True)
-            df.rename(columns = {self.dataset_design.get_FOV_column() : 'field of view index'}, inplace=True)
-            cells[(filename, fov_index)] = df
-
-            for phenotype in pheno_names:
-                n = number_cells_by_phenotype[phenotype]
-                number_cells_by_phenotype[phenotype] = n + sum(df[phenotype + ' membership'])
+        self.fov_lookup.update(cell_table.fov_lookup)
+
+        # Compartment assignment stipulated by design, box centers, intensities (in
+        # normal form as stipulated by this module), and phenotype memberships
+        columns = {
+            'regional compartment' : cell_table.get_compartment_labels(),
+            'x value' : cell_table.coordinates[:, 0],
+            'y value' : cell_table.coordinates[:, 1],
+        }
+        columns.update(cell_table.intensities)
+        for name in pheno_names:
+            columns[name + ' membership'] = cell_table.get_membership(name)
+        df_file = pd.DataFrame(columns)
+
+        # The tables for each FOV are views of the whole-file table
+        cells = {
+            (filename, fov_index) : df
+            for fov_index, df in cell_table.get_fov_tables(df_file).items()
+        }
+        number_cells_by_phenotype = {
+            phenotype : cell_table.masks.count(('phenotype', phenotype))
+            for phenotype in pheno_names
+        }
         most_frequent = sorted(
             [(k, v) for k, v in number_cells_by_phenotype.items()],
             key=lambda x: x[1],
@@ -140,7 +127,6 @@ class FrontProximityCalculator:
             most_frequent[0],
             most_frequent[1],
         )
-        logger.debug('Completed cell table collation.')
         return cells
 
     def calculate_front_distance_records(self, cells, outcome):
@@ -181,25 +167,7 @@ class FrontProximityCalculator:
         return distance_records
 
     def write_cell_front_distance_records(self, distance_records):
-        keys_list = [column_name for column_name, dtype in self.computational_design.get_cell_front_distances_header()]
-
-        uri = join(self.output_path, self.computational_design.get_database_uri())
-        with WaitingDatabaseContextManager(uri) as m:
-            for row in distance_records:
-                values_list = [
-                    '"' + row[0] + '"',
-                    str(row[1]),
-                    '"' + row[2] + '"',
-                    '"' + row[3] + '"',
-                    '"' + row[4] + '"',
-                    '"' + row[5] + '"',
-                    str(float(row[6])),
-                ]
-                keys = '( ' + ' , '.join([k for k in keys_list]) + ' )'
-                values = '( ' + ' , '.join(values_list) + ' )'
-                cmd = 'INSERT INTO cell_front_distances ' + keys + ' VALUES ' + values +  ' ;'
-                try:
-                    m.execute(cmd)
-                except Exception as e:
-                    logger.error('SQL query failed: %s', cmd)
-                    print(e)
+        header = self.computational_design.get_cell_front_distances_header()
+        columns = list(zip(*distance_records)) if len(distance_records) > 0 else [[] for _ in header]
+        with open_result_writer(self.database_uri) as m:
+            m.bulk_insert('cell_front_distances', header, columns)
@@ -1,5 +1,7 @@
+from os.path import join
 
 from ...environment.settings_wrappers import JobsPaths, DatasetSettings
+from ...environment.database_shards import DatabaseShards
 from ...environment.log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -30,4 +32,5 @@ class FrontProximityAnalysisIntegrator:
         """
         Performs statistical comparison tests and writes results.
         """
+        DatabaseShards(join(self.output_path, self.computational_design.get_database_uri())).merge()
         logger.info('<Stats calculation not implemented>')
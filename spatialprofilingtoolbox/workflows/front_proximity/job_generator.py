@@ -37,6 +37,7 @@ singularity exec \
     def __init__(self,
         elementary_phenotypes_file=None,
         complex_phenotypes_file=None,
+        chunk_size: int=None,
         **kwargs,
     ):
         """
@@ -48,6 +49,10 @@ singularity exec \
             complex_phenotypes_file (str):
                 Tabular file listing composite phenotypes to consider. See
                 ``phenotype_proximity.computational_design``.
+
+            chunk_size (int):
+                The number of rows with which jobs read input files in chunks, passed
+                to the jobs.
         """
         super(FrontProximityJobGenerator, self).__init__(**kwargs)
         self.dataset_design = HALOCellMetadataDesign(
@@ -57,6 +62,7 @@ singularity exec \
             dataset_design=self.dataset_design,
             complex_phenotypes_file=complex_phenotypes_file,
         )
+        self.chunk_size = int(chunk_size) if chunk_size is not None else None
 
         self.lsf_job_filenames = []
         self.sh_job_filenames = []
@@ -90,6 +96,8 @@ singularity exec \
                 contents = FrontProximityJobGenerator.cli_call_template
                 contents = re.sub('{{input_file_identifier}}', file_id, contents)
                 contents = re.sub('{{job_index}}', str(job_index), contents)
+                if self.chunk_size is not None:
+                    contents += ' --chunk-size %s ' % self.chunk_size
                 cli_call = contents
 
                 bsub_job = re.sub('{{cli_call}}', cli_call, bsub_job)
@@ -18,6 +18,12 @@ class PhenotypeProximityAnalyzer(SingleJobAnalyzer):
         dataset_design=None,
         complex_phenotypes_file: str=None,
         balanced: bool=False,
+        neighbor_engine: str='sparse',
+        counting_engine: str='matrix',
+        tile_memory_budget: float=None,
+        whole_slide: bool=False,
+        workers: int=1,
+        chunk_size: int=None,
         **kwargs,
     ):
         """
@@ -30,6 +36,25 @@ class PhenotypeProximityAnalyzer(SingleJobAnalyzer):
         :param balanced: Whether to use balanced or unbalanced treatment of phenotype
             pairs.
         :type balanced: bool
+
+        :param neighbor_engine: See :py:class:`PhenotypeProximityDesign`.
+        :type neighbor_engine: str
+
+        :param counting_engine: See :py:class:`PhenotypeProximityDesign`.
+        :type counting_engine: str
+
+        :param tile_memory_budget: See :py:class:`PhenotypeProximityDesign`.
+        :type tile_memory_budget: float
+
+        :param whole_slide: See :py:class:`PhenotypeProximityDesign`.
+        :type whole_slide: bool
+
+        :param workers: The number of worker processes for the per field of view
+            calculations.
+        :type workers: int
+
+        :param chunk_size: See :py:class:`PhenotypeProximityCalculator`.
+        :type chunk_size: int
         """
         super().__init__(**kwargs)
         self.dataset_design = dataset_design
@@ -37,6 +62,10 @@ class PhenotypeProximityAnalyzer(SingleJobAnalyzer):
             dataset_design = self.dataset_design,
             complex_phenotypes_file = complex_phenotypes_file,
             balanced = balanced,
+            neighbor_engine = neighbor_engine,
+            counting_engine = counting_engine,
+            tile_memory_budget = tile_memory_budget,
+            whole_slide = whole_slide,
         )
 
         self.retrieve_input_filename()
@@ -52,6 +81,10 @@ class PhenotypeProximityAnalyzer(SingleJobAnalyzer):
             dataset_design = self.dataset_design,
             computational_design = self.computational_design,
             regional_areas_file = regional_areas_file,
+            workers = workers,
+            input_file_sha256 = self.get_input_file_sha256(),
+            chunk_size = chunk_size,
+            database_uri = self.get_job_database_uri(),
         )
 
     def _calculate(self):
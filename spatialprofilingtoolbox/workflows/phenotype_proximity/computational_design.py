@@ -5,16 +5,26 @@ any workflow-specific metadata.
 import pandas as pd
 
 from ...environment.computational_design import ComputationalDesign
+from ...environment.log_formats import colorized_logger
+
+logger = colorized_logger(__name__)
 
 
 class PhenotypeProximityDesign(ComputationalDesign):
     """
     The design object.
     """
+    neighbor_engines = ['sparse', 'dense']
+    counting_engines = ['matrix', 'pairwise']
+
     def __init__(self,
         dataset_design=None,
         complex_phenotypes_file: str=None,
         balanced: bool=False,
+        neighbor_engine: str='sparse',
+        counting_engine: str='matrix',
+        tile_memory_budget: float=None,
+        whole_slide: bool=False,
         **kwargs,
     ):
         """
@@ -27,6 +37,32 @@ class PhenotypeProximityDesign(ComputationalDesign):
         :param balanced: Whether to use balanced or unbalanced treatment of phenotype
             pairs.
         :type balanced: bool
+
+        :param neighbor_engine: The method used to find cell pairs within the maximum
+            radius of consideration. Either "sparse" (default), a KD-tree query which
+            only materializes pairs within range, or "dense", the full pairwise
+            distance matrix (for parity testing).
+        :type neighbor_engine: str
+
+        :param counting_engine: The method used to aggregate cell pair counts. Either
+            "matrix" (default), which obtains the counts for all phenotype pairs at once
+            from sparse matrix products, or "pairwise", which treats one phenotype pair
+            at a time.
+        :type counting_engine: str
+
+        :param tile_memory_budget: If provided, the number of megabytes within which
+            to find and count the cell pairs of one spatial tile of a field of view at
+            a time. By default fields of view are not tiled.
+        :type tile_memory_budget: float
+
+        :param whole_slide: Whether to ignore field of view boundaries, treating all
+            cells of a source file as one field of view with slide-global coordinates.
+            Cell pairs straddling adjacent fields of view are then counted, and areas
+            are totals over all fields of view. Source files with several fields of
+            view must have the slide offset columns of the dataset design (see
+            :py:meth:`HALOCellMetadataDesign.get_slide_offset_column_names`); files
+            without them are refused. Default False.
+        :type whole_slide: bool
         """
         super().__init__(**kwargs)
         self.dataset_design = dataset_design
@@ -35,6 +71,27 @@ class PhenotypeProximityDesign(ComputationalDesign):
             keep_default_na=False,
         )
         self.balanced = balanced
+        if not neighbor_engine in PhenotypeProximityDesign.neighbor_engines:
+            logger.error(
+                'Neighbor engine "%s" not supported. Use one of %s.',
+                neighbor_engine,
+                PhenotypeProximityDesign.neighbor_engines,
+            )
+            raise ValueError
+        self.neighbor_engine = neighbor_engine
+        if not counting_engine in PhenotypeProximityDesign.counting_engines:
+            logger.error(
+                'Counting engine "%s" not supported. Use one of %s.',
+                counting_engine,
+                PhenotypeProximityDesign.counting_engines,
+            )
+            raise ValueError
+        self.counting_engine = counting_engine
+        if tile_memory_budget is not None and not tile_memory_budget > 0:
+            logger.error('Tile memory budget must be positive, got %s.', tile_memory_budget)
+            raise ValueError
+        self.tile_memory_budget = tile_memory_budget
+        self.whole_slide = whole_slide
 
     @staticmethod
     def get_database_uri():
@@ -74,6 +131,17 @@ class PhenotypeProximityDesign(ComputationalDesign):
             ('source_phenotype_count', 'INTEGER'),
         ]
 
+    def get_result_tables(self):
+        """
+        :return: The names of the columns which jobs fill, keyed by table name.
+        :rtype: dict
+        """
+        return {
+            self.get_cell_pair_counts_table_name() : [
+                column_name for column_name, _ in self.get_cell_pair_counts_table_header()
+            ],
+        }
+
     def get_all_phenotype_signatures(self, by_name=False):
         """
         :param by_name: Whether to return a list (default) or a dictionary whose keys
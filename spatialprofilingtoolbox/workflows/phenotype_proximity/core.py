@@ -4,16 +4,19 @@ The core calculator for the proximity calculation on a single source file.
 from os.path import join
 from math import exp, log
 from math import pow as math_pow
-from itertools import combinations
-import sqlite3
+from itertools import combinations, repeat
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import cdist
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix, issparse
 
 from ...environment.settings_wrappers import JobsPaths, DatasetSettings
-from ...environment.database_context_utility import WaitingDatabaseContextManager
+from ...environment.result_sink import open_result_writer
+from ...environment.cell_table_builder import CellTableBuilder
+from ...environment.columnar_cache import ColumnarCache
 from ...environment.log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -26,6 +29,14 @@ class PhenotypeProximityCalculator:
     radius_pixels_lower_limit = 10
     radius_pixels_upper_limit = 100
     radius_number_increments = 4
+    # The peak memory held for each cell pair of a tile is in
+    # get_sparse_distance_block: the cKDTree records (two intp indices and a float64
+    # distance), their filtered copy, and the COO arrays, then the CSR indices and
+    # data. The binned adjacency matrices, one radius at a time, need less.
+    bytes_per_cell_pair = (
+        3 * (2 * np.dtype(np.intp).itemsize + np.dtype(np.float64).itemsize)
+        + np.dtype(np.intp).itemsize + np.dtype(np.float64).itemsize
+    )
 
     def __init__(
         self,
@@ -36,6 +47,10 @@ class PhenotypeProximityCalculator:
         dataset_design=None,
         computational_design=None,
         regional_areas_file: str=None,
+        workers: int=1,
+        input_file_sha256: str=None,
+        chunk_size: int=None,
+        database_uri: str=None,
     ):
         """
         :param input_filename: The filename for the source file with cell data.
@@ -57,10 +72,31 @@ class PhenotypeProximityCalculator:
         :param regional_areas_file: The file containing total areas of classified
             regions.
         :type regional_areas_file: str
+
+        :param workers: The number of worker processes over which to distribute the
+            per field of view calculations.
+        :type workers: int
+
+        :param input_file_sha256: The SHA256 hash of the source file, used to look up
+            a previously parsed copy in the columnar cache. Computed if not provided.
+        :type input_file_sha256: str
+
+        :param chunk_size: If provided, the source file is read in chunks of about this
+            many rows of whole fields of view (see :py:class:`FOVChunkReader`), and the
+            cell pairs of each field of view are counted as soon as its chunk is read.
+            Only the per field of view counts are kept. The cells of each field of view
+            must be consecutive rows of the file. Requires the "matrix" counting engine,
+            and is not used in whole-slide mode.
+        :type chunk_size: int
+
+        :param database_uri: The database into which to write the cell pair counts.
+            By default, the pipeline-specific database of the computational design.
+        :type database_uri: str
         """
         self.input_filename = input_filename
         self.sample_identifier = sample_identifier
         self.output_path = jobs_paths.output_path
+        self.columnar_cache = ColumnarCache.get_job_cache(jobs_paths)
         self.outcome = self.pull_in_outcome_data(dataset_settings.outcomes_file)[
             sample_identifier
         ]
@@ -71,6 +107,14 @@ class PhenotypeProximityCalculator:
             regional_areas_file=regional_areas_file,
         )
         self.fov_lookup = {}
+        self.cell_masks = None
+        self.fov_cell_ranges = {}
+        self.workers = workers
+        self.input_file_sha256 = input_file_sha256
+        self.chunk_size = chunk_size
+        if database_uri is None:
+            database_uri = join(self.output_path, computational_design.get_database_uri())
+        self.database_uri = database_uri
 
     def calculate_proximity(self):
         """
@@ -83,15 +127,56 @@ class PhenotypeProximityCalculator:
             'balanced' if self.computational_design.balanced else 'unbalanced',
             self.input_filename,
         )
-        cells = self.create_cell_tables()
+        if self.is_streaming():
+            radius_limited_counts = self.do_aggregation_counting_by_chunk()
+        else:
+            cells = self.create_cell_tables()
+            radius_limited_counts = self.calculate_radius_limited_counts(cells)
+        self.write_cell_pair_counts(radius_limited_counts)
+
+    def is_streaming(self):
+        """
+        :return: Whether the source file is to be read and counted in chunks (see the
+            ``chunk_size`` option).
+        :rtype: bool
+        """
+        if self.chunk_size is None:
+            return False
+        if self.computational_design.whole_slide:
+            logger.warning('Reading in chunks is not possible in whole-slide mode; reading the whole file.')
+            return False
+        if self.computational_design.counting_engine != 'matrix':
+            logger.warning(
+                'Reading in chunks is only possible with the "matrix" counting engine; '
+                'reading the whole file.'
+            )
+            return False
+        return True
+
+    def calculate_radius_limited_counts(self, cells):
+        """
+        :param cells: Cells tables by field of view integer index.
+        :type cells: dict
+
+        :return: Table of radius-limited counts, computed in a pool of worker
+            processes if more than one worker was requested.
+        :rtype: pandas.DataFrame
+        """
+        by_fov = self.workers > 1 or self.computational_design.tile_memory_budget is not None
+        if by_fov:
+            if self.computational_design.counting_engine == 'matrix':
+                return self.do_aggregation_counting_by_fov(cells)
+            logger.warning(
+                'Worker processes and tiling are only used with the "matrix" counting '
+                'engine; counting serially and untiled.'
+            )
         cell_pairs = self.create_cell_pairs_tables(cells)
         phenotype_indices, compartment_indices = self.precalculate_masks(cells)
-        radius_limited_counts = self.do_aggregation_counting(
+        return self.do_aggregation_counting(
             cell_pairs,
             phenotype_indices,
             compartment_indices,
         )
-        self.write_cell_pair_counts(radius_limited_counts)
 
     @staticmethod
     def pull_in_outcome_data(outcomes_file):
@@ -108,92 +193,11 @@ class PhenotypeProximityCalculator:
         }
         return outcomes_dict
 
-    def cache_fov_strings(self, table_file):
-        """
-        :param table_file: Table with cell data.
-        :type table_file: pandas.DataFrame
-        """
-        fovs = sorted(list(set(table_file[self.dataset_design.get_FOV_column()])))
-        for i, fov in enumerate(fovs):
-            self.fov_lookup[i] = fov
-
-    def replace_fov_strings_with_index(self, table_file):
-        """
-        :param table_file: Table with cell data.
-        :type table_file: pandas.DataFrame
-        """
-        fov_column = self.dataset_design.get_FOV_column()
-        fovs = sorted(list(set(table_file[fov_column])))
-        for i, fov in enumerate(fovs):
-            table_file.loc[table_file[fov_column] == fov, fov_column] = i
-
-    def add_compartment_information(self, table):
-        """
-        :param table: Table with cell data.
-        :type table: pandas.DataFrame
-        """
-        if 'regional compartment' in table.columns:
-            logger.error(
-                'Woops, name collision in "regional compartment". Trying to create new column.'
-            )
-            return
-        compartments = self.dataset_design.get_compartments()
-        table['regional compartment'] = 'Not in ' + ';'.join(compartments)
-        for compartment in compartments:
-            signature = self.dataset_design.get_compartmental_signature(table, compartment)
-            table.loc[signature, 'regional compartment'] = compartment
-
-    def add_box_centers(self, table):
-        """
-        :param table: Table with cell data.
-        :type table: pandas.DataFrame
-        """
-        xmin, xmax, ymin, ymax = self.dataset_design.get_box_limit_column_names()
-        table['x value'] = 0.5 * (table[xmax] + table[xmin])
-        table['y value'] = 0.5 * (table[ymax] + table[ymin])
-
-    def add_membership(self, table):
-        """
-        :param table: Table with cell data.
-        :type table: pandas.DataFrame
-        """
-        signatures_by_name = self.computational_design.get_all_phenotype_signatures(by_name=True)
-        for name, signature in signatures_by_name.items():
-            table[name + ' membership'] = self.dataset_design.get_pandas_signature(table, signature)
-
-    def restrict_to_pertinent_columns(self, table):
-        """
-        :param table: Table with cell data.
-        :type table: pandas.DataFrame
-        """
-        signatures_by_name = self.computational_design.get_all_phenotype_signatures(by_name=True)
-        phenotype_membership_columns = [
-            name + ' membership' for name, _ in signatures_by_name.items()
-        ]
-        intensity_column_names = self.dataset_design.get_intensity_column_names()
-        inverse = {value:key for key, value in intensity_column_names.items()}
-        source_columns = list(intensity_column_names.values())
-        pertinent_columns = [
-            'regional compartment',
-            'x value',
-            'y value',
-        ] + source_columns + phenotype_membership_columns
-        table.drop(
-            [column for column in table.columns if not column in pertinent_columns],
-            axis=1,
-            inplace=True,
-        )
-        table.rename(columns = inverse, inplace=True)
-        table.rename(columns = {
-            self.dataset_design.get_FOV_column() : 'field of view index'
-        }, inplace=True)
-
     def create_cell_tables(self):
         """
         Create tables, one for each field of view in the given source file, whose
         records correspond to  individual cells. The schema is:
 
-        - "regional compartment"
         - "x value"
         - "y value"
         - "<elementary phenotype 1> <cellular site 1> intensity"
@@ -202,35 +206,93 @@ class PhenotypeProximityCalculator:
         - "<elementary phenotype 1> <cellular site 2> intensity"
         - "<elementary phenotype 2> <cellular site 2> intensity"
         - ...
-        - "<general phenotype 1> membership"
-        - "<general phenotype 2> membership"
-        - ...
+
+        Compartment and phenotype membership are kept separately, for the whole file,
+        in the packed bit matrix ``self.cell_masks`` (see :py:class:`CellTableBuilder`).
+        The cells are sorted by field of view, so that the cells of each field of view
+        are the contiguous range ``self.fov_cell_ranges[fov_index]`` of the bit matrix.
+        The tables are views into one whole-file table.
+
+        In whole-slide mode (see :py:class:`PhenotypeProximityDesign`) there is just one
+        table, of all cells in the source file, with key "whole slide". The cell
+        coordinates are made slide-global with the slide offset columns of the dataset
+        design, which are required if the source file has several fields of view.
 
         :return: Dictionary whose keys are field of view integer indices and values are
             tables of cells.
         :rtype: dict
         """
-        table_file = pd.read_csv(self.input_filename)
-        self.dataset_design.normalize_fov_descriptors(table_file)
-        self.cache_fov_strings(table_file)
-        self.replace_fov_strings_with_index(table_file)
-
-        cells = {}
-        phenotype_names = self.computational_design.get_all_phenotype_names()
-        number_cells_by_phenotype = {phenotype : 0 for phenotype in phenotype_names}
-        grouped = table_file.groupby(self.dataset_design.get_FOV_column())
-        for fov_index, table_fov in grouped:
-            table = table_fov.copy()
-            table = table.reset_index(drop=True)
-            self.add_compartment_information(table)
-            self.add_box_centers(table)
-            self.add_membership(table)
-            self.restrict_to_pertinent_columns(table)
-            cells[fov_index] = table
-
-            for phenotype in phenotype_names:
-                number_cells_by_phenotype[phenotype] += sum(table[phenotype + ' membership'])
+        cell_table = self.get_cell_table_builder().build(
+            self.input_filename,
+            sha256=self.input_file_sha256,
+        )
+        return self.create_fov_tables(cell_table)
+
+    def get_cell_table_builder(self):
+        """
+        :return: The builder for the cells of the source file, with the phenotypes of
+            the computational design and with intensities. In whole-slide mode, the
+            slide offsets are added to the coordinates if the file has them.
+        :rtype: CellTableBuilder
+        """
+        return CellTableBuilder(
+            dataset_design=self.dataset_design,
+            signatures_by_name=self.computational_design.get_all_phenotype_signatures(by_name=True),
+            intensities=True,
+            slide_offsets=self.computational_design.whole_slide and self.has_slide_offsets(),
+            columnar_cache=self.columnar_cache,
+        )
+
+    def has_slide_offsets(self):
+        """
+        :return: Whether the source file has the slide offset columns of the dataset
+            design.
+        :rtype: bool
+        """
+        header = self.columnar_cache.get_header(self.input_filename, sha256=self.input_file_sha256)
+        return all(
+            column in header for column in self.dataset_design.get_slide_offset_column_names()
+        )
+
+    def create_fov_tables(self, cell_table):
+        """
+        :param cell_table: The cells of the source file, or of a chunk of whole fields
+            of view of it.
+        :type cell_table: CellTable
+
+        :return: See :py:meth:`create_cell_tables`. The field of view descriptors are
+            added to ``self.fov_lookup``.
+        :rtype: dict
+        """
+        self.fov_lookup.update(cell_table.fov_lookup)
+        self.cell_masks = cell_table.masks
+        columns = {
+            'x value' : cell_table.coordinates[:, 0],
+            'y value' : cell_table.coordinates[:, 1],
+        }
+        columns.update(cell_table.intensities)
+        table_file = pd.DataFrame(columns)
+
+        if self.computational_design.whole_slide:
+            if len(self.fov_lookup) > 1 and not self.has_slide_offsets():
+                logger.error(
+                    'Whole-slide mode requires slide-global cell coordinates, but %s has '
+                    '%s fields of view and no slide offset columns %s.',
+                    self.input_filename,
+                    len(self.fov_lookup),
+                    self.dataset_design.get_slide_offset_column_names(),
+                )
+                raise ValueError
+            self.fov_cell_ranges = {'whole slide' : (0, table_file.shape[0])}
+            cells = {'whole slide' : table_file}
+        else:
+            self.fov_cell_ranges = cell_table.fov_ranges
+            cells = cell_table.get_fov_tables(table_file)
 
+        number_cells_by_phenotype = {
+            phenotype : self.cell_masks.count(('phenotype', phenotype))
+            for phenotype in self.computational_design.get_all_phenotype_names()
+        }
         most_frequent = sorted(
             list(number_cells_by_phenotype.items()),
             key=lambda x: x[1],
@@ -258,6 +320,13 @@ class PhenotypeProximityCalculator:
         - cell 2 index
         - distance in pixels
 
+        Only pairs of distinct cells within ``radius_pixels_upper_limit`` of each other
+        are retained. With the default "sparse" neighbor engine (see
+        :py:class:`PhenotypeProximityDesign`), each table is a sparse matrix built from
+        a KD-tree query, so that memory usage is proportional to the number of retained
+        pairs rather than to the square of the number of cells. The "dense" engine
+        computes the full distance matrix and is retained for parity testing.
+
         :param cells: Input collection of cells tables, see
             :py:meth:`create_cell_tables`.
         :type cells: dict
@@ -267,21 +336,26 @@ class PhenotypeProximityCalculator:
         :rtype: dict
         """
         cell_pairs = {}
+        engine = self.computational_design.neighbor_engine
         logger.debug(
-            'Calculating cell pair distances for cells from %s.',
+            'Calculating cell pair distances for cells from %s (%s neighbor engine).',
             self.input_filename,
+            engine,
         )
         logger.debug(
             'Logging per FOV: (number of cells, number cell pairs used, fraction of possible pairs)'
         )
         limit = PhenotypeProximityCalculator.radius_pixels_upper_limit
         logger.debug('Only using pairs of pixel distance less than %s', limit)
-        for _, (fov_index, table) in enumerate(cells.items()):
-            distance_matrix = cdist(table[['x value', 'y value']], table[['x value', 'y value']])
-            distance_matrix[distance_matrix > limit] = 0
+        for fov_index, table in cells.items():
+            points = table[['x value', 'y value']].to_numpy(dtype=float)
+            if engine == 'dense':
+                distance_matrix = self.get_dense_distance_matrix(points, limit)
+                number_pairs = int(np.count_nonzero(distance_matrix) / 2)
+            else:
+                distance_matrix = self.get_sparse_distance_matrix(points, limit)
+                number_pairs = int(distance_matrix.nnz / 2)
             cell_pairs[fov_index] = distance_matrix
-            sparse = coo_matrix(distance_matrix)
-            number_pairs = int(len(sparse.data) / 2)
             number_cells = table.shape[0]
             number_all_pairs = number_cells * (number_cells - 1) / 2
             logger.debug(
@@ -289,7 +363,7 @@ class PhenotypeProximityCalculator:
                 fov_index,
                 number_cells,
                 number_pairs,
-                int(100 * number_pairs / number_all_pairs) / 100,
+                int(100 * number_pairs / number_all_pairs) / 100 if number_all_pairs > 0 else 0,
             )
         logger.debug(
             'Completed (field of view limited) cell pair distances calculation in %s.',
@@ -297,28 +371,76 @@ class PhenotypeProximityCalculator:
         )
         return cell_pairs
 
+    @staticmethod
+    def get_dense_distance_matrix(points, limit):
+        """
+        :param points: The cell locations, one row per cell.
+        :type points: numpy.ndarray
+
+        :param limit: Pixel distance above which pairs are discarded.
+        :type limit: float
+
+        :return: The full square matrix of pairwise distances, with entries above
+            ``limit`` set to 0.
+        :rtype: numpy.ndarray
+        """
+        distance_matrix = cdist(points, points)
+        distance_matrix[distance_matrix > limit] = 0
+        return distance_matrix
+
+    @staticmethod
+    def get_sparse_distance_matrix(points, limit):
+        """
+        :param points: The cell locations, one row per cell.
+        :type points: numpy.ndarray
+
+        :param limit: Pixel distance above which pairs are discarded.
+        :type limit: float
+
+        :return: Symmetric sparse matrix of pairwise distances, with an entry only for
+            pairs of cells at positive distance at most ``limit``. Same values as
+            :py:meth:`get_dense_distance_matrix`, without materializing the other
+            entries.
+        :rtype: scipy.sparse.csr_matrix
+        """
+        number_cells = points.shape[0]
+        pairs = cKDTree(points).query_pairs(limit, output_type='ndarray')
+        distances = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+        positive = distances > 0
+        pairs = pairs[positive]
+        distances = distances[positive]
+        return coo_matrix(
+            (
+                np.concatenate([distances, distances]),
+                (
+                    np.concatenate([pairs[:, 0], pairs[:, 1]]),
+                    np.concatenate([pairs[:, 1], pairs[:, 0]]),
+                ),
+            ),
+            shape=(number_cells, number_cells),
+        ).tocsr()
+
     def precalculate_masks(self, cells):
         """
         :param cells: Cells tables by field of view integer index.
         :type cells: dict
 
-        :return: A 2-element list, phenotype and compartment masks.
+        :return: A 2-element list, phenotype and compartment masks. These are boolean
+            arrays unpacked from the cell masks bit matrix for each field of view.
         :rtype: list
         """
         phenotypes = self.computational_design.get_all_phenotype_names()
-
-        phenotype_indices = {
-            fov_index : {
-                p : table[p + ' membership'] for p in phenotypes
-            } for fov_index, table in cells.items()
-        }
-
         compartments = self.dataset_design.get_compartments()
-        compartment_indices = {
-            fov_index : {
-                c : (table['regional compartment'] == c) for c in compartments
-            } for fov_index, table in cells.items()
-        }
+        phenotype_indices = {}
+        compartment_indices = {}
+        for fov_index in cells.keys():
+            start, stop = self.fov_cell_ranges[fov_index]
+            phenotype_indices[fov_index] = {
+                p : self.cell_masks.get_mask(('phenotype', p), start, stop) for p in phenotypes
+            }
+            compartment_indices[fov_index] = {
+                c : self.cell_masks.get_mask(('compartment', c), start, stop) for c in compartments
+            }
 
         return [phenotype_indices, compartment_indices]
 
@@ -352,17 +474,35 @@ class PhenotypeProximityCalculator:
             'Creating radius-limited data sets for %s phenotype pairs.',
             len(combinations2),
         )
-        results = []
-        for combination in combinations2:
-            results_combo = self.do_aggregation_one_phenotype_pair(
-                combination,
+        if self.computational_design.counting_engine == 'matrix':
+            results = self.do_aggregation_all_phenotype_pairs(
+                combinations2,
                 cell_pairs,
                 phenotype_indices,
                 compartment_indices,
             )
-            results.append(results_combo)
-            logger.debug('Cell pairs of types %s aggregated.', combination)
+        else:
+            results = []
+            for combination in combinations2:
+                results_combo = self.do_aggregation_one_phenotype_pair(
+                    combination,
+                    cell_pairs,
+                    phenotype_indices,
+                    compartment_indices,
+                )
+                results.append(results_combo)
+                logger.debug('Cell pairs of types %s aggregated.', combination)
         logger.debug('All %s combinations aggregated.', len(combinations2))
+        return self.create_radius_limited_counts_table(results)
+
+    def create_radius_limited_counts_table(self, results):
+        """
+        :param results: Lists of records, one list for each phenotype pair.
+        :type results: list
+
+        :return: Table of radius-limited counts.
+        :rtype: pandas.DataFrame
+        """
         columns = [
             'sample identifier',
             'input filename',
@@ -373,7 +513,7 @@ class PhenotypeProximityCalculator:
             'distance limit in pixels',
             self.computational_design.get_primary_output_feature_name(),
             'source phenotype count',
-        ] # Get this from computational design??
+        ]
         radius_limited_counts = pd.DataFrame(
             PhenotypeProximityCalculator.flatten_lists(results),
             columns=columns,
@@ -411,110 +551,823 @@ class PhenotypeProximityCalculator:
             source, target = sorted(list(pair))
         else:
             source, target = [pair[0], pair[1]]
+        radii = PhenotypeProximityCalculator.get_radii_of_interest()
         records = []
         for compartment in list(set(self.dataset_design.get_compartments())) + ['all']:
-            for radius in PhenotypeProximityCalculator.get_radii_of_interest():
-                count = 0
-                source_count = 0
-                for fov_index, distance_matrix in cell_pairs.items():
-                    rows = phenotype_indices[fov_index][source]
-                    cols = phenotype_indices[fov_index][target]
-                    if compartment != 'all':
-                        rows = rows & compartment_indices[fov_index][compartment]
-                        cols = cols & compartment_indices[fov_index][compartment]
-                    p2p_distance_matrix = distance_matrix[rows][:, cols]
-                    additional = np.sum(
-                        (p2p_distance_matrix < radius) & (p2p_distance_matrix > 0)
-                    )
-                    if np.isnan(additional):
-                        continue
-                    count += additional
-                    source_count += sum(rows)
-
-                if balanced:
-                    area = 0
-                    for fov_index, distance_matrix in cell_pairs.items():
-                        fov = self.fov_lookup[fov_index]
-                        if compartment == 'all':
-                            area0 = self.areas.get_total_compartmental_area(fov=fov)
-                        else:
-                            area0 = self.areas.get_area(fov=fov, compartment=compartment)
-                        if area0 is None:
-                            logger.warning(
-                                ''.join([
-                                    'Did not find area for "%s" compartment in field of view "%s".',
-                                    ' Skipping field of view "%s" in "%s".',
-                                ]),
-                                compartment,
-                                fov_index,
-                                fov_index,
-                                self.sample_identifier,
-                            )
-                            continue
-                        area += area0
-                    if area == 0:
-                        logger.warning(
-                            'Did not find ANY area for "%s" compartment in "%s".',
-                            compartment,
-                            self.sample_identifier,
-                        )
-
-                if source_count == 0:
-                    logger.warning(
-                        'No cells of "source" phenotype %s in %s, %s, within %s .',
-                        source,
-                        self.sample_identifier,
-                        compartment,
-                        radius,
-                    )
+            counts = np.zeros(len(radii), dtype=int)
+            source_count = 0
+            for fov_index, distance_matrix in cell_pairs.items():
+                rows = phenotype_indices[fov_index][source]
+                cols = phenotype_indices[fov_index][target]
+                if compartment != 'all':
+                    rows = rows & compartment_indices[fov_index][compartment]
+                    cols = cols & compartment_indices[fov_index][compartment]
+                counts += self.count_pairs_by_radius(distance_matrix, rows, cols, radii)
+                source_count += sum(rows)
+
+            if balanced:
+                area = self.get_compartment_area(compartment, self.fov_lookup.keys())
+            else:
+                area = None
+            records += self.create_records(
+                source,
+                target,
+                compartment,
+                radii,
+                counts,
+                source_count,
+                area,
+            )
+        return records
+
+    def do_aggregation_all_phenotype_pairs(self,
+        combinations2,
+        cell_pairs,
+        phenotype_indices,
+        compartment_indices,
+    ):
+        """
+        Counts cell pairs for all phenotype pairs at once. For each field of view a
+        cells-by-phenotypes membership matrix P is formed, restricted to each
+        compartment in turn, and the within-radius adjacency of cells is split into
+        one sparse matrix A per radius bin (see :py:meth:`iterate_binned_adjacency`). The
+        full phenotype-by-phenotype count matrix for the bin is the product
+        ``P.T @ A @ P``.
+
+        :param combinations2: The phenotype pairs to report, see
+            :py:meth:`get_considered_phenotype_pairs`.
+        :type combinations2: list
+
+        :param cell_pairs: See :py:meth:`create_cell_pairs_tables`.
+        :type cell_pairs: dict
+
+        :param phenotype_indices: See :py:meth:`precalculate_masks`.
+        :type phenotype_indices: dict
+
+        :param compartment_indices: See :py:meth:`precalculate_masks`.
+        :type compartment_indices: dict
+
+        :return: Lists of records, one list for each phenotype pair, as in
+            :py:meth:`do_aggregation_one_phenotype_pair`.
+        :rtype: list
+        """
+        radii = PhenotypeProximityCalculator.get_radii_of_interest()
+        fov_counts = {
+            fov_index : PhenotypeProximityCalculator.count_fov_cell_pairs(
+                distance_matrix,
+                self.get_membership_matrix(phenotype_indices[fov_index]),
+                self.get_compartment_masks(compartment_indices[fov_index]),
+                radii,
+            ) for fov_index, distance_matrix in cell_pairs.items()
+        }
+        return self.create_records_from_fov_counts(combinations2, fov_counts)
+
+    def do_aggregation_counting_by_fov(self, cells):
+        """
+        Like :py:meth:`do_aggregation_counting` with the matrix counting engine, but
+        each field of view's cell pair construction and counting is done by one
+        self-contained task (see :py:meth:`calculate_fov_counts`). If more than one
+        worker is requested, the tasks are run in a pool of worker processes. Only
+        the small per-FOV count arrays are sent back, and these are merged in order
+        of field of view index so that the result does not depend on the order in
+        which tasks complete.
+
+        :param cells: Cells tables by field of view integer index.
+        :type cells: dict
+
+        :return: Table of radius-limited counts.
+        :rtype: pandas.DataFrame
+        """
+        combinations2 = self.get_considered_phenotype_pairs()
+        logger.debug(
+            'Creating radius-limited data sets for %s phenotype pairs, using %s worker processes.',
+            len(combinations2),
+            self.workers,
+        )
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                fov_counts = self.count_by_fov(cells, executor.map)
+        else:
+            fov_counts = self.count_by_fov(cells, map)
+        results = self.create_records_from_fov_counts(combinations2, fov_counts)
+        logger.debug('All %s combinations aggregated.', len(combinations2))
+        return self.create_radius_limited_counts_table(results)
+
+    def do_aggregation_counting_by_chunk(self):
+        """
+        Like :py:meth:`do_aggregation_counting_by_fov`, but the source file is read in
+        chunks of whole fields of view, and the fields of view of each chunk are
+        counted before the next chunk is read.
+
+        :return: Table of radius-limited counts.
+        :rtype: pandas.DataFrame
+        """
+        combinations2 = self.get_considered_phenotype_pairs()
+        logger.debug(
+            'Creating radius-limited data sets for %s phenotype pairs, reading %s in chunks of %s rows.',
+            len(combinations2),
+            self.input_filename,
+            self.chunk_size,
+        )
+        builder = self.get_cell_table_builder()
+        fov_counts = {}
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                for cell_table in builder.iterate(self.input_filename, self.chunk_size):
+                    cells = self.create_fov_tables(cell_table)
+                    fov_counts.update(self.count_by_fov(cells, executor.map))
+        else:
+            for cell_table in builder.iterate(self.input_filename, self.chunk_size):
+                cells = self.create_fov_tables(cell_table)
+                fov_counts.update(self.count_by_fov(cells, map))
+        results = self.create_records_from_fov_counts(combinations2, fov_counts)
+        logger.debug('All %s combinations aggregated.', len(combinations2))
+        return self.create_radius_limited_counts_table(results)
+
+    def count_by_fov(self, cells, mapper):
+        """
+        :param cells: Cells tables by field of view integer index.
+        :type cells: dict
+
+        :param mapper: ``map``, or the ``map`` of a pool of worker processes, with
+            which to run :py:meth:`calculate_fov_counts` for each field of view.
+
+        :return: The return values of :py:meth:`calculate_fov_counts`, by field of view
+            integer index.
+        :rtype: dict
+        """
+        phenotype_indices, compartment_indices = self.precalculate_masks(cells)
+        fov_indices = sorted(cells.keys())
+        arguments = [
+            [
+                cells[fov_index][['x value', 'y value']].to_numpy(dtype=float)
+                for fov_index in fov_indices
+            ],
+            [
+                self.get_membership_matrix(phenotype_indices[fov_index])
+                for fov_index in fov_indices
+            ],
+            [
+                self.get_compartment_masks(compartment_indices[fov_index])
+                for fov_index in fov_indices
+            ],
+            repeat(self.computational_design.neighbor_engine),
+            repeat(PhenotypeProximityCalculator.radius_pixels_upper_limit),
+            repeat(PhenotypeProximityCalculator.get_radii_of_interest()),
+            repeat(self.computational_design.tile_memory_budget),
+        ]
+        partial_counts = list(mapper(
+            PhenotypeProximityCalculator.calculate_fov_counts,
+            *arguments,
+        ))
+        return dict(zip(fov_indices, partial_counts))
+
+    def get_membership_matrix(self, phenotype_masks):
+        """
+        :param phenotype_masks: Phenotype membership masks for one field of view, see
+            :py:meth:`precalculate_masks`.
+        :type phenotype_masks: dict
+
+        :return: Boolean cells-by-phenotypes matrix, columns in the order of
+            ``get_all_phenotype_names``.
+        :rtype: numpy.ndarray
+        """
+        return np.column_stack([
+            np.asarray(phenotype_masks[phenotype], dtype=bool)
+            for phenotype in self.computational_design.get_all_phenotype_names()
+        ])
+
+    def get_compartment_masks(self, compartment_masks):
+        """
+        :param compartment_masks: Compartment masks for one field of view, see
+            :py:meth:`precalculate_masks`.
+        :type compartment_masks: dict
+
+        :return: Boolean mask arrays keyed by compartment name, for each distinct
+            compartment.
+        :rtype: dict
+        """
+        return {
+            compartment : np.asarray(compartment_masks[compartment], dtype=bool)
+            for compartment in set(self.dataset_design.get_compartments())
+        }
+
+    @staticmethod
+    def calculate_fov_counts(
+        points,
+        membership,
+        compartment_masks,
+        neighbor_engine,
+        limit,
+        radii,
+        tile_memory_budget=None,
+    ):
+        """
+        Self-contained cell pair construction and counting for one field of view,
+        suitable for dispatch to a worker process.
+
+        :param points: The cell locations, one row per cell.
+        :type points: numpy.ndarray
+
+        :param membership: See :py:meth:`get_membership_matrix`.
+        :type membership: numpy.ndarray
+
+        :param compartment_masks: See :py:meth:`get_compartment_masks`.
+        :type compartment_masks: dict
+
+        :param neighbor_engine: One of the design's ``neighbor_engines``.
+        :type neighbor_engine: str
+
+        :param limit: Pixel distance above which pairs are discarded.
+        :type limit: float
+
+        :param radii: The radii of interest.
+        :type radii: list
+
+        :param tile_memory_budget: If provided, the cell pairs are found and counted
+            tile by tile within this many megabytes (see
+            :py:meth:`count_fov_cell_pairs_tiled`), and ``neighbor_engine`` is not
+            used.
+        :type tile_memory_budget: float
+
+        :return: See :py:meth:`count_fov_cell_pairs`.
+        :rtype: list
+        """
+        if tile_memory_budget is not None:
+            return PhenotypeProximityCalculator.count_fov_cell_pairs_tiled(
+                points,
+                membership,
+                compartment_masks,
+                limit,
+                radii,
+                tile_memory_budget,
+            )
+        if neighbor_engine == 'dense':
+            distance_matrix = PhenotypeProximityCalculator.get_dense_distance_matrix(points, limit)
+        else:
+            distance_matrix = PhenotypeProximityCalculator.get_sparse_distance_matrix(points, limit)
+        return PhenotypeProximityCalculator.count_fov_cell_pairs(
+            distance_matrix,
+            membership,
+            compartment_masks,
+            radii,
+        )
+
+    @staticmethod
+    def count_fov_cell_pairs(distance_matrix, membership, compartment_masks, radii):
+        """
+        :param distance_matrix: Cell pair distances for one field of view, see
+            :py:meth:`create_cell_pairs_tables`.
+        :type distance_matrix: numpy.ndarray or scipy.sparse.spmatrix
+
+        :param membership: See :py:meth:`get_membership_matrix`.
+        :type membership: numpy.ndarray
+
+        :param compartment_masks: See :py:meth:`get_compartment_masks`.
+        :type compartment_masks: dict
+
+        :param radii: The radii of interest.
+        :type radii: list
+
+        :return: A 2-element list. The first is, for each compartment (and "all"),
+            the radii-by-phenotypes-by-phenotypes array of counts of cell pairs within
+            each radius. The second is, for each compartment, the per-phenotype
+            source cell counts.
+        :rtype: list
+        """
+        memberships = PhenotypeProximityCalculator.get_compartment_memberships(
+            membership,
+            compartment_masks,
+        )
+        counts, source_counts = PhenotypeProximityCalculator.initialize_fov_counts(
+            memberships,
+            radii,
+        )
+        everything = slice(None)
+        PhenotypeProximityCalculator.accumulate_block_counts(
+            counts,
+            source_counts,
+            distance_matrix,
+            everything,
+            everything,
+            memberships,
+            radii,
+        )
+        for compartment in counts:
+            counts[compartment] = np.cumsum(counts[compartment], axis=0)
+        return [counts, source_counts]
+
+    @staticmethod
+    def count_fov_cell_pairs_tiled(
+        points,
+        membership,
+        compartment_masks,
+        limit,
+        radii,
+        tile_memory_budget,
+    ):
+        """
+        Memory-bounded alternative to :py:meth:`count_fov_cell_pairs`. The field of
+        view is split into tiles (see :py:meth:`get_tiles`), each small enough that
+        the pairs between its cells and the cells of its halo fit in the memory
+        budget. The pairs of one tile at a time are counted into the accumulators,
+        so peak memory usage is determined by the budget rather than by the number
+        of cell pairs in the whole field of view.
+
+        :param points: The cell locations, one row per cell.
+        :type points: numpy.ndarray
+
+        :param membership: See :py:meth:`get_membership_matrix`.
+        :type membership: numpy.ndarray
+
+        :param compartment_masks: See :py:meth:`get_compartment_masks`.
+        :type compartment_masks: dict
+
+        :param limit: Pixel distance above which pairs are discarded.
+        :type limit: float
+
+        :param radii: The radii of interest.
+        :type radii: list
+
+        :param tile_memory_budget: Megabytes available for the cell pairs of one tile.
+        :type tile_memory_budget: float
+
+        :return: See :py:meth:`count_fov_cell_pairs`.
+        :rtype: list
+        """
+        memberships = PhenotypeProximityCalculator.get_compartment_memberships(
+            membership,
+            compartment_masks,
+        )
+        counts, source_counts = PhenotypeProximityCalculator.initialize_fov_counts(
+            memberships,
+            radii,
+        )
+        max_pairs = tile_memory_budget * pow(10, 6) / PhenotypeProximityCalculator.bytes_per_cell_pair
+        number_tiles = 0
+        for core, extended in PhenotypeProximityCalculator.get_tiles(points, limit, max_pairs):
+            distance_block = PhenotypeProximityCalculator.get_sparse_distance_block(
+                points[core],
+                points[extended],
+                limit,
+            )
+            PhenotypeProximityCalculator.accumulate_block_counts(
+                counts,
+                source_counts,
+                distance_block,
+                core,
+                extended,
+                memberships,
+                radii,
+            )
+            number_tiles += 1
+        logger.debug('Counted %s cells in %s tiles.', points.shape[0], number_tiles)
+        for compartment in counts:
+            counts[compartment] = np.cumsum(counts[compartment], axis=0)
+        return [counts, source_counts]
+
+    @staticmethod
+    def get_tiles(points, limit, max_pairs):
+        """
+        Recursively bisects the bounding box of the given cells, along its longer
+        side, until the number of pairs between the cells of a tile (the "core") and
+        the cells within ``limit`` of the tile's bounding box (the "halo", which
+        includes the core) is at most ``max_pairs``. The pairs are only counted, not
+        stored, to decide whether to split. A tile whose side cannot be bisected
+        (its cells are at the same or adjacent floating point coordinates) is
+        yielded as is.
+
+        Each cell belongs to the core of exactly one tile, so every within-range cell
+        pair appears in exactly one core-by-halo block.
+
+        :param points: The cell locations, one row per cell.
+        :type points: numpy.ndarray
+
+        :param limit: Pixel distance above which pairs are discarded.
+        :type limit: float
+
+        :param max_pairs: The maximum number of pairs to allow in one tile.
+        :type max_pairs: float
+
+        :return: Generates 2-tuples of integer index arrays into ``points``, the core
+            and halo of each tile.
+        """
+        all_indices = np.arange(points.shape[0])
+        if points.shape[0] == 0:
+            return
+        tiles = [(all_indices, all_indices)]
+        while len(tiles) > 0:
+            core, candidates = tiles.pop()
+            lower = points[core].min(axis=0)
+            upper = points[core].max(axis=0)
+            in_halo = np.all(
+                (points[candidates] >= lower - limit) & (points[candidates] <= upper + limit),
+                axis=1,
+            )
+            extended = candidates[in_halo]
+            number_pairs = cKDTree(points[core]).count_neighbors(
+                cKDTree(points[extended]),
+                limit,
+            )
+            if number_pairs <= max_pairs:
+                yield core, extended
+                continue
+            axis = int(np.argmax(upper - lower))
+            middle = 0.5 * (lower[axis] + upper[axis])
+            if not lower[axis] < middle < upper[axis]:
+                logger.warning(
+                    '%s cells too close together to split exceed tile memory budget; %s pairs.',
+                    len(core),
+                    number_pairs,
+                )
+                yield core, extended
+                continue
+            below = points[core, axis] < middle
+            tiles.append((core[below], extended))
+            tiles.append((core[~below], extended))
+
+    @staticmethod
+    def get_sparse_distance_block(source_points, target_points, limit):
+        """
+        :param source_points: The locations of one set of cells.
+        :type source_points: numpy.ndarray
+
+        :param target_points: The locations of another set of cells.
+        :type target_points: numpy.ndarray
+
+        :param limit: Pixel distance above which pairs are discarded.
+        :type limit: float
+
+        :return: Rectangular sparse matrix of distances from source cells to target
+            cells, with an entry only for pairs at positive distance at most
+            ``limit``, as in :py:meth:`get_sparse_distance_matrix`.
+        :rtype: scipy.sparse.csr_matrix
+        """
+        block = cKDTree(source_points).sparse_distance_matrix(
+            cKDTree(target_points),
+            limit,
+            output_type='ndarray',
+        )
+        block = block[block['v'] > 0]
+        return coo_matrix(
+            (block['v'], (block['i'], block['j'])),
+            shape=(source_points.shape[0], target_points.shape[0]),
+        ).tocsr()
+
+    @staticmethod
+    def get_compartment_memberships(membership, compartment_masks):
+        """
+        :param membership: See :py:meth:`get_membership_matrix`.
+        :type membership: numpy.ndarray
+
+        :param compartment_masks: See :py:meth:`get_compartment_masks`.
+        :type compartment_masks: dict
+
+        :return: For each compartment (and "all"), the membership matrix restricted to
+            the cells in the compartment.
+        :rtype: dict
+        """
+        memberships = {
+            compartment : membership & mask[:, np.newaxis]
+            for compartment, mask in compartment_masks.items()
+        }
+        memberships['all'] = membership
+        return memberships
+
+    @staticmethod
+    def initialize_fov_counts(memberships, radii):
+        """
+        :param memberships: See :py:meth:`get_compartment_memberships`.
+        :type memberships: dict
+
+        :param radii: The radii of interest.
+        :type radii: list
+
+        :return: Zero-initialized accumulators in the format of the return value of
+            :py:meth:`count_fov_cell_pairs`.
+        :rtype: list
+        """
+        counts = {}
+        source_counts = {}
+        for compartment, membership in memberships.items():
+            number_phenotypes = membership.shape[1]
+            counts[compartment] = np.zeros(
+                (len(radii), number_phenotypes, number_phenotypes),
+                dtype=int,
+            )
+            source_counts[compartment] = np.zeros(number_phenotypes, dtype=int)
+        return [counts, source_counts]
+
+    @staticmethod
+    def accumulate_block_counts(
+        counts,
+        source_counts,
+        distance_block,
+        sources,
+        targets,
+        memberships,
+        radii,
+    ):
+        """
+        Adds the (not yet cumulative over radii) cell pair counts of one block of
+        distances, from a set of source cells to a set of target cells, to the
+        accumulators. The source cells are also added to the source cell counts.
+
+        :param counts: Accumulator, see :py:meth:`initialize_fov_counts`.
+        :type counts: dict
+
+        :param source_counts: Accumulator, see :py:meth:`initialize_fov_counts`.
+        :type source_counts: dict
+
+        :param distance_block: Distances from source to target cells.
+
+        :param sources: Index into the cells of the field of view, selecting the
+            source cells.
+
+        :param targets: Index into the cells of the field of view, selecting the
+            target cells.
+
+        :param memberships: See :py:meth:`get_compartment_memberships`.
+        :type memberships: dict
+
+        :param radii: The radii of interest.
+        :type radii: list
+        """
+        block_memberships = {}
+        for compartment, membership in memberships.items():
+            source_membership = csr_matrix(membership[sources], dtype=int)
+            target_membership = csr_matrix(membership[targets], dtype=int)
+            source_counts[compartment] += np.asarray(source_membership.sum(axis=0)).ravel()
+            block_memberships[compartment] = (source_membership, target_membership)
+        binned_adjacency = PhenotypeProximityCalculator.iterate_binned_adjacency(
+            distance_block,
+            radii,
+        )
+        for k, adjacency in enumerate(binned_adjacency):
+            for compartment, (source_membership, target_membership) in block_memberships.items():
+                counts[compartment][k] += (
+                    source_membership.T @ adjacency @ target_membership
+                ).toarray()
+
+    def create_records_from_fov_counts(self, combinations2, fov_counts):
+        """
+        Merges per-FOV counts, in order of field of view index, and creates records.
+
+        :param combinations2: The phenotype pairs to report, see
+            :py:meth:`get_considered_phenotype_pairs`.
+        :type combinations2: list
+
+        :param fov_counts: The return values of :py:meth:`count_fov_cell_pairs`, by
+            field of view integer index.
+        :type fov_counts: dict
+
+        :return: Lists of records, one list for each phenotype pair.
+        :rtype: list
+        """
+        balanced = self.computational_design.balanced
+        phenotypes = self.computational_design.get_all_phenotype_names()
+        phenotype_index = {phenotype : i for i, phenotype in enumerate(phenotypes)}
+        compartments = list(set(self.dataset_design.get_compartments())) + ['all']
+        radii = PhenotypeProximityCalculator.get_radii_of_interest()
+
+        counts = {
+            compartment : np.zeros((len(radii), len(phenotypes), len(phenotypes)), dtype=int)
+            for compartment in compartments
+        }
+        source_counts = {
+            compartment : np.zeros(len(phenotypes), dtype=int) for compartment in compartments
+        }
+        for fov_index in sorted(fov_counts.keys()):
+            fov_pair_counts, fov_source_counts = fov_counts[fov_index]
+            for compartment in compartments:
+                counts[compartment] += fov_pair_counts[compartment]
+                source_counts[compartment] += fov_source_counts[compartment]
+
+        if balanced:
+            areas = {
+                compartment : self.get_compartment_area(compartment, self.fov_lookup.keys())
+                for compartment in compartments
+            }
+        else:
+            areas = {compartment : None for compartment in compartments}
+
+        results = []
+        for pair in combinations2:
+            if balanced:
+                source, target = sorted(list(pair))
+            else:
+                source, target = [pair[0], pair[1]]
+            i = phenotype_index[source]
+            j = phenotype_index[target]
+            records = []
+            for compartment in compartments:
+                records += self.create_records(
+                    source,
+                    target,
+                    compartment,
+                    radii,
+                    counts[compartment][:, i, j],
+                    source_counts[compartment][i],
+                    areas[compartment],
+                )
+            results.append(records)
+        return results
+
+    @staticmethod
+    def iterate_binned_adjacency(distance_matrix, radii):
+        """
+        The bin of each cell pair is found once. The matrix of one bin is built from
+        the entries in that bin only, so that the matrices hold as many entries in
+        total as the distance matrix, and only one need be kept at a time.
+
+        :param distance_matrix: Cell pair distances for one field of view, dense or
+            sparse. See :py:meth:`create_cell_pairs_tables`.
+
+        :param radii: Increasing distance limits in pixels.
+        :type radii: list
+
+        :return: Generates one sparse 0/1 matrix for each radius, indicating the cell
+            pairs whose distance is less than that radius but not less than the
+            previous one.
+        """
+        distances = csr_matrix(distance_matrix)
+        bins = np.searchsorted(radii, distances.data, side='right')
+        for k in range(len(radii)):
+            in_bin = bins == k
+            entries_before = np.concatenate([[0], np.cumsum(in_bin)])
+            yield csr_matrix(
+                (
+                    np.ones(entries_before[-1], dtype=int),
+                    distances.indices[in_bin],
+                    entries_before[distances.indptr],
+                ),
+                shape=distances.shape,
+            )
+
+    def create_records(self,
+        source,
+        target,
+        compartment,
+        radii,
+        counts,
+        source_count,
+        area,
+    ):
+        """
+        :param source: The source phenotype name.
+        :type source: str
+
+        :param target: The target phenotype name.
+        :type target: str
+
+        :param compartment: The compartment name, or "all".
+        :type compartment: str
+
+        :param radii: The distance limits in pixels.
+        :type radii: list
+
+        :param counts: The number of cell pairs within each distance limit.
+        :type counts: list
+
+        :param source_count: The number of cells of the source phenotype.
+        :type source_count: int
+
+        :param area: The compartment area, used only in the balanced case.
+        :type area: float
+
+        :return: The cell pair counts records for the given case, one for each radius.
+        :rtype: list
+        """
+        records = []
+        for radius, count in zip(radii, counts):
+            if source_count == 0:
+                logger.warning(
+                    'No cells of "source" phenotype %s in %s, %s, within %s .',
+                    source,
+                    self.sample_identifier,
+                    compartment,
+                    radius,
+                )
+            else:
+                if self.computational_design.balanced:
+                    feature_value = count / area
                 else:
-                    if balanced:
-                        feature_value = count / area
-                    else:
-                        feature_value = count / source_count # See GitHub issue #20
-                    records.append([
-                        self.sample_identifier,
-                        self.input_filename,
-                        self.outcome,
-                        source,
-                        target,
-                        compartment,
-                        radius,
-                        feature_value,
-                        source_count,
-                    ])
+                    feature_value = count / source_count # See GitHub issue #20
+                records.append([
+                    self.sample_identifier,
+                    self.input_filename,
+                    self.outcome,
+                    source,
+                    target,
+                    compartment,
+                    radius,
+                    feature_value,
+                    source_count,
+                ])
         return records
 
+    def get_compartment_area(self, compartment, fov_indices):
+        """
+        :param compartment: A compartment name, or "all" for the total over compartments.
+        :type compartment: str
+
+        :param fov_indices: The integer indices of the fields of view to include.
+        :type fov_indices: list
+
+        :return: The total area of the given compartment over the given fields of view.
+        :rtype: float
+        """
+        area = 0
+        for fov_index in fov_indices:
+            fov = self.fov_lookup[fov_index]
+            if compartment == 'all':
+                area0 = self.areas.get_total_compartmental_area(fov=fov)
+            else:
+                area0 = self.areas.get_area(fov=fov, compartment=compartment)
+            if area0 is None:
+                logger.warning(
+                    ''.join([
+                        'Did not find area for "%s" compartment in field of view "%s".',
+                        ' Skipping field of view "%s" in "%s".',
+                    ]),
+                    compartment,
+                    fov_index,
+                    fov_index,
+                    self.sample_identifier,
+                )
+                continue
+            area += area0
+        if area == 0:
+            logger.warning(
+                'Did not find ANY area for "%s" compartment in "%s".',
+                compartment,
+                self.sample_identifier,
+            )
+        return area
+
     def write_cell_pair_counts(self, radius_limited_counts):
         """
         :param radius_limited_counts: Cell pair counts table.
         :type radius_limited_counts: pandas.DataFrame
         """
         header = self.computational_design.get_cell_pair_counts_table_header()
-        keys_list = [column_name for column_name, dtype in header]
-
-        uri = join(self.output_path, self.computational_design.get_database_uri())
-        with WaitingDatabaseContextManager(uri) as manager:
-            for _, row in radius_limited_counts.iterrows():
-                values_list = [
-                    '"' + row['sample identifier'] + '"',
-                    '"' + row['input filename'] + '"',
-                    '"' + row['outcome assignment'] + '"',
-                    '"' + row['source phenotype'] + '"',
-                    '"' + row['target phenotype'] + '"',
-                    '"' + row['compartment'] + '"',
-                    str(int(row['distance limit in pixels'])),
-                    str(float(row[self.computational_design.get_primary_output_feature_name()])),
-                    str(int(row['source phenotype count'])),
-                ] # Make this programmatic over the headers provided by computational design???
-                keys = '( ' + ' , '.join(keys_list) + ' )'
-                values = '( ' + ' , '.join(values_list) + ' )'
-                cmd = ('INSERT INTO %s ' % self.computational_design.get_cell_pair_counts_table_name()) + keys + ' VALUES ' + values +  ' ;'
-                try:
-                    manager.execute(cmd)
-                except sqlite3.OperationalError as exception:
-                    logger.error('SQL query failed: %s', cmd)
-                    print(exception)
+        columns = [radius_limited_counts[column_name.replace('_', ' ')] for column_name, _ in header]
+        with open_result_writer(self.database_uri) as manager:
+            number_rows = manager.bulk_insert(
+                self.computational_design.get_cell_pair_counts_table_name(),
+                header,
+                columns,
+            )
+        logger.debug('Wrote %s cell pair count records to %s.', number_rows, self.database_uri)
+
+    @staticmethod
+    def count_pairs_by_radius(distance_matrix, rows, cols, radii):
+        """
+        Counts cell pairs under each of several distance limits in a single pass. Each
+        in-range pair distance is assigned once to the bin of the smallest radius
+        exceeding it, and the counts for all radii are the cumulative sums of the bin
+        sizes. The cost is therefore independent of the number of radii.
+
+        :param distance_matrix: Cell pair distances for one field of view, dense or
+            sparse. See :py:meth:`create_cell_pairs_tables`.
+
+        :param rows: Boolean mask of source cells.
+        :type rows: pandas.Series
+
+        :param cols: Boolean mask of target cells.
+        :type cols: pandas.Series
+
+        :param radii: Increasing distance limits in pixels. See
+            :py:meth:`get_radii_of_interest`.
+        :type radii: list
+
+        :return: For each radius, the number of (source, target) cell pairs at positive
+            distance less than the radius.
+        :rtype: numpy.ndarray
+        """
+        rows = np.asarray(rows, dtype=bool)
+        cols = np.asarray(cols, dtype=bool)
+        p2p_distance_matrix = distance_matrix[rows][:, cols]
+        if issparse(p2p_distance_matrix):
+            distances = p2p_distance_matrix.data
+        else:
+            distances = p2p_distance_matrix[p2p_distance_matrix > 0]
+        return PhenotypeProximityCalculator.cumulative_counts_by_radius(distances, radii)
+
+    @staticmethod
+    def cumulative_counts_by_radius(distances, radii):
+        """
+        :param distances: Positive pair distances.
+        :type distances: numpy.ndarray
+
+        :param radii: Increasing distance limits.
+        :type radii: list
+
+        :return: For each radius, the number of distances less than the radius.
+        :rtype: numpy.ndarray
+        """
+        bins = np.searchsorted(radii, distances, side='right')
+        return np.cumsum(np.bincount(bins, minlength=len(radii) + 1)[0:len(radii)])
 
     @staticmethod
     def get_radii_of_interest():
@@ -11,6 +11,7 @@ import numpy as np
 from scipy.stats import ttest_ind, kruskal
 
 from ...environment.settings_wrappers import JobsPaths, DatasetSettings
+from ...environment.database_shards import DatabaseShards
 from ...environment.log_formats import colorized_logger
 
 logger = colorized_logger(__name__)
@@ -48,6 +49,7 @@ class PhenotypeProximityAnalysisIntegrator:
             'Doing %s phenotype proximity workflow integration phase.',
             'balanced' if self.computational_design.balanced else 'unbalanced',
         )
+        DatabaseShards(join(self.output_path, self.computational_design.get_database_uri())).merge()
         cell_proximity_tests = self.do_outcome_tests()
         if cell_proximity_tests is not None:
             self.export_results(cell_proximity_tests)
@@ -24,7 +24,7 @@ class PhenotypeProximityJobGenerator(JobGenerator):
     """
     lsf_template = '''#!/bin/bash
 #BSUB -J {{job_name}}
-#BSUB -n "1"
+#BSUB -n "{{workers}}"
 #BSUB -W 2:00
 #BSUB -R "rusage[mem={{memory_in_gb}}]"
 #BSUB -R "span[hosts=1]"
@@ -40,12 +40,21 @@ singularity exec \
     cli_call_template = '''spt-cell-phenotype-proximity-analysis \
  --input-file-identifier "{{input_file_identifier}}" \
  --job-index {{job_index}} \
+ --workers {{workers}} \
+ --neighbor-engine {{neighbor_engine}} \
+ --counting-engine {{counting_engine}} \
 '''
 
     def __init__(self,
         elementary_phenotypes_file=None,
         complex_phenotypes_file=None,
         balanced: bool=False,
+        workers: int=1,
+        neighbor_engine: str='sparse',
+        counting_engine: str='matrix',
+        tile_memory_budget: float=None,
+        whole_slide: bool=False,
+        chunk_size: int=None,
         **kwargs,
     ):
         """
@@ -60,6 +69,30 @@ singularity exec \
         :param balanced: Whether to use balanced or unbalanced treatment of phenotype
             pairs.
         :type balanced: bool
+
+        :param workers: The number of worker processes (and cores requested) per job.
+        :type workers: int
+
+        :param neighbor_engine: The method for finding cell pairs, passed to jobs. See
+            :py:class:`PhenotypeProximityDesign`.
+        :type neighbor_engine: str
+
+        :param counting_engine: The method for aggregating cell pair counts, passed to
+            jobs. See :py:class:`PhenotypeProximityDesign`.
+        :type counting_engine: str
+
+        :param tile_memory_budget: Megabytes for tiled cell pair counting, see
+            :py:class:`PhenotypeProximityDesign`. If provided, the memory requested
+            for each job no longer scales with the square of the number of cells.
+        :type tile_memory_budget: float
+
+        :param whole_slide: Whether to ignore field of view boundaries, passed to
+            jobs. See :py:class:`PhenotypeProximityDesign`.
+        :type whole_slide: bool
+
+        :param chunk_size: The number of rows with which jobs read input files in
+            chunks, passed to jobs. See :py:class:`PhenotypeProximityCalculator`.
+        :type chunk_size: int
         """
         super().__init__(**kwargs)
         self.dataset_design = HALOCellMetadataDesign(
@@ -68,7 +101,17 @@ singularity exec \
         self.computational_design = PhenotypeProximityDesign(
             dataset_design=self.dataset_design,
             complex_phenotypes_file=complex_phenotypes_file,
+            neighbor_engine=neighbor_engine,
+            counting_engine=counting_engine,
         )
+        self.workers = int(workers)
+        self.neighbor_engine = neighbor_engine
+        self.counting_engine = counting_engine
+        if tile_memory_budget is not None:
+            tile_memory_budget = float(tile_memory_budget)
+        self.tile_memory_budget = tile_memory_budget
+        self.whole_slide = str(whole_slide) == 'True'
+        self.chunk_size = int(chunk_size) if chunk_size is not None else None
         self.lsf_job_filenames = []
         self.sh_job_filenames = []
 
@@ -82,7 +125,11 @@ singularity exec \
                 job_index = self.register_job_existence()
                 job_name = 'cell_proximity_' + str(job_index)
                 log_filename = join(self.jobs_paths.logs_path, job_name + '.out')
-                memory = PhenotypeProximityJobGenerator.get_memory_requirements(row)
+                memory = PhenotypeProximityJobGenerator.get_memory_requirements(
+                    row,
+                    tile_memory_budget=self.tile_memory_budget,
+                    workers=self.workers,
+                )
 
                 bsub_job = JobGenerator.apply_replacements(
                     PhenotypeProximityJobGenerator.lsf_template,
@@ -94,6 +141,7 @@ singularity exec \
                         '{{excluded_hostname}}': self.excluded_hostname,
                         '{{sif_file}}' : self.runtime_settings.sif_file,
                         '{{memory_in_gb}}' : str(memory),
+                        '{{workers}}' : str(self.workers),
                     }
                 )
 
@@ -102,8 +150,17 @@ singularity exec \
                     {
                         '{{input_file_identifier}}' : row['File ID'],
                         '{{job_index}}' : str(job_index),
+                        '{{workers}}' : str(self.workers),
+                        '{{neighbor_engine}}' : self.neighbor_engine,
+                        '{{counting_engine}}' : self.counting_engine,
                     }
                 )
+                if self.tile_memory_budget is not None:
+                    cli_call += ' --tile-memory-budget %s ' % self.tile_memory_budget
+                if self.whole_slide:
+                    cli_call += ' --whole-slide '
+                if self.chunk_size is not None:
+                    cli_call += ' --chunk-size %s ' % self.chunk_size
 
                 bsub_job = re.sub('{{cli_call}}', cli_call, bsub_job)
 
@@ -124,17 +181,27 @@ singularity exec \
                 chmod(sh_job_filename, os.stat(sh_job_filename).st_mode | stat.S_IEXEC)
 
     @staticmethod
-    def get_memory_requirements(file_record):
+    def get_memory_requirements(file_record, tile_memory_budget=None, workers=1):
         """
         :param file_record: Record as it would appear in the file metadata table.
         :type file_record: dict
 
+        :param tile_memory_budget: Megabytes for the cell pairs of one tile, if tiled
+            counting is used.
+        :type tile_memory_budget: float
+
+        :param workers: The number of worker processes in the job, each of which
+            counts one tile at a time.
+        :type workers: int
+
         :return: ``memory_in_gb``. The positive integer number of gigabytes to request
             for a job involving the given input file.
         :rtype: int
         """
         file_size_gb = float(file_record['Size']) / pow(10, 9)
-        return 1 + math.ceil(file_size_gb * 10)
+        if tile_memory_budget is None:
+            return 1 + math.ceil(file_size_gb * 10)
+        return 1 + math.ceil(file_size_gb * 3) + math.ceil(workers * tile_memory_budget / 1000)
 
     def initialize_intermediate_database(self):
         """
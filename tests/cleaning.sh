@@ -1,14 +1,14 @@
 #!/bin/bash
 
 function _cleanup() {
-    for file in .cell_metadata.tsv.cache .file_metadata.cache .fov_lookup.tsv.cache .pipeline.db ;
+    for file in .file_metadata.cache .pipeline.db .pipeline.db-wal .pipeline.db-shm ;
     do
         if [[ -f $file ]];
         then
             rm $file
         fi
     done
-    for directory in jobs logs output __pycache__ ;
+    for directory in jobs logs output __pycache__ .columnar_cache .cell_metadata.store .cell_metadata.shards ;
     do
         if [[ -d $directory ]];
         then
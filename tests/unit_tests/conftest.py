@@ -0,0 +1,9 @@
+import pytest
+
+@pytest.fixture(autouse=True)
+def run_in_temporary_directory(tmp_path, monkeypatch):
+    """
+    Runs each test in its own temporary working directory, so that caches and output
+    files written relative to the working directory are not left in the source tree.
+    """
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+import numpy as np
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.bit_matrix import PackedBitMatrix
+
+def test_combine_and_unpack():
+    generator = np.random.default_rng(0)
+    number_cells = 150
+    a = generator.random(number_cells) < 0.5
+    b = generator.random(number_cells) < 0.5
+    masks = PackedBitMatrix(['a', 'b', 'a and not b'], number_cells)
+    masks.set_feature('a', a)
+    masks.set_feature('b', b)
+    masks.set_feature_words('a and not b', masks.combine(['a'], ['b']))
+    expected = a & ~b
+    assert np.array_equal(masks.get_mask('a and not b'), expected)
+    assert masks.count('a and not b') == int(expected.sum())
+    assert np.array_equal(masks.get_mask('a and not b', 70, 131), expected[70:131])
+    all_absent = masks.combine([], ['a', 'b'])
+    assert int(np.unpackbits(all_absent.view(np.uint8)).sum()) == int((~a & ~b).sum())
+
+
+if __name__=='__main__':
+    test_combine_and_unpack()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+import tempfile
+from os.path import join
+
+import pandas as pd
+import numpy as np
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.cell_store import CellStore
+
+def test_cell_store_round_trip():
+    table = pd.DataFrame({
+        'Sample ID index' : [0, 0, 0, 1, 1],
+        'Field of view index' : [0, 0, 1, 0, 0],
+        'CD3+' : np.array([1, 0, 1, 1, 0], dtype=np.uint8),
+        'CD3 intensity' : [0.5, 0.25, 1.0, 2.0, 0.0],
+    })
+    offsets = {(0, 0) : (0, 2), (0, 1) : (2, 3), (1, 0) : (3, 5)}
+    lookup = {'sample ids' : ['a', 'b'], 'fov descriptors' : [['f1', 'f2'], ['f1']]}
+    with tempfile.TemporaryDirectory() as directory:
+        location = join(directory, 'store')
+        CellStore(location).write(table, offsets, lookup=lookup)
+        store = CellStore(location)
+        assert store.exists()
+        store.open()
+        assert store.get_offsets() == offsets
+        assert store.get_lookup() == lookup
+        assert store.get_table().equals(table)
+        assert store.get_rows(3, 5).equals(table.iloc[3:5])
+        assert isinstance(store.get_column('CD3+'), np.memmap)
+
+
+if __name__=='__main__':
+    test_cell_store_round_trip()
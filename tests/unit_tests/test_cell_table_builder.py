@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+from os.path import join, dirname
+import tempfile
+
+import pandas as pd
+import numpy as np
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.dataset_designs.multiplexed_imaging.halo_cell_metadata_design import HALOCellMetadataDesign
+from spatialprofilingtoolbox.environment.cell_table_builder import CellTableBuilder
+from spatialprofilingtoolbox.environment.columnar_cache import ColumnarCache
+
+def test_memberships_match_signature_evaluation():
+    input_files_path = join(dirname(__file__), '..', 'data')
+    input_file = join(input_files_path, '2779f21192cb0ce1479b2bf7fb20ebba.csv')
+    dataset_design = HALOCellMetadataDesign(
+        elementary_phenotypes_file=join(input_files_path, 'elementary_phenotypes.csv'),
+    )
+    signatures_by_name = {
+        'CD3+' : {'CD3' : '+'},
+        'CD3+CD8-FOXP3-' : {'CD3' : '+', 'CD8' : '-', 'FOXP3' : '-'},
+    }
+    with tempfile.TemporaryDirectory() as cache_location:
+        builder = CellTableBuilder(
+            dataset_design=dataset_design,
+            signatures_by_name=signatures_by_name,
+            columnar_cache=ColumnarCache(cache_location=cache_location),
+        )
+        cell_table = builder.build(input_file)
+
+    table = pd.read_csv(input_file)
+    dataset_design.normalize_fov_descriptors(table)
+    table = table.sort_values('Image Location', kind='mergesort', ignore_index=True)
+    assert list(cell_table.fov_lookup.values()) == sorted(set(table['Image Location']))
+    expected = dataset_design.compile_signatures(signatures_by_name)(table)
+    for name in signatures_by_name:
+        assert np.array_equal(cell_table.get_membership(name), expected[name])
+    labels = cell_table.get_compartment_labels()
+    assert list(labels) == list(table['Classifier Label'])
+    assert np.array_equal(cell_table.coordinates[:, 0], 0.5 * (table['XMin'] + table['XMax']))
+    for start, stop in cell_table.fov_ranges.values():
+        assert len(set(cell_table.table['Image Location'][start:stop])) == 1
+
+def test_missing_positivity_value_reported():
+    input_files_path = join(dirname(__file__), '..', 'data')
+    dataset_design = HALOCellMetadataDesign(
+        elementary_phenotypes_file=join(input_files_path, 'elementary_phenotypes.csv'),
+    )
+    table = pd.read_csv(join(input_files_path, '2779f21192cb0ce1479b2bf7fb20ebba.csv'))
+    column = dataset_design.get_feature_name('CD3')
+    with tempfile.TemporaryDirectory() as directory:
+        builder = CellTableBuilder(
+            dataset_design=dataset_design,
+            signatures_by_name={'CD3+' : {'CD3' : '+'}},
+            columnar_cache=ColumnarCache(cache_location=join(directory, 'cache')),
+        )
+        complete_file = join(directory, 'complete.csv')
+        table.to_csv(complete_file, index=False)
+        assert builder.read_table(complete_file)[column].dtype == np.uint8
+
+        table[column] = table[column].astype(object)
+        table.loc[3, column] = ''
+        incomplete_file = join(directory, 'incomplete.csv')
+        table.to_csv(incomplete_file, index=False)
+        columns, dtype = builder.get_columns()
+        parsed = builder.columnar_cache.read_csv(incomplete_file, columns=columns, dtype=dtype)
+        assert parsed[column].isna().sum() == 1
+        for read in [
+            lambda: builder.build(incomplete_file),
+            lambda: list(builder.iterate(incomplete_file, chunk_size=100)),
+        ]:
+            try:
+                read()
+                assert False
+            except ValueError:
+                pass
+
+
+if __name__=='__main__':
+    test_memberships_match_signature_evaluation()
+    test_missing_positivity_value_reported()
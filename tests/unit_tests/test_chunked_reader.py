@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import tempfile
+from os.path import join
+
+import pandas as pd
+import numpy as np
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.chunked_reader import FOVChunkReader
+
+def test_fov_complete_chunks():
+    table = pd.DataFrame({
+        'FOV' : ['b'] * 3 + ['a'] * 5 + ['c'] * 1 + ['d'] * 4,
+        'value' : np.arange(13),
+    })
+    with tempfile.TemporaryDirectory() as directory:
+        filename = join(directory, 'cells.csv')
+        table.to_csv(filename, index=False)
+        for chunk_size in [1, 2, 4, 100]:
+            reader = FOVChunkReader(filename, 'FOV', dtype={'FOV' : 'category'}, chunk_size=chunk_size)
+            assert reader.get_descriptors() == ['a', 'b', 'c', 'd']
+            chunks = list(reader)
+            for chunk in chunks:
+                assert isinstance(chunk['FOV'].dtype, pd.CategoricalDtype)
+                assert list(chunk.index) == list(range(chunk.shape[0]))
+            fovs = [set(chunk['FOV']) for chunk in chunks]
+            for i, first in enumerate(fovs):
+                for second in fovs[i+1:]:
+                    assert len(first.intersection(second)) == 0
+            assert list(pd.concat(chunks)['value']) == list(range(13))
+
+def test_ungrouped_fovs():
+    table = pd.DataFrame({'FOV' : ['a', 'a', 'b', 'b', 'a'], 'value' : np.arange(5)})
+    with tempfile.TemporaryDirectory() as directory:
+        filename = join(directory, 'cells.csv')
+        table.to_csv(filename, index=False)
+        for chunk_size in [2, 100]:
+            try:
+                list(FOVChunkReader(filename, 'FOV', chunk_size=chunk_size))
+                raised = False
+            except ValueError:
+                raised = True
+            assert raised
+
+
+if __name__=='__main__':
+    test_fov_complete_chunks()
+    test_ungrouped_fovs()
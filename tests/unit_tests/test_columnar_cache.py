@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+from os.path import join, dirname, exists
+import tempfile
+
+import pandas as pd
+import numpy as np
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment import columnar_cache
+from spatialprofilingtoolbox.environment.columnar_cache import ColumnarCache
+
+def test_cached_table_matches_parsed_csv():
+    input_file = join(dirname(__file__), '..', 'data', '2779f21192cb0ce1479b2bf7fb20ebba.csv')
+    expected = pd.read_csv(input_file)
+    with tempfile.TemporaryDirectory() as cache_location:
+        cache = ColumnarCache(cache_location=cache_location)
+        first = cache.read_csv(input_file)
+        second = cache.read_csv(input_file)
+        pd.testing.assert_frame_equal(first, expected)
+        pd.testing.assert_frame_equal(second, expected)
+        columns = list(expected.columns[[3, 0]])
+        subset = cache.read_csv(input_file, columns=columns)
+        pd.testing.assert_frame_equal(subset, expected[columns])
+
+        dtype = {'Image Location' : 'category', 'XMin' : 'float32', 'Dye 1 Positive' : 'uint8'}
+        columns = list(dtype.keys())
+        expected = pd.read_csv(input_file, usecols=columns, dtype=dtype)[columns]
+        for _ in range(2):
+            typed = cache.read_csv(input_file, columns=columns, dtype=dtype)
+            pd.testing.assert_frame_equal(typed, expected)
+        pd.testing.assert_frame_equal(cache.read_csv(input_file), first)
+
+def test_cached_columns_memory_mapped():
+    input_file = join(dirname(__file__), '..', 'data', '2779f21192cb0ce1479b2bf7fb20ebba.csv')
+    with tempfile.TemporaryDirectory() as cache_location:
+        cache = ColumnarCache(cache_location=cache_location)
+        parsed = cache.read_csv(input_file, columns=['XMin'])
+        assert parsed['XMin'].to_numpy().flags.writeable
+        cached = cache.read_csv(input_file, columns=['XMin'])
+        values = cached['XMin'].to_numpy()
+        assert not values.flags.writeable
+        assert isinstance(values.base, np.memmap)
+
+def test_cached_header_and_eviction():
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = join(directory, 'cells.csv')
+        pd.DataFrame({'x' : [1, 2], 'y' : ['a', 'b']}).to_csv(input_file, index=False)
+        cache_location = join(directory, 'cache')
+        first_sha256 = ColumnarCache.compute_sha256(input_file)
+        ColumnarCache(cache_location=cache_location).read_csv(input_file)
+
+        read_csv = columnar_cache.read_csv
+        def failing_read_csv(*args, **kwargs):
+            raise AssertionError
+        columnar_cache.read_csv = failing_read_csv
+        try:
+            cached = ColumnarCache(cache_location=cache_location).read_csv(input_file)
+        finally:
+            columnar_cache.read_csv = read_csv
+        assert list(cached['x']) == [1, 2]
+
+        pd.DataFrame({'x' : [3], 'y' : ['c']}).to_csv(input_file, index=False)
+        changed = ColumnarCache(cache_location=cache_location).read_csv(input_file)
+        assert list(changed['x']) == [3]
+        assert not exists(join(cache_location, first_sha256))
+        assert exists(join(cache_location, ColumnarCache.compute_sha256(input_file)))
+
+
+if __name__=='__main__':
+    test_cached_table_matches_parsed_csv()
+    test_cached_columns_memory_mapped()
+    test_cached_header_and_eviction()
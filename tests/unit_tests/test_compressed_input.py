@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+from os.path import join, dirname
+import tempfile
+import gzip
+import shutil
+
+import pandas as pd
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment import compressed_input
+from spatialprofilingtoolbox.environment.compressed_input import read_csv, read_csv_chunks
+from spatialprofilingtoolbox.environment.columnar_cache import ColumnarCache
+
+def compress(input_file, directory):
+    filenames = [join(directory, 'cells.csv.gz')]
+    with open(input_file, 'rb') as source, gzip.open(filenames[0], 'wb') as target:
+        shutil.copyfileobj(source, target)
+    if compressed_input.zstandard is not None:
+        filenames.append(join(directory, 'cells.csv.zst'))
+        with open(input_file, 'rb') as source, open(filenames[1], 'wb') as target:
+            compressed_input.zstandard.ZstdCompressor().copy_stream(source, target)
+    return filenames
+
+def test_compressed_tables_match_plain():
+    input_file = join(dirname(__file__), '..', 'data', '2779f21192cb0ce1479b2bf7fb20ebba.csv')
+    expected = pd.read_csv(input_file)
+    with tempfile.TemporaryDirectory() as directory:
+        for filename in compress(input_file, directory):
+            pd.testing.assert_frame_equal(read_csv(filename), expected)
+            chunks = list(read_csv_chunks(filename, 100))
+            assert len(chunks) > 1
+            pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+
+            cache = ColumnarCache(cache_location=join(directory, 'cache'))
+            for _ in range(2):
+                pd.testing.assert_frame_equal(cache.read_csv(filename), expected)
+            assert ColumnarCache.compute_sha256(filename) != ColumnarCache.compute_sha256(input_file)
+
+
+if __name__=='__main__':
+    test_compressed_tables_match_plain()
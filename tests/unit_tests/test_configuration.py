@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import sys
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.configuration import get_config_parameters_from_cli
+
+def parse_arguments(*arguments):
+    argv = sys.argv
+    sys.argv = [
+        'spt-configure',
+        '--sif-file', 'sat.sif',
+        '--computational-workflow', 'Multiplexed IF density',
+        '--input-path', './data/',
+        '--outcomes-file', './data/diagnosis.tsv',
+        '--output-path', './output',
+        '--jobs-path', './jobs',
+        '--schedulers-path', './',
+        '--file-manifest', './data/file_manifest.tsv',
+        '--runtime-platform', 'local',
+        '--elementary-phenotypes-file', './data/elementary_phenotypes.csv',
+        '--complex-phenotypes-file', './data/complex_phenotypes.csv',
+        '--logs-path', './logs',
+        '--excluded-hostname', 'NO_EXCLUDED_HOSTNAME',
+        '--skip-integrity-check', 'False',
+        '--balanced', 'False',
+        '--save-graphml', 'False',
+    ] + list(arguments)
+    try:
+        return get_config_parameters_from_cli()
+    finally:
+        sys.argv = argv
+
+def test_chunk_size():
+    assert 'chunk_size' not in parse_arguments()
+    assert parse_arguments('--chunk-size', '5000')['chunk_size'] == 5000
+    for value in ['0', '-10', 'many']:
+        try:
+            parse_arguments('--chunk-size', value)
+            rejected = False
+        except SystemExit:
+            rejected = True
+        assert rejected
+
+
+if __name__=='__main__':
+    test_chunk_size()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+from os.path import join
+import tempfile
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.database_context_utility import WaitingDatabaseContextManager
+
+def test_retry_while_locked():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, 'test.db')
+        with WaitingDatabaseContextManager(uri, journal_mode='WAL') as manager:
+            manager.execute_commit('CREATE TABLE values_table ( value INTEGER ) ;')
+            assert manager.execute('PRAGMA journal_mode ;') == [('wal',)]
+        with WaitingDatabaseContextManager(uri) as manager:
+            assert manager.execute('PRAGMA journal_mode ;') == [('wal',)]
+
+        blocker = sqlite3.connect(uri, isolation_level=None, check_same_thread=False)
+        blocker.execute('BEGIN IMMEDIATE ;')
+        release = threading.Timer(0.5, lambda: blocker.execute('COMMIT ;'))
+        release.start()
+        start = time.perf_counter()
+        with WaitingDatabaseContextManager(uri, seconds=0.05, busy_timeout=0.01) as manager:
+            manager.execute_many('INSERT INTO values_table ( value ) VALUES ( ? ) ;', [(i,) for i in range(10)])
+            count = manager.execute('SELECT COUNT(*) FROM values_table ;')[0][0]
+        release.join()
+        blocker.close()
+        assert count == 10
+        assert manager.retries > 0
+        assert 0 < manager.lock_wait_seconds <= time.perf_counter() - start
+        statistics = WaitingDatabaseContextManager.get_statistics()
+        assert statistics['retries'] >= manager.retries
+
+def test_wait_recorded_with_default_timeouts():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, 'test.db')
+        with WaitingDatabaseContextManager(uri) as manager:
+            manager.execute_commit('CREATE TABLE values_table ( value INTEGER ) ;')
+            assert manager.execute('PRAGMA journal_mode ;') == [('delete',)]
+
+        blocker = sqlite3.connect(uri, isolation_level=None, check_same_thread=False)
+        blocker.execute('BEGIN IMMEDIATE ;')
+        blocker.execute('INSERT INTO values_table ( value ) VALUES ( 0 ) ;')
+        hold_seconds = 1.0
+        release = threading.Timer(hold_seconds, lambda: blocker.execute('COMMIT ;'))
+        release.start()
+        with WaitingDatabaseContextManager(uri) as manager:
+            manager.execute_many('INSERT INTO values_table ( value ) VALUES ( ? ) ;', [(1,), (2,)])
+        release.join()
+        blocker.close()
+        assert manager.retries > 0
+        assert manager.lock_wait_seconds > hold_seconds - 2 * manager.busy_timeout - 0.2
+
+
+def test_bulk_insert():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, 'test.db')
+        header = [('sample', 'VARCHAR(25)'), ('count', 'INTEGER'), ('value', 'NUMERIC')]
+        with WaitingDatabaseContextManager(uri) as manager:
+            manager.execute('CREATE TABLE records ( id INTEGER PRIMARY KEY AUTOINCREMENT, sample VARCHAR(25), count INTEGER, value NUMERIC ) ;')
+            number_rows = manager.bulk_insert('records', header, [
+                np.array(['a"b', 'c', 'd']),
+                np.array([1, 2, 3], dtype=np.int64),
+                np.array([0.5, np.nan, 2.0]),
+            ], chunk_size=2)
+            assert number_rows == 3
+            frame = pd.DataFrame({'value': [4.0], 'count': [np.int32(4)], 'sample': ["e'f"]})
+            assert manager.bulk_insert('records', header, frame) == 1
+            assert manager.bulk_insert('records', ['sample'], [[]]) == 0
+            rows = manager.execute('SELECT sample, count, value, typeof(count) FROM records ORDER BY id ;')
+            try:
+                manager.bulk_insert('records', header, [[1], [2]])
+                raised = False
+            except ValueError:
+                raised = True
+            assert raised
+        assert rows == [
+            ('a"b', 1, 0.5, 'integer'),
+            ('c', 2, None, 'integer'),
+            ('d', 3, 2, 'integer'),
+            ("e'f", 4, 4, 'integer'),
+        ]
+
+
+if __name__=='__main__':
+    test_retry_while_locked()
+    test_wait_recorded_with_default_timeouts()
+    test_bulk_insert()
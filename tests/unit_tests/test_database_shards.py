@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+from os.path import join, exists
+import tempfile
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.database_context_utility import WaitingDatabaseContextManager
+from spatialprofilingtoolbox.environment.database_shards import DatabaseShards
+
+def test_merge_completed_shards():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, 'workflow.db')
+        with WaitingDatabaseContextManager(uri) as manager:
+            manager.execute('CREATE TABLE counts ( id INTEGER PRIMARY KEY AUTOINCREMENT, sample TEXT, count INTEGER ) ;')
+            manager.execute('INSERT INTO counts ( sample, count ) VALUES ( "existing", 0 ) ;')
+        shards = DatabaseShards(uri)
+        for job_index in [10, 2, 7]:
+            shard_uri = shards.create_shard(job_index)
+            with WaitingDatabaseContextManager(shard_uri) as manager:
+                for count in range(3):
+                    manager.execute('INSERT INTO counts ( sample, count ) VALUES ( "%s", %s ) ;' % (job_index, count))
+            if job_index != 7:
+                shards.complete_shard(job_index)
+        assert shards.get_shard_uris() == [shards.get_shard_uri(2), shards.get_shard_uri(10)]
+
+        shards.merge()
+        with WaitingDatabaseContextManager(uri) as manager:
+            rows = manager.execute('SELECT id, sample, count FROM counts ORDER BY id ;')
+        assert rows == [(1, 'existing', 0)] + [
+            (2 + 3 * i + count, sample, count)
+            for i, sample in enumerate(['2', '10'])
+            for count in range(3)
+        ]
+        assert shards.get_shard_uris() == []
+        assert exists(shards.get_partial_shard_uri(7))
+
+        shards.merge()
+        with WaitingDatabaseContextManager(uri) as manager:
+            assert manager.execute('SELECT COUNT(*) FROM counts ;')[0][0] == 7
+
+def test_merge_quoted_column_names():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, 'workflow.db')
+        with WaitingDatabaseContextManager(uri) as manager:
+            manager.execute('CREATE TABLE counts ( id INTEGER PRIMARY KEY AUTOINCREMENT, "sample id" TEXT, "group" INTEGER ) ;')
+        shards = DatabaseShards(uri)
+        shard_uri = shards.create_shard(1)
+        with WaitingDatabaseContextManager(shard_uri) as manager:
+            manager.execute('INSERT INTO counts ( "sample id", "group" ) VALUES ( "a", 1 ) ;')
+        shards.complete_shard(1)
+        shards.merge()
+        with WaitingDatabaseContextManager(uri) as manager:
+            assert manager.execute('SELECT "sample id", "group" FROM counts ;') == [('a', 1)]
+
+
+if __name__=='__main__':
+    test_merge_completed_shards()
+    test_merge_quoted_column_names()
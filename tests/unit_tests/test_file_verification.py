@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+from os.path import join
+import os
+import tempfile
+import hashlib
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.columnar_cache import ColumnarCache
+from spatialprofilingtoolbox.environment.file_verification import FileVerificationCache
+
+def write_files(directory, number):
+    checksums = {}
+    for i in range(number):
+        filename = join(directory, 'cells_%s.csv' % i)
+        contents = ('x,y\n%s,%s\n' % (i, i)).encode('utf-8')
+        with open(filename, 'wb') as file:
+            file.write(contents)
+        checksums[filename] = hashlib.sha256(contents).hexdigest()
+    return checksums
+
+def test_checksums_reused_until_file_changes():
+    hashed = []
+    compute_sha256 = ColumnarCache.compute_sha256
+    def counting_sha256(filename):
+        hashed.append(filename)
+        return compute_sha256(filename)
+    ColumnarCache.compute_sha256 = staticmethod(counting_sha256)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            uri = join(directory, '.pipeline.db')
+            checksums = write_files(directory, 4)
+            FileVerificationCache(uri, policy='full', workers=2).fill(checksums)
+            assert sorted(hashed) == sorted(checksums)
+
+            hashed.clear()
+            cache = FileVerificationCache(uri)
+            for filename, checksum in checksums.items():
+                assert cache.get_sha256(filename) == checksum
+            assert hashed == []
+
+            changed = list(checksums)[0]
+            with open(changed, 'ab') as file:
+                file.write(b'1,1\n')
+            assert cache.get_sha256(changed) != checksums[changed]
+            assert cache.get_sha256(changed) != checksums[changed]
+            assert hashed == [changed]
+
+            hashed.clear()
+            FileVerificationCache(uri, policy='sampled', sample_fraction=0.5).fill(checksums)
+            assert len(hashed) == 2
+            verified = [cache.get_record(filename)[5] for filename in checksums]
+            assert sorted(verified) == [0, 0, 1, 1]
+
+            hashed.clear()
+            FileVerificationCache(uri, policy='skip').fill(checksums)
+            assert cache.get_sha256(changed) == checksums[changed]
+            assert hashed == []
+    finally:
+        ColumnarCache.compute_sha256 = staticmethod(compute_sha256)
+
+def test_changed_file_reparsed_under_skip():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, '.pipeline.db')
+        checksums = write_files(directory, 1)
+        filename = list(checksums)[0]
+        FileVerificationCache(uri, policy='skip').fill(checksums)
+        verification = FileVerificationCache(uri)
+        columnar_cache = ColumnarCache(cache_location=join(directory, 'cache'))
+        table = columnar_cache.read_csv(filename, sha256=verification.get_sha256(filename))
+        assert list(table['x']) == [0]
+
+        with open(filename, 'wb') as file:
+            file.write(b'x,y\n7,7\n8,8\n')
+        sha256 = verification.get_sha256(filename)
+        assert sha256 != checksums[filename]
+        assert verification.get_record(filename)[4:6] == (sha256, 1)
+        table = columnar_cache.read_csv(filename, sha256=sha256)
+        assert list(table['x']) == [7, 8]
+
+def test_seeded_sample():
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = [join(directory, 'cells_%s.csv' % i) for i in range(20)]
+        samples = [
+            FileVerificationCache(join(directory, '.pipeline.db'), policy='sampled', sample_fraction=0.25, seed=7).select_files_to_hash(filenames)
+            for _ in range(2)
+        ]
+        assert len(samples[0]) == 5
+        assert samples[0] == samples[1]
+
+
+if __name__=='__main__':
+    test_checksums_reused_until_file_changes()
+    test_changed_file_reparsed_under_skip()
+    test_seeded_sample()
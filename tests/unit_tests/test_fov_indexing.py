@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+import pandas as pd
+import numpy as np
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.fov_indexing import FOVIndexing
+
+def test_contiguous_fov_ranges():
+    table = pd.DataFrame({
+        'FOV' : pd.Categorical(['b', 'a', 'c', 'b', 'a', 'b']),
+        'value' : np.arange(6, dtype=float),
+    })
+    indexing = FOVIndexing(table, 'FOV')
+    assert indexing.get_fov_lookup() == {0 : 'a', 1 : 'b', 2 : 'c'}
+    assert indexing.get_ranges() == {0 : (0, 2), 1 : (2, 5), 2 : (5, 6)}
+    assert list(indexing.get_table()['FOV']) == [0, 0, 1, 1, 1, 2]
+    fov_tables = indexing.get_fov_tables()
+    assert list(fov_tables[1]['value']) == [0.0, 3.0, 5.0]
+    assert list(fov_tables[1].index) == [0, 1, 2]
+    assert np.shares_memory(
+        fov_tables[1]['value'].to_numpy(),
+        indexing.get_table()['value'].to_numpy(),
+    )
+
+
+if __name__=='__main__':
+    test_contiguous_fov_ranges()
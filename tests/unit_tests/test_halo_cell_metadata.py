@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
 from os.path import join, dirname
+import tempfile
+
+import pandas as pd
 
 import spatialprofilingtoolbox
 from spatialprofilingtoolbox.dataset_designs.multiplexed_imaging.halo_cell_metadata_provider import HALOCellMetadata
@@ -24,5 +27,62 @@ def test_halo_load_cell_metadata():
     m.write_subsampled(max_per_sample = 10, outcomes_file = outcomes_file)
     m.write_subsampled(max_per_sample = 20, outcomes_file = outcomes_file, omit_column='DAPI')
 
+def create_cell_metadata(directory, elementary_phenotypes_file=None, workers=1):
+    input_files_path = join(dirname(__file__), '..', 'data')
+    if elementary_phenotypes_file is None:
+        elementary_phenotypes_file = join(input_files_path, 'elementary_phenotypes.csv')
+    m = HALOCellMetadata(
+        input_files_path = input_files_path,
+        dataset_design = HALOCellMetadataDesign(
+            elementary_phenotypes_file=elementary_phenotypes_file,
+        ),
+        file_manifest_file = join(input_files_path, 'file_manifest.tsv'),
+        cache_location = join(directory, '.cell_metadata.store'),
+        shards_location = join(directory, '.cell_metadata.shards'),
+        workers = workers,
+    )
+    m.initialize()
+    return m
+
+def test_halo_get_metadata():
+    with tempfile.TemporaryDirectory() as directory:
+        m = create_cell_metadata(directory, workers=2)
+        cells = m.get_cells_table()
+        for sample_id in m.lookup.sample_ids:
+            for fov in m.lookup.fov_descriptors[sample_id]:
+                expected = cells[
+                    (cells['Sample ID index'] == m.get_sample_id_index(sample_id)) &
+                    (cells['Field of view index'] == m.get_fov_index(sample_id, fov))
+                ]
+                assert m.get_metadata(sample_id, fov).equals(expected)
+
+def test_halo_subsampled():
+    with tempfile.TemporaryDirectory() as directory:
+        m = create_cell_metadata(directory)
+        subsampled = m.get_subsampled(15, omit_column='DAPI', seed=1)
+        assert subsampled.equals(m.get_subsampled(15, omit_column='DAPI', seed=1))
+        assert subsampled.shape[0] == 15 * len(m.lookup.sample_ids)
+        assert not 'DAPI+' in subsampled.columns
+        assert not (subsampled[m.get_dichotomized_columns(subsampled)] == 0).all(axis=1).any()
+
+def test_halo_shards_keyed_by_design():
+    with tempfile.TemporaryDirectory() as directory:
+        m = create_cell_metadata(directory)
+        input_files_path = join(dirname(__file__), '..', 'data')
+        elementary_phenotypes = pd.read_csv(join(input_files_path, 'elementary_phenotypes.csv'))
+        removed = elementary_phenotypes['Name'].iloc[0] + '+'
+        assert removed in m.get_cells_table().columns
+        fewer_phenotypes_file = join(directory, 'elementary_phenotypes.csv')
+        elementary_phenotypes.iloc[1:].to_csv(fewer_phenotypes_file, index=False)
+        n = create_cell_metadata(directory, elementary_phenotypes_file=fewer_phenotypes_file)
+        assert m.get_design_key() != n.get_design_key()
+        assert n.store.get_source() == n.get_source_key()
+        assert not removed in n.get_cells_table().columns
+        assert len(os.listdir(join(directory, '.cell_metadata.shards'))) == 2 * len(m.lookup.sample_ids)
+
+
 if __name__=='__main__':
     test_halo_load_cell_metadata()
+    test_halo_get_metadata()
+    test_halo_subsampled()
+    test_halo_shards_keyed_by_design()
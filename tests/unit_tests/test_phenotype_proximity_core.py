@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+import os
+from os.path import join, dirname
+import tempfile
+
+import pandas as pd
+import numpy as np
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.dataset_designs.multiplexed_imaging.halo_cell_metadata_design import HALOCellMetadataDesign
+from spatialprofilingtoolbox.workflows.phenotype_proximity.computational_design import PhenotypeProximityDesign
+from spatialprofilingtoolbox.workflows.phenotype_proximity.core import PhenotypeProximityCalculator
+from spatialprofilingtoolbox.environment.settings_wrappers import JobsPaths, DatasetSettings
+
+def create_calculator(balanced=False, workers=1, input_filename=None, **kwargs):
+    input_files_path = join(dirname(__file__), '..', 'data')
+    dataset_design = HALOCellMetadataDesign(
+        elementary_phenotypes_file=join(input_files_path, 'elementary_phenotypes.csv'),
+    )
+    computational_design = PhenotypeProximityDesign(
+        dataset_design=dataset_design,
+        complex_phenotypes_file=join(input_files_path, 'complex_phenotypes.csv'),
+        balanced=balanced,
+        **kwargs,
+    )
+    sample_identifier = '2779f21192cb0ce1479b2bf7fb20ebba'
+    return PhenotypeProximityCalculator(
+        input_filename=input_filename if input_filename else join(input_files_path, sample_identifier + '.csv'),
+        sample_identifier=sample_identifier,
+        jobs_paths=JobsPaths('./', './jobs', './logs', './', './output'),
+        dataset_settings=DatasetSettings(
+            input_files_path,
+            join(input_files_path, 'file_manifest.tsv'),
+            join(input_files_path, 'diagnosis.tsv'),
+        ),
+        dataset_design=dataset_design,
+        computational_design=computational_design,
+        regional_areas_file=join(input_files_path, 'example_areas_file.csv'),
+        workers=workers,
+    )
+
+ENGINE_VARIANTS = [
+    {'neighbor_engine' : 'dense'},
+    {'neighbor_engine' : 'sparse'},
+    {'counting_engine' : 'pairwise'},
+    {'counting_engine' : 'matrix'},
+    {'workers' : 2},
+    {'tile_memory_budget' : 0.0002},
+]
+
+def calculate_counts(calculator):
+    return calculator.calculate_radius_limited_counts(calculator.create_cell_tables())
+
+def get_metric_values(counts, source, target, compartment='all'):
+    metric = PhenotypeProximityDesign.get_primary_output_feature_name()
+    selected = counts[
+        (counts['source phenotype'] == source) &
+        (counts['target phenotype'] == target) &
+        (counts['compartment'] == compartment)
+    ].sort_values('distance limit in pixels')
+    return list(selected[metric])
+
+def test_engines_parity():
+    for balanced in [False, True]:
+        reference = calculate_counts(create_calculator(balanced=balanced))
+        assert reference.shape[0] > 0
+        for variant in ENGINE_VARIANTS:
+            counts = calculate_counts(create_calculator(balanced=balanced, **variant))
+            assert reference.equals(counts), variant
+
+def write_synthetic_fov(calculator, filename):
+    """
+    Cells on a line, in one field of view, at x positions:
+
+    - CD3 at 0 and 200
+    - CD8 at 0, 5, 10, and 300
+
+    So the CD3 cell at 0 coincides with a CD8 cell (zero distance, never counted), is
+    at distance exactly 10 from another (counted from radius 17 on), and the CD3 cell
+    at 200 is at distance exactly 100 from the last CD8 cell (never counted).
+    """
+    template = pd.read_csv(calculator.input_filename, nrows=1)
+    design = calculator.dataset_design
+    cells = [('CD3', 0), ('CD3', 200), ('CD8', 0), ('CD8', 5), ('CD8', 10), ('CD8', 300)]
+    table = pd.concat([template] * len(cells), ignore_index=True)
+    table['Object Id'] = range(len(cells))
+    xmin, xmax, ymin, ymax = design.get_box_limit_column_names()
+    table[xmin] = [x - 1 for _, x in cells]
+    table[xmax] = [x + 1 for _, x in cells]
+    table[ymin] = -1
+    table[ymax] = 1
+    table[design.get_compartment_column()] = 'Tumor'
+    for phenotype in design.get_elementary_phenotype_names():
+        column = design.get_feature_name(phenotype)
+        table[column] = [1 if marker == phenotype else 0 for marker, _ in cells]
+    table.to_csv(filename, index=False)
+
+def test_engines_hand_computed_counts():
+    radii = PhenotypeProximityCalculator.get_radii_of_interest()
+    assert radii == [10, 17, 31, 56, 100]
+    expected = {
+        ('CD3+', 'CD8+') : [1/2, 1, 1, 1, 1],
+        ('CD8+', 'CD3+') : [1/4, 2/4, 2/4, 2/4, 2/4],
+        ('CD8+', 'CD8+') : [4/4, 6/4, 6/4, 6/4, 6/4],
+        ('CD3+', 'CD3+') : [0, 0, 0, 0, 0],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        filename = join(directory, 'synthetic.csv')
+        write_synthetic_fov(create_calculator(), filename)
+        for variant in ENGINE_VARIANTS:
+            counts = calculate_counts(create_calculator(input_filename=filename, **variant))
+            for (source, target), values in expected.items():
+                for compartment in ['Tumor', 'all']:
+                    assert get_metric_values(counts, source, target, compartment) == values, variant
+                assert get_metric_values(counts, source, target, 'Non-Tumor') == []
+
+def test_tiles_of_adjacent_coordinates():
+    x = np.nextafter(1.0, 2.0)
+    points = np.array([[1.0, 0.0], [x, 0.0]] * 10)
+    tiles = list(PhenotypeProximityCalculator.get_tiles(points, 5, 4))
+    cores = np.concatenate([core for core, _ in tiles])
+    assert sorted(cores) == list(range(points.shape[0]))
+
+def test_binned_adjacency():
+    distances = np.array([
+        [0, 5, 10],
+        [5, 0, 25],
+        [10, 25, 0],
+    ])
+    radii = [10, 20, 30]
+    binned = list(PhenotypeProximityCalculator.iterate_binned_adjacency(distances, radii))
+    assert len(binned) == 3
+    assert (binned[0].toarray() == (distances == 5)).all()
+    assert (binned[1].toarray() == (distances == 10)).all()
+    assert (binned[2].toarray() == (distances == 25)).all()
+
+def write_with_slide_offsets(calculator, filename, spacing):
+    table = pd.read_csv(calculator.input_filename)
+    design = calculator.dataset_design
+    fov_indices = table[design.get_FOV_column()].astype('category').cat.codes
+    for column in design.get_slide_offset_column_names():
+        table[column] = fov_indices * spacing
+    table.to_csv(filename, index=False)
+
+def test_whole_slide_refuses_fov_coordinates():
+    calculator = create_calculator(whole_slide=True)
+    try:
+        calculator.create_cell_tables()
+        assert False
+    except ValueError:
+        pass
+
+def test_whole_slide_counts_cross_fov_pairs():
+    calculator = create_calculator()
+    by_fov = calculate_counts(calculator)
+    metric = calculator.computational_design.get_primary_output_feature_name()
+    with tempfile.TemporaryDirectory() as directory:
+        for spacing in [0, 100000]:
+            filename = join(directory, 'offsets_%s.csv' % spacing)
+            write_with_slide_offsets(calculator, filename, spacing)
+            whole_slide_calculator = create_calculator(whole_slide=True, input_filename=filename)
+            cells = whole_slide_calculator.create_cell_tables()
+            assert list(cells.keys()) == ['whole slide']
+            whole_slide = whole_slide_calculator.calculate_radius_limited_counts(cells)
+            assert by_fov.shape == whole_slide.shape
+            assert by_fov['source phenotype count'].equals(whole_slide['source phenotype count'])
+            if spacing == 0:
+                assert all(whole_slide[metric] >= by_fov[metric])
+                assert whole_slide[metric].sum() > by_fov[metric].sum()
+            else:
+                assert whole_slide[metric].equals(by_fov[metric])
+
+
+if __name__=='__main__':
+    test_engines_parity()
+    test_engines_hand_computed_counts()
+    test_tiles_of_adjacent_coordinates()
+    test_binned_adjacency()
+    test_whole_slide_refuses_fov_coordinates()
+    test_whole_slide_counts_cross_fov_pairs()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import os
+from os.path import join, exists
+import stat
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import spatialprofilingtoolbox
+from spatialprofilingtoolbox.environment.database_context_utility import WaitingDatabaseContextManager
+from spatialprofilingtoolbox.environment.result_sink import ResultSink, ResultSinkClient, open_result_writer
+
+def start_sink(uri):
+    with WaitingDatabaseContextManager(uri) as manager:
+        manager.execute('CREATE TABLE counts ( id INTEGER PRIMARY KEY AUTOINCREMENT, sample TEXT, count INTEGER ) ;')
+        manager.execute('CREATE TABLE other ( id INTEGER PRIMARY KEY AUTOINCREMENT, sample TEXT ) ;')
+    sink = ResultSink(uri, {'counts' : ['sample', 'count']}, batch_rows=5, linger_seconds=0.05)
+    server = threading.Thread(target=sink.serve)
+    server.start()
+    while not ResultSink.is_serving(uri):
+        pass
+    return server
+
+def submission_fails(uri, table_name, header, batch):
+    client = ResultSinkClient.get_client(uri)
+    client.bulk_insert(table_name, header, batch)
+    try:
+        ResultSinkClient.wait_all()
+        return False
+    except ValueError:
+        return True
+
+def test_submissions_committed_by_sink():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, 'workflow.db')
+        assert isinstance(open_result_writer(uri), WaitingDatabaseContextManager)
+        server = start_sink(uri)
+        header = [('sample', 'TEXT'), ('count', 'INTEGER')]
+        for i in range(4):
+            with open_result_writer(uri) as writer:
+                assert isinstance(writer, ResultSinkClient)
+                assert writer.bulk_insert('counts', header, [['s%s' % i] * 3, [0, 1, 2]]) == 3
+        assert submission_fails(uri, 'missing_table', header, [['s'], [0]])
+
+        with WaitingDatabaseContextManager(uri) as manager:
+            assert manager.execute('SELECT COUNT(*) FROM counts ;')[0][0] == 12
+        assert ResultSink.stop(uri)
+        server.join()
+        assert not exists(ResultSink.get_address(uri))
+        assert not exists(ResultSink.get_directory(uri))
+        assert not ResultSink.stop(uri)
+
+def test_sink_accepts_only_known_tables_and_columns():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, 'workflow.db')
+        server = start_sink(uri)
+        assert submission_fails(uri, 'other', ['sample'], [['s']])
+        assert submission_fails(uri, 'counts', ['sample', 'id'], [['s'], [1]])
+        assert submission_fails(uri, 'counts', ['sample', 'sample'], [['s'], ['t']])
+        assert not submission_fails(uri, 'counts', ['sample'], [['s']])
+        with WaitingDatabaseContextManager(uri) as manager:
+            assert manager.execute('SELECT COUNT(*) FROM counts ;')[0][0] == 1
+            assert manager.execute('SELECT COUNT(*) FROM other ;')[0][0] == 0
+        assert ResultSink.stop(uri)
+        server.join()
+
+def test_sink_requires_key():
+    with tempfile.TemporaryDirectory() as directory:
+        uri = join(directory, 'workflow.db')
+        server = start_sink(uri)
+        assert stat.S_IMODE(os.stat(ResultSink.get_directory(uri)).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(ResultSink.get_address(uri)).st_mode) == 0o600
+        assert stat.S_IMODE(os.stat(ResultSink.get_key_file(uri)).st_mode) == 0o600
+        connection = Client(ResultSink.get_address(uri), family='AF_UNIX')
+        connection.send(('stop',))
+        connection.close()
+        try:
+            Client(ResultSink.get_address(uri), family='AF_UNIX', authkey=b'wrong key')
+            refused = False
+        except AuthenticationError:
+            refused = True
+        assert refused
+        silent = Client(ResultSink.get_address(uri), family='AF_UNIX')
+        assert not submission_fails(uri, 'counts', ['sample'], [['s']])
+        silent.close()
+        assert ResultSink.is_serving(uri)
+        assert ResultSink.stop(uri)
+        server.join()
+
+
+if __name__=='__main__':
+    test_submissions_committed_by_sink()
+    test_sink_accepts_only_known_tables_and_columns()
+    test_sink_requires_key()